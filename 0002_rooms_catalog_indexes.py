@@ -0,0 +1,24 @@
+"""Índices compuestos del catálogo de habitaciones (keyset + filtros)
+
+Revision ID: 0002_rooms_catalog_indexes
+Revises: 0001_init_spainroom
+Create Date: 2026-10-17 10:00:00
+"""
+from alembic import op
+
+revision = '0002_rooms_catalog_indexes'
+down_revision = '0001_init_spainroom'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_index('ix_rooms_pub_id', 'rooms', ['published', 'id'])
+    op.create_index('ix_rooms_pub_ciudad_id', 'rooms', ['published', 'ciudad', 'id'])
+    op.create_index('ix_rooms_pub_provincia_id', 'rooms', ['published', 'provincia', 'id'])
+    op.create_index('ix_rooms_pub_precio', 'rooms', ['published', 'precio'])
+
+def downgrade() -> None:
+    op.drop_index('ix_rooms_pub_precio', table_name='rooms')
+    op.drop_index('ix_rooms_pub_provincia_id', table_name='rooms')
+    op.drop_index('ix_rooms_pub_ciudad_id', table_name='rooms')
+    op.drop_index('ix_rooms_pub_id', table_name='rooms')
@@ -0,0 +1,34 @@
+"""Almacén de blobs direccionado por contenido (blob_store.py)
+
+Revision ID: 0003_blob_store
+Revises: 0002_rooms_catalog_indexes
+Create Date: 2026-10-17 12:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003_blob_store'
+down_revision = '0002_rooms_catalog_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('blobs',
+        sa.Column('sha256', sa.String(64), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('size_bytes', sa.BigInteger()),
+        sa.Column('mime', sa.String(80)),
+        sa.Column('refcount', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('files', sa.JSON()),
+    )
+    op.add_column('uploads', sa.Column('blob_sha256', sa.String(64)))
+    op.create_index('ix_uploads_blob_sha256', 'uploads', ['blob_sha256'])
+    op.add_column('franchise_uploads', sa.Column('blob_sha256', sa.String(64)))
+    op.create_index('ix_franchise_uploads_blob_sha256', 'franchise_uploads', ['blob_sha256'])
+
+def downgrade() -> None:
+    op.drop_index('ix_franchise_uploads_blob_sha256', table_name='franchise_uploads')
+    op.drop_column('franchise_uploads', 'blob_sha256')
+    op.drop_index('ix_uploads_blob_sha256', table_name='uploads')
+    op.drop_column('uploads', 'blob_sha256')
+    op.drop_table('blobs')
@@ -0,0 +1,130 @@
+"""Galería, zonas comunes y fichas de rooms.images_json a filas (room_images.py)
+
+Revision ID: 0004_room_images
+Revises: 0003_blob_store
+Create Date: 2026-10-17 18:00:00
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004_room_images'
+down_revision = '0003_blob_store'
+branch_labels = None
+depends_on = None
+
+rooms = sa.table('rooms', sa.column('id', sa.Integer), sa.column('images_json', sa.JSON))
+
+def _room_images():
+    return sa.table('room_images',
+        sa.column('id', sa.Integer), sa.column('room_id', sa.Integer), sa.column('created_at', sa.DateTime),
+        sa.column('scope', sa.String), sa.column('common_type', sa.String), sa.column('sort', sa.Integer),
+        sa.column('sha', sa.String), sa.column('url', sa.String), sa.column('thumb', sa.String),
+        sa.column('w', sa.Integer), sa.column('h', sa.Integer), sa.column('sub_ref', sa.String),
+        sa.column('extra', sa.JSON))
+
+# --- copia congelada de room_images.py (2026-10): la revisión no cambia si el módulo cambia ---
+KEYS = ('gallery', 'cover', 'common', 'sheets', 'sheet', 'forms')
+_COLS = ('sha', 'url', 'thumb', 'w', 'h', 'sub_ref')
+
+def _ts(entry):
+    try:
+        return datetime.fromisoformat(str(entry.get('ts')))
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+def _row(scope, entry, common_type='', sort=0):
+    return dict(
+        room_id=None, scope=scope, common_type=common_type or '', sort=sort, created_at=_ts(entry),
+        **{c: entry.get(c) for c in _COLS},
+        extra={k: v for k, v in entry.items() if k not in _COLS} or None,
+    )
+
+def _split(images):
+    """(filas sin room_id, images_json sin las listas)."""
+    rest = {k: v for k, v in images.items() if k not in KEYS}
+    rows = []
+
+    def _add(scope, entries, common_type=''):
+        for i, e in enumerate(e for e in entries or [] if isinstance(e, dict)):
+            rows.append(_row(scope, e, common_type, i))
+
+    _add('gallery', images.get('gallery'))
+    for ct, bucket in (images.get('common') or {}).items():
+        _add('common', bucket, ct)
+    _add('sheet', images.get('sheets'))
+    _add('form', images.get('forms'))
+    latest = images.get('sheet')
+    if isinstance(latest, dict) and latest.get('url') and \
+            not any(r['scope'] in ('sheet', 'form') and r['url'] == latest.get('url') for r in rows):
+        rows.append(_row('sheet', latest, sort=sum(1 for r in rows if r['scope'] == 'sheet')))
+    return rows, rest
+
+def _entry(r):
+    d = {c: getattr(r, c) for c in _COLS if getattr(r, c) is not None}
+    d.update(r.extra or {})
+    return d
+
+def _compose(base, rows):
+    """base[room_id] (images_json sin las listas) + las filas, con la forma de images_json."""
+    latest = {}
+    for r in rows:
+        d, e = base.setdefault(r.room_id, {}), _entry(r)
+        if r.scope == 'gallery':
+            d.setdefault('gallery', []).append(e)
+        elif r.scope == 'common':
+            d.setdefault('common', {}).setdefault(r.common_type, []).append(e)
+        else:
+            d.setdefault('sheets' if r.scope == 'sheet' else 'forms', []).append(e)
+            if r.room_id not in latest or (r.created_at, r.id) >= latest[r.room_id][0]:
+                latest[r.room_id] = ((r.created_at, r.id), e)
+    for rid, d in base.items():
+        if d.get('gallery'):
+            d['cover'] = d['gallery'][0]
+        if rid in latest:
+            d['sheet'] = latest[rid][1]
+    return base
+
+def upgrade() -> None:
+    op.create_table('room_images',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('room_id', sa.Integer(), sa.ForeignKey('rooms.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('scope', sa.String(16), nullable=False),
+        sa.Column('common_type', sa.String(24), nullable=False, server_default=''),
+        sa.Column('sort', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('sha', sa.String(64)),
+        sa.Column('url', sa.String(300)),
+        sa.Column('thumb', sa.String(300)),
+        sa.Column('w', sa.Integer()),
+        sa.Column('h', sa.Integer()),
+        sa.Column('sub_ref', sa.String(40)),
+        sa.Column('extra', sa.JSON()),
+    )
+    op.create_index('ix_room_images_room_scope_sort', 'room_images', ['room_id', 'scope', 'common_type', 'sort'])
+
+    # backfill: las listas de images_json pasan a filas y se quitan de la columna (queda meta)
+    conn, t = op.get_bind(), _room_images()
+    for rid, images in conn.execute(sa.select(rooms.c.id, rooms.c.images_json)).fetchall():
+        if not isinstance(images, dict) or not any(k in images for k in KEYS):
+            continue
+        rows, rest = _split(images)
+        for r in rows:
+            r['room_id'] = rid
+        if rows:
+            conn.execute(t.insert(), rows)
+        conn.execute(rooms.update().where(rooms.c.id == rid).values(images_json=rest or None))
+
+def downgrade() -> None:
+    # de vuelta a images_json con la misma forma que componen los lectores
+    conn, t = op.get_bind(), _room_images()
+    base = {rid: dict(images or {}) for rid, images in
+            conn.execute(sa.select(rooms.c.id, rooms.c.images_json)).fetchall()}
+    q = sa.select(t).order_by(t.c.room_id, t.c.scope, t.c.common_type, t.c.sort, t.c.id)
+    touched = {r.room_id for r in conn.execute(sa.select(t.c.room_id).distinct())}
+    _compose(base, conn.execute(q))
+    for rid in touched:
+        conn.execute(rooms.update().where(rooms.c.id == rid).values(images_json=base.get(rid)))
+    op.drop_index('ix_room_images_room_scope_sort', table_name='room_images')
+    op.drop_table('room_images')
@@ -0,0 +1,92 @@
+"""Proyección room_cards (tarjetas de listado), creada y llenada desde rooms (room_cards.py)
+
+Revision ID: 0005_room_cards
+Revises: 0004_room_images
+Create Date: 2026-10-17 19:00:00
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005_room_cards'
+down_revision = '0004_room_images'
+branch_labels = None
+depends_on = None
+
+_CARD = ('code', 'direccion', 'ciudad', 'provincia', 'm2', 'precio', 'estado', 'published')
+rooms = sa.table('rooms', sa.column('id', sa.Integer), *[sa.column(c) for c in _CARD])
+images = sa.table('room_images',
+    sa.column('id', sa.Integer), sa.column('room_id', sa.Integer), sa.column('scope', sa.String),
+    sa.column('sort', sa.Integer), sa.column('url', sa.String), sa.column('thumb', sa.String),
+    sa.column('w', sa.Integer), sa.column('h', sa.Integer))
+cards = sa.table('room_cards', sa.column('room_id', sa.Integer), sa.column('updated_at', sa.DateTime),
+    *[sa.column(c) for c in _CARD],
+    sa.column('cover_url', sa.String), sa.column('cover_thumb', sa.String),
+    sa.column('cover_w', sa.Integer), sa.column('cover_h', sa.Integer), sa.column('photo_count', sa.Integer))
+
+def _covers(conn, ids):
+    """{room_id: (primera foto de la galería, nº de fotos)}; en empate de sort gana el id menor."""
+    sub = (sa.select(images.c.room_id, sa.func.min(images.c.sort).label('first'),
+                     sa.func.count(images.c.id).label('n'))
+           .where(images.c.room_id.in_(ids), images.c.scope == 'gallery')
+           .group_by(images.c.room_id).subquery())
+    q = (sa.select(images.c.room_id, images.c.url, images.c.thumb, images.c.w, images.c.h, sub.c.n)
+         .join(sub, (images.c.room_id == sub.c.room_id) & (images.c.sort == sub.c.first))
+         .where(images.c.scope == 'gallery')
+         .order_by(images.c.id.desc()))
+    return {r.room_id: r for r in conn.execute(q)}
+
+def _fill(conn, batch=1000):
+    """Una tarjeta por habitación (copia congelada de room_cards.fill, 2026-10)."""
+    now, last_id = datetime.utcnow(), 0
+    while True:
+        rows = conn.execute(sa.select(rooms).where(rooms.c.id > last_id)
+                            .order_by(rooms.c.id).limit(batch)).fetchall()
+        if not rows:
+            break
+        covers = _covers(conn, [r.id for r in rows])
+        values = []
+        for r in rows:
+            c = covers.get(r.id)
+            url = c.url if c is not None else None
+            values.append(dict(
+                room_id=r.id, updated_at=now, **{k: getattr(r, k) for k in _CARD if k != 'published'},
+                published=bool(r.published),
+                cover_url=url, cover_thumb=(c.thumb or url) if url else None,
+                cover_w=c.w if url else None, cover_h=c.h if url else None,
+                photo_count=int(c.n) if c is not None else 0,
+            ))
+        conn.execute(cards.insert(), values)
+        last_id = rows[-1].id
+
+def upgrade() -> None:
+    op.create_table('room_cards',
+        sa.Column('room_id', sa.Integer(), sa.ForeignKey('rooms.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('code', sa.String(32)),
+        sa.Column('direccion', sa.String(240)),
+        sa.Column('ciudad', sa.String(120)),
+        sa.Column('provincia', sa.String(120)),
+        sa.Column('m2', sa.Integer()),
+        sa.Column('precio', sa.Integer()),
+        sa.Column('estado', sa.String(32)),
+        sa.Column('published', sa.Boolean(), nullable=False, server_default=sa.text('FALSE')),
+        sa.Column('cover_url', sa.String(300)),
+        sa.Column('cover_thumb', sa.String(300)),
+        sa.Column('cover_w', sa.Integer()),
+        sa.Column('cover_h', sa.Integer()),
+        sa.Column('photo_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_room_cards_pub_id', 'room_cards', ['published', 'room_id'])
+    op.create_index('ix_room_cards_pub_ciudad_id', 'room_cards', ['published', 'ciudad', 'room_id'])
+    op.create_index('ix_room_cards_pub_provincia_id', 'room_cards', ['published', 'provincia', 'room_id'])
+
+    # una tarjeta por habitación (portada y nº de fotos de room_images, 0004)
+    _fill(op.get_bind())
+
+def downgrade() -> None:
+    op.drop_index('ix_room_cards_pub_provincia_id', table_name='room_cards')
+    op.drop_index('ix_room_cards_pub_ciudad_id', table_name='room_cards')
+    op.drop_index('ix_room_cards_pub_id', table_name='room_cards')
+    op.drop_table('room_cards')
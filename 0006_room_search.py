@@ -0,0 +1,106 @@
+"""Índice de búsqueda de rooms: FTS5 (SQLite) o tsvector + GIN (Postgres), llenado desde rooms (room_search.py)
+
+Revision ID: 0006_room_search
+Revises: 0005_room_cards
+Create Date: 2026-10-17 19:30:00
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006_room_search'
+down_revision = '0005_room_cards'
+branch_labels = None
+depends_on = None
+
+# --- copia congelada de room_search.py (2026-10): DDL y normalización con los que se llena ---
+# Si la app cambia la normalización, el índice se regenera con `python room_search.py --rebuild`.
+STOPWORDS = frozenset("""
+a al con de del el en la las lo los para por que se su sus un una unos unas y o e u muy mas
+""".split())
+
+_SUFFIXES = sorted("""
+amientos imientos amiento imiento aciones iciones uciones acion icion ucion
+idades idad mente ables ibles able ible istas ista ismos ismo osos osas oso osa
+ivos ivas ivo iva ados adas ado ada idos idas ido ida antes ante encias encia ores or
+""".split(), key=len, reverse=True)
+
+_RE_TOKEN = re.compile(r'[a-z0-9]+')
+
+_DDL_SQLITE = ["CREATE VIRTUAL TABLE IF NOT EXISTS room_fts USING fts5("
+               "title, place, body, tokenize='unicode61 remove_diacritics 2')",
+               "CREATE VIRTUAL TABLE IF NOT EXISTS room_fts_vocab USING fts5vocab(room_fts, 'row')"]
+_DDL_PG = [
+    "CREATE TABLE IF NOT EXISTS room_search ("
+    " room_id INTEGER PRIMARY KEY REFERENCES rooms(id) ON DELETE CASCADE,"
+    " title TEXT NOT NULL DEFAULT '', place TEXT NOT NULL DEFAULT '', body TEXT NOT NULL DEFAULT '',"
+    " tsv tsvector GENERATED ALWAYS AS ("
+    "  setweight(to_tsvector('simple', title), 'A') ||"
+    "  setweight(to_tsvector('simple', place), 'B') ||"
+    "  setweight(to_tsvector('simple', body), 'C')) STORED)",
+    "CREATE INDEX IF NOT EXISTS ix_room_search_tsv ON room_search USING GIN (tsv)",
+]
+
+rooms = sa.table('rooms', sa.column('id', sa.Integer), sa.column('code', sa.String),
+                 sa.column('ciudad', sa.String), sa.column('direccion', sa.String),
+                 sa.column('provincia', sa.String), sa.column('notas', sa.Text),
+                 sa.column('images_json', sa.JSON))
+
+def _fold(s):
+    s = s or ''
+    if s.isascii():
+        return s.lower()
+    s = unicodedata.normalize('NFKD', s)
+    return ''.join(ch for ch in s if not unicodedata.combining(ch)).lower()
+
+def _stem(w):
+    if w.isdigit() or len(w) <= 3:
+        return w
+    for suf in _SUFFIXES:
+        if w.endswith(suf) and len(w) - len(suf) >= 3:
+            return w[: -len(suf)]
+    if w.endswith('s') and len(w) > 4:
+        w = w[:-1]
+    if w[-1] in 'aeo' and len(w) > 4:
+        w = w[:-1]
+    return w
+
+def _doc(*parts):
+    text = _fold(' '.join(str(p) for p in parts if p))
+    return ' '.join(_stem(t) for t in _RE_TOKEN.findall(text) if t not in STOPWORDS)
+
+def _documents(r):
+    meta = (r.images_json or {}).get('meta') or {}
+    return dict(
+        id=r.id,
+        title=_doc(r.code, r.ciudad, meta.get('barrio')),
+        place=_doc(r.direccion, r.provincia, meta.get('metro')),
+        body=_doc(r.notas, meta.get('descripcion'), meta.get('normas'),
+                  meta.get('orientacion'), meta.get('otros')),
+    )
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    pg = conn.dialect.name == 'postgresql'
+    for stmt in (_DDL_PG if pg else _DDL_SQLITE):
+        conn.execute(sa.text(stmt))
+    insert = sa.text('INSERT INTO room_search (room_id, title, place, body) VALUES (:id, :title, :place, :body)'
+                     if pg else
+                     'INSERT INTO room_fts (rowid, title, place, body) VALUES (:id, :title, :place, :body)')
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.select(rooms).where(rooms.c.id > last_id)
+                            .order_by(rooms.c.id).limit(1000)).fetchall()
+        if not rows:
+            break
+        conn.execute(insert, [_documents(r) for r in rows])
+        last_id = rows[-1].id
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP TABLE IF EXISTS room_search')
+    else:
+        op.execute('DROP TABLE IF EXISTS room_fts_vocab')
+        op.execute('DROP TABLE IF EXISTS room_fts')
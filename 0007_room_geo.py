@@ -0,0 +1,112 @@
+"""Coordenadas + geohash de rooms (room_geo), creada y llenada desde rooms (room_geo.py)
+
+Revision ID: 0007_room_geo
+Revises: 0006_room_search
+Create Date: 2026-10-17 20:00:00
+"""
+import csv
+import os
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007_room_geo'
+down_revision = '0006_room_search'
+branch_labels = None
+depends_on = None
+
+# --- copia congelada de room_geo.py (2026-10): geohash y fuentes de coordenadas ---
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9
+
+rooms = sa.table('rooms', sa.column('id', sa.Integer), sa.column('ciudad', sa.String),
+                 sa.column('provincia', sa.String), sa.column('images_json', sa.JSON))
+geo = sa.table('room_geo', sa.column('room_id', sa.Integer), sa.column('lat', sa.Float),
+               sa.column('lon', sa.Float), sa.column('geohash', sa.String), sa.column('source', sa.String))
+
+def _encode(lat, lon, precision=PRECISION):
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch, lon_lo = (ch << 1) | 1, mid
+            else:
+                ch, lon_hi = ch << 1, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch, lat_lo = (ch << 1) | 1, mid
+            else:
+                ch, lat_hi = ch << 1, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return ''.join(out)
+
+def _fold(s):
+    s = unicodedata.normalize('NFKD', str(s or ''))
+    return ''.join(ch for ch in s if not unicodedata.combining(ch)).lower().strip()
+
+def _centroids():
+    """{(provincia, municipio): (lat, lon)} de GEO_CENTROIDS_CSV (por defecto municipios_coords.csv)."""
+    path = (os.getenv('GEO_CENTROIDS_CSV') or '').strip() or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'municipios_coords.csv')
+    out = {}
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as fh:
+            for r in csv.DictReader(fh):
+                try:
+                    out[(_fold(r.get('provincia')), _fold(r.get('municipio')))] = (float(r['lat']), float(r['lon']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+    except OSError:
+        pass
+    return out
+
+def _valid(lat, lon):
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    return (lat, lon) if -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0 else None
+
+def _values(r, centroids):
+    meta = (r.images_json or {}).get('meta') or {}
+    ll, source = _valid(meta.get('lat'), meta.get('lon')), 'sheet'
+    if not ll:
+        ll, source = centroids.get((_fold(r.provincia), _fold(r.ciudad))), 'centroid'
+    if not ll:
+        return dict(room_id=r.id, lat=None, lon=None, geohash=None, source='none')
+    return dict(room_id=r.id, lat=ll[0], lon=ll[1], geohash=_encode(*ll), source=source)
+
+def _fill(conn, batch=1000):
+    centroids, last_id = _centroids(), 0
+    while True:
+        rows = conn.execute(sa.select(rooms).where(rooms.c.id > last_id)
+                            .order_by(rooms.c.id).limit(batch)).fetchall()
+        if not rows:
+            break
+        conn.execute(geo.insert(), [_values(r, centroids) for r in rows])
+        last_id = rows[-1].id
+
+def upgrade() -> None:
+    op.create_table('room_geo',
+        sa.Column('room_id', sa.Integer(), sa.ForeignKey('rooms.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('lat', sa.Float()),
+        sa.Column('lon', sa.Float()),
+        sa.Column('geohash', sa.String(12)),
+        sa.Column('source', sa.String(16)),
+    )
+    op.create_index('ix_room_geo_geohash', 'room_geo', ['geohash'])
+
+    # coordenadas de la ficha o centroide del municipio (GEO_CENTROIDS_CSV), como los hooks de Room
+    _fill(op.get_bind())
+
+def downgrade() -> None:
+    op.drop_index('ix_room_geo_geohash', table_name='room_geo')
+    op.drop_table('room_geo')
@@ -0,0 +1,37 @@
+"""Cola de procesado de fotos en segundo plano (photo_jobs.py)
+
+Revision ID: 0008_photo_jobs
+Revises: 0007_room_geo
+Create Date: 2026-10-17 20:30:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008_photo_jobs'
+down_revision = '0007_room_geo'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('photo_jobs',
+        sa.Column('id', sa.String(40), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(16), nullable=False, server_default='queued'),
+        sa.Column('mode', sa.String(16), nullable=False),
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('options', sa.JSON()),
+        sa.Column('files', sa.JSON()),
+        sa.Column('results', sa.JSON()),
+        sa.Column('error', sa.Text()),
+    )
+    op.create_index('ix_photo_jobs_updated_at', 'photo_jobs', ['updated_at'])
+    op.create_index('ix_photo_jobs_status', 'photo_jobs', ['status'])
+    op.create_index('ix_photo_jobs_room_id', 'photo_jobs', ['room_id'])
+
+def downgrade() -> None:
+    op.drop_index('ix_photo_jobs_room_id', table_name='photo_jobs')
+    op.drop_index('ix_photo_jobs_status', table_name='photo_jobs')
+    op.drop_index('ix_photo_jobs_updated_at', table_name='photo_jobs')
+    op.drop_table('photo_jobs')
@@ -0,0 +1,21 @@
+"""Índices de rango del catálogo sobre room_cards (precio_min/max, m2_min/max)
+
+Revision ID: 0009_room_cards_range_indexes
+Revises: 0008_photo_jobs
+Create Date: 2026-10-17 21:00:00
+"""
+from alembic import op
+
+revision = '0009_room_cards_range_indexes'
+down_revision = '0008_photo_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # el catálogo por defecto lee room_cards: ix_rooms_pub_precio (0002) solo sirve con fields=images/notas
+    op.create_index('ix_room_cards_pub_precio', 'room_cards', ['published', 'precio'])
+    op.create_index('ix_room_cards_pub_m2', 'room_cards', ['published', 'm2'])
+
+def downgrade() -> None:
+    op.drop_index('ix_room_cards_pub_m2', table_name='room_cards')
+    op.drop_index('ix_room_cards_pub_precio', table_name='room_cards')
@@ -1,9 +1,19 @@
 # app.py — SpainRoom backend-API (GO LIVE, limpio)
-import os, sys, types, logging, requests
+import os, sys, types, logging
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from flask import Flask, jsonify, request, current_app, Response
+from flask import Flask, jsonify
 from flask_cors import CORS
+from blueprint_registry import BlueprintRegistry, APP_BLUEPRINTS
+from db_engine import normalize_url, engine_options
+import services_http
+from metrics import init_metrics
+from sql_accounting import init_sql_accounting
+from response_cache import init_response_cache
+from room_search import init_search
+from room_geo import init_geo
+from payments_proxy import bp_pay_proxy, breaker as pay_breaker
+from upload_ingest import init_upload_ingest
 
 # ---------- DB bootstrap ----------
 try:
@@ -16,19 +26,7 @@ except Exception:
 BASE_DIR = Path(__file__).resolve().parent
 DEFAULT_DB = f"sqlite:///{(BASE_DIR / 'spainroom.db').as_posix()}"
 
-SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", DEFAULT_DB)
-_raw_db = os.environ.get("DATABASE_URL")
-if _raw_db:
-    if _raw_db.startswith("postgres://"):
-        _raw_db = _raw_db.replace("postgres://", "postgresql+psycopg2://", 1)
-    elif _raw_db.startswith("postgresql://"):
-        _raw_db = _raw_db.replace("postgresql://", "postgresql+psycopg2://", 1)
-    if "sslmode=" not in _raw_db and "+psycopg2://" in _raw_db:
-        _raw_db += ("&" if "?" in _raw_db else "?") + "sslmode=require"
-    SQLALCHEMY_DATABASE_URI = _raw_db
-
-ENGINE_OPTIONS = {"pool_pre_ping": True, "pool_recycle": 300}
-PAY_PROXY_BASE = os.getenv("PAY_PROXY_BASE", "https://spainroom-backend-1.onrender.com").rstrip("/")
+SQLALCHEMY_DATABASE_URI = normalize_url(os.environ.get("DATABASE_URL"), DEFAULT_DB, require_ssl=True)
 
 def create_app(test_config=None):
     app = Flask(__name__, static_folder="public", static_url_path="/")
@@ -38,93 +36,28 @@ def create_app(test_config=None):
     app.config.update(
         SQLALCHEMY_DATABASE_URI=SQLALCHEMY_DATABASE_URI,
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
-        SQLALCHEMY_ENGINE_OPTIONS=ENGINE_OPTIONS,
         MAX_CONTENT_LENGTH=20 * 1024 * 1024,
     )
     if test_config:
         app.config.update(test_config)
+    # pool/timeouts (Postgres) o perfil WAL (SQLite) según la URL final
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config["SQLALCHEMY_DATABASE_URI"]))
 
+    init_metrics(app)     # primero: mide también lo que hagan los demás hooks
+    init_upload_ingest(app)    # multipart a disco; subidas copiadas por bloques (memoria acotada)
     db.init_app(app)
+    init_sql_accounting(app)
+    init_response_cache(app)   # ETag + invalidación por eventos de Room/ContractItem/FranchiseSlot
+    init_search(app)           # índice FTS de rooms al día en cada escritura
+    init_geo(app)              # room_geo (lat/lon + geohash) al día en cada escritura
     CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
     _init_logging(app)
 
-    def _try(name, fn):
-        try:
-            return fn()
-        except Exception as e:
-            app.logger.info(f"{name} no disponible: {e}")
-            return None
-
-    # ---------- Blueprints ----------
-    bp_rooms            = _try("rooms",            lambda: __import__("routes_rooms", fromlist=["bp_rooms"]).bp_rooms)
-    bp_owner            = _try("owner",            lambda: __import__("routes_owner_cedula", fromlist=["bp_owner"]).bp_owner)
-    bp_contact          = _try("contact",          lambda: __import__("routes_contact", fromlist=["bp_contact"]).bp_contact)
-    bp_upload_generic   = _try("upload_generic",   lambda: __import__("routes_upload_generic", fromlist=["bp_upload_generic"]).bp_upload_generic)
-    bp_upload_rooms     = _try("upload_rooms",     lambda: __import__("routes_uploads_rooms", fromlist=["bp_upload_rooms"]).bp_upload_rooms)
-    bp_upload_autofit   = _try("upload_rooms_auto",lambda: __import__("routes_uploads_rooms_autofit", fromlist=["bp_upload_rooms_autofit"]).bp_upload_rooms_autofit)
-    bp_auth             = _try("auth",             lambda: __import__("routes_auth", fromlist=["bp_auth"]).bp_auth)
-    bp_kyc              = _try("kyc",              lambda: __import__("routes_kyc", fromlist=["bp_kyc"]).bp_kyc)
-    bp_veriff           = _try("veriff",           lambda: __import__("routes_veriff", fromlist=["bp_veriff"]).bp_veriff)
-    bp_twilio           = _try("twilio",           lambda: __import__("routes_twilio", fromlist=["bp_twilio"]).bp_twilio)
-    bp_sms              = _try("sms",              lambda: __import__("routes_sms", fromlist=["bp_sms"]).bp_sms)
-    bp_admin_franq      = _try("admin_franq",      lambda: __import__("routes_admin_franchise", fromlist=["bp_admin_franq"]).bp_admin_franq)
-    bp_leads            = _try("leads",            lambda: __import__("routes_leads", fromlist=["bp_leads"]).bp_leads)
-    bp_franchise        = _try("franchise",        lambda: __import__("routes_franchise", fromlist=["bp_franchise"]).bp_franchise)
-    bp_wa               = _try("wa",               lambda: __import__("routes_wa", fromlist=["bp_wa"]).bp_wa)
-    bp_wa_webhook       = _try("wa_webhook",       lambda: __import__("routes_wa", fromlist=["bp_wa_webhook"]).bp_wa_webhook)
-    bp_push             = _try("push",             lambda: __import__("routes_push", fromlist=["bp_push"]).bp_push)
-
-    # ---------- Registro ----------
-    if bp_rooms:           app.register_blueprint(bp_rooms)
-    if bp_owner:           app.register_blueprint(bp_owner,      url_prefix="/api/owner")
-    if bp_contact:         app.register_blueprint(bp_contact)
-    if bp_upload_generic:  app.register_blueprint(bp_upload_generic)
-    if bp_upload_rooms:    app.register_blueprint(bp_upload_rooms)
-    if bp_upload_autofit:  app.register_blueprint(bp_upload_autofit)
-    if bp_auth:            app.register_blueprint(bp_auth)
-    if bp_kyc:             app.register_blueprint(bp_kyc)
-    if bp_veriff:          app.register_blueprint(bp_veriff)
-    if bp_twilio:          app.register_blueprint(bp_twilio)
-    if bp_sms:             app.register_blueprint(bp_sms,        url_prefix="/sms")
-    if bp_admin_franq:     app.register_blueprint(bp_admin_franq)
-    if bp_leads:           app.register_blueprint(bp_leads)
-    if bp_franchise:       app.register_blueprint(bp_franchise)
-    if bp_wa:              app.register_blueprint(bp_wa)                 # /api/wa/*
-    if bp_wa_webhook:      app.register_blueprint(bp_wa_webhook)         # /webhooks/wa
-    if bp_push:            app.register_blueprint(bp_push)               # /api/push/*
+    # ---------- Blueprints (todos registrados aquí; los módulos importan lo pesado al usarlo) ----------
+    BlueprintRegistry(app, APP_BLUEPRINTS).install()
 
-    # ---------- Proxy pagos a backend-1 ----------
-    @app.route("/create-checkout-session", methods=["POST","OPTIONS"])
-    def proxy_checkout_root():
-        if request.method == "OPTIONS": return ("", 204)
-        try:
-            r = requests.post(
-                f"{PAY_PROXY_BASE}/create-checkout-session",
-                json=(request.get_json(silent=True) or {}),
-                headers={"Content-Type":"application/json"},
-                timeout=12
-            )
-            return Response(response=r.content, status=r.status_code,
-                            headers={"Content-Type": r.headers.get("Content-Type","application/json")})
-        except Exception as e:
-            current_app.logger.warning(f"proxy payments error: {e}")
-            return jsonify(ok=False, error="proxy_error"), 502
-
-    @app.route("/api/payments/create-checkout-session", methods=["POST","OPTIONS"])
-    def proxy_checkout_api():
-        if request.method == "OPTIONS": return ("", 204)
-        try:
-            r = requests.post(
-                f"{PAY_PROXY_BASE}/create-checkout-session",
-                json=(request.get_json(silent=True) or {}),
-                headers={"Content-Type":"application/json"},
-                timeout=12
-            )
-            return Response(response=r.content, status=r.status_code,
-                            headers={"Content-Type": r.headers.get("Content-Type","application/json")})
-        except Exception as e:
-            current_app.logger.warning(f"proxy payments error: {e}")
-            return jsonify(ok=False, error="proxy_error"), 502
+    # ---------- Proxy pagos a backend-1 (streaming + circuit breaker) ----------
+    app.register_blueprint(bp_pay_proxy)
 
     # ---------- Health ----------
     @app.get("/health")
@@ -132,6 +65,12 @@ def create_app(test_config=None):
     def health():
         return jsonify(ok=True, service="spainroom-backend")
 
+    @app.get("/health/deps")
+    def health_deps():
+        # latencia/errores por proveedor externo (services_http), por worker
+        return jsonify(ok=True, providers=services_http.stats(),
+                       breakers={"payments": pay_breaker.snapshot()})
+
     return app
 
 def _init_logging(app):
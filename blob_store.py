@@ -0,0 +1,336 @@
+# blob_store.py — Almacén de subidas direccionado por contenido, con contador de referencias
+#
+# Cada fichero subido se identifica por el sha256 de sus bytes ORIGINALES (antes de procesar):
+#
+#   instance/uploads/blobs/<sha[:2]>/<sha>/original.pdf          documentos públicos (fichas de habitación)
+#   instance/uploads/private/<sha[:2]>/<sha>/original.pdf        documentos privados (DNI, candidaturas):
+#                                                                 fuera de lo que sirve routes_instance_files
+#   instance/uploads/blobs/<sha[:2]>/<sha>/<perfil>/full.jpg     variantes de foto por perfil
+#
+#   instance/uploads/blobs/<sha[:2]>/<sha>/original.jpg          fotos: el original y, por perfil,
+#                                                                 sus medidas (las variantes se sirven
+#                                                                 bajo demanda, image_variants.py)
+#
+# - Volver a subir la misma foto (otra línea de contrato, otro mes, el mismo lote dos veces)
+#   no decodifica nada: prepare_photos() encuentra el perfil ya hecho y lo reutiliza.
+# - Un documento repetido no se vuelve a escribir. put_stream() lo copia por bloques a
+#   uploads/.incoming hasheando a la vez (upload_ingest.py) y lo renombra a su blob. Con
+#   private=True va a uploads/private (en blobs.files, con la clave "private/original.<ext>"):
+#   el sha es el hash del contenido y se devuelve a los clientes, no sirve de secreto.
+# - Tabla blobs: tamaño, mime, ficheros guardados y refcount = nº de filas de uploads /
+#   franchise_uploads que apuntan al blob (columna blob_sha256). link() suma en la misma
+#   transacción que crea la fila; release() resta y, a 0, borra el blob tras el commit.
+# - El perfil identifica la receta (tamaños, recorte, calidad): si cambia, se sube la versión
+#   del perfil y las fotos nuevas generan sus variantes aunque el original ya exista.
+#
+# Esquema: alembic 0003_blob_store (tabla blobs y blob_sha256); aquí no se hace DDL.
+# Mantenimiento: python blob_store.py --gc   (recalcula refcounts y borra blobs sin uso)
+
+import os, io, sys, hashlib, logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+from flask import current_app
+
+from db_engine import no_statement_timeout
+from extensions import db
+from models_uploads import Blob
+from upload_ingest import copy_hashed
+
+log = logging.getLogger("blob_store")
+
+ROOT = "uploads/blobs"
+PRIVATE_ROOT = "uploads/private"   # documentos de identidad/candidaturas: no se sirven
+PRIVATE = "private/"               # prefijo de sus claves en blobs.files
+INCOMING = "uploads/.incoming"   # temporales de put_stream (mismo disco que ROOT: rename atómico)
+# tablas con columna blob_sha256 (cuentan como referencia)
+REF_TABLES = ("uploads", "franchise_uploads")
+GC_GRACE_S = 24 * 3600
+
+_hooks_installed = False
+
+def digest(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+def rel_dir(sha: str) -> str:
+    return f"{ROOT}/{sha[:2]}/{sha}"
+
+def rel_path(sha: str, name: str) -> str:
+    """Ruta bajo instance/ de un fichero del blob (clave de blobs.files)."""
+    if name.startswith(PRIVATE):
+        return f"{PRIVATE_ROOT}/{sha[:2]}/{sha}/{name[len(PRIVATE):]}"
+    return f"{rel_dir(sha)}/{name}"
+
+def abs_path(rel: str) -> str:
+    return os.path.join(current_app.instance_path, *rel.split("/"))
+
+def url(rel: str) -> str:
+    return f"/instance/{rel}"
+
+# ---------- escritura ----------
+def _write(rel: str, data: bytes):
+    p = abs_path(rel)
+    os.makedirs(os.path.dirname(p), exist_ok=True)
+    tmp = f"{p}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, p)   # atómico: otro worker con el mismo contenido escribe lo mismo
+
+def _row(sha: str, size: Optional[int] = None, mime: Optional[str] = None) -> Blob:
+    """Fila del blob (creada si no existe) bloqueada hasta el commit de quien llama."""
+    b = db.session.query(Blob).filter(Blob.sha256 == sha).with_for_update().populate_existing().first()
+    if b is None:
+        try:
+            with db.session.begin_nested():
+                b = Blob(sha256=sha, size_bytes=size, mime=mime, refcount=0, files={})
+                db.session.add(b)
+        except IntegrityError:   # otro worker la creó a la vez
+            b = db.session.query(Blob).filter(Blob.sha256 == sha).with_for_update().populate_existing().one()
+    return b
+
+def _add_files(b: Blob, files: Dict[str, dict]):
+    merged = dict(b.files or {})
+    merged.update(files)
+    b.files = merged
+    flag_modified(b, "files")
+
+def put_stream(src, ext: str = ".bin", mime: Optional[str] = None, private: bool = False) -> Optional[dict]:
+    """
+    Guarda un documento leyendo `src` por bloques (memoria acotada; si ya está, no se reescribe).
+    private: bajo uploads/private (no se sirve por /instance ni /img).
+    Devuelve {blob, rel, url, size, sha}, o None si está vacío.
+    """
+    tmp, sha, size = copy_hashed(src, abs_path(INCOMING))
+    if tmp is None:
+        return None
+    name = (PRIVATE if private else "") + "original" + (ext or ".bin").lower()
+    rel = rel_path(sha, name)
+    try:
+        b = _row(sha, size, mime)
+        if name not in (b.files or {}) or not os.path.exists(abs_path(rel)):
+            os.makedirs(os.path.dirname(abs_path(rel)), exist_ok=True)
+            os.replace(tmp, abs_path(rel))
+            _add_files(b, {name: {"size": size}})
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return {"blob": sha, "rel": rel, "url": url(rel), "size": size, "sha": sha[:16]}
+
+def put(raw: bytes, ext: str = ".bin", mime: Optional[str] = None, private: bool = False) -> Optional[dict]:
+    """put_stream() para contenido que ya está en memoria (JSON generados, etc.)."""
+    return put_stream(io.BytesIO(raw), ext, mime, private)
+
+# ---------- fotos ----------
+def _sniff_ext(raw: bytes) -> str:
+    if raw[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if raw[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if raw[:4] == b"RIFF" and raw[8:12] == b"WEBP":
+        return ".webp"
+    return ".bin"
+
+def _entry(sha: str, profile: str, files: Dict[str, dict]) -> Optional[dict]:
+    """
+    Entrada de `profile` a partir de blobs.files: variantes guardadas, medidas y original.
+    None si falta en disco alguna variante, o si el perfil no guarda ficheros y no hay original.
+    """
+    files = files or {}
+    pre = profile + "/"
+    mine = {k[len(pre):]: v for k, v in files.items() if k.startswith(pre)}
+    if not mine:
+        return None
+    out = {"blob": sha, "profile": profile, "files": {}, "original": None}
+    for name, meta in mine.items():
+        out.setdefault("w", meta.get("w"))
+        out.setdefault("h", meta.get("h"))
+        if "size" not in meta:
+            continue   # solo medidas: las variantes salen del original bajo demanda
+        rel = rel_path(sha, pre + name)
+        if not os.path.exists(abs_path(rel)):
+            return None
+        out["files"][name] = dict(meta, rel=rel, url=url(rel))
+    orig = next((k for k in files if k.startswith("original.")), None)
+    if orig and os.path.exists(abs_path(rel_path(sha, orig))):
+        rel = rel_path(sha, orig)
+        out["original"] = {"name": orig, "rel": rel, "url": url(rel), "size": files[orig].get("size")}
+    if not out["files"] and out["original"] is None:
+        return None
+    return out
+
+def _lookup(shas) -> Dict[str, dict]:
+    if not shas:
+        return {}
+    # conexión aparte y corta: no abre transacción en la sesión de quien llama (el procesado es largo)
+    with db.engine.connect() as conn:
+        rows = conn.execute(Blob.__table__.select().where(Blob.__table__.c.sha256.in_(list(shas)))).all()
+    return {r.sha256: (r.files or {}) for r in rows}
+
+def store_variants(sha: str, profile: str, outputs: Dict[str, bytes], meta: dict,
+                   size: Optional[int] = None, mime: Optional[str] = None,
+                   original: Optional[bytes] = None) -> dict:
+    """
+    Escribe las variantes de una foto bajo su blob y las registra (sin outputs: solo las
+    medidas del perfil). `original`: bytes a guardar como original.<ext> si aún no está.
+    Devuelve la entrada (ver _entry).
+    """
+    b = _row(sha, size, mime)
+    files = {}
+    if original is not None and not any(k.startswith("original.") and os.path.exists(abs_path(rel_path(sha, k)))
+                                        for k in (b.files or {})):
+        name = "original" + _sniff_ext(original)
+        _write(rel_path(sha, name), original)
+        files[name] = {"size": len(original)}
+    for name, data in outputs.items():
+        rel = rel_path(sha, f"{profile}/{name}")
+        _write(rel, data)
+        files[f"{profile}/{name}"] = dict(meta, size=len(data), sha=digest(data)[:16])
+    if not outputs:
+        files[f"{profile}/dims"] = dict(meta)
+    _add_files(b, files)
+    return _entry(sha, profile, b.files)
+
+def prepare_photos(sources: Iterable, profile: str, fn: Callable, outputs_of: Callable,
+                   keep_original: bool = False, **kwargs) -> Iterator[Tuple[str, object]]:
+    """
+    (sha del original, entrada | excepción) por foto, en orden. Solo se procesan con
+    fn(fichero, **kwargs) (en paralelo, image_pool) las que no tienen ya variantes de `profile`;
+    outputs_of(resultado) → ({"full.jpg": bytes, ...} o {}, {"w":.., "h":..}).
+    sources: bytes, o (sha, loader) si el hash ya se conoce y los bytes se leen solo si hacen falta
+    (en ese caso el original ya está guardado). keep_original: guardar los bytes como original.<ext>.
+    """
+    from image_pool import process_many
+    items = []   # [sha, bytes | None, loader | None]
+    for src in sources:
+        if isinstance(src, tuple):
+            items.append([src[0], None, src[1]])
+        else:
+            items.append([digest(src), src, None])
+    known = _lookup({it[0] for it in items})
+    done: Dict[str, object] = {}
+    todo, queued = [], set()
+    for it in items:
+        sha = it[0]
+        e = _entry(sha, profile, known.get(sha)) if sha in known else None
+        if e is not None:
+            done[sha] = e
+        elif sha not in queued:   # repetida en el mismo lote: se procesa una vez
+            todo.append(it)
+            queued.add(sha)
+    processed = process_many(fn, (t[1] if t[1] is not None else t[2]() for t in todo), **kwargs)
+    for it in items:
+        sha = it[0]
+        if sha not in done:
+            res = next(processed)
+            if isinstance(res, Exception):
+                done[sha] = res
+            else:
+                outs, meta = outputs_of(res)
+                done[sha] = store_variants(sha, profile, outs, meta,
+                                           size=len(it[1]) if it[1] is not None else None,
+                                           original=it[1] if keep_original else None)
+        it[1] = None   # libera los bytes ya procesados
+        yield sha, done[sha]
+
+# ---------- referencias ----------
+def link(sha: str, n: int = 1):
+    """Una fila más (uploads/franchise_uploads) apunta al blob; misma transacción que esa fila."""
+    db.session.execute(Blob.__table__.update().where(Blob.__table__.c.sha256 == sha)
+                       .values(refcount=Blob.__table__.c.refcount + n))
+
+def release(sha: str, n: int = 1):
+    """Quita n referencias; si el blob queda a 0 se borra (fila y ficheros) al hacer commit."""
+    t = Blob.__table__
+    db.session.execute(t.update().where(t.c.sha256 == sha).values(refcount=t.c.refcount - n))
+    left = db.session.execute(t.select().with_only_columns(t.c.refcount).where(t.c.sha256 == sha)).scalar()
+    if left is not None and left <= 0:
+        db.session.execute(t.delete().where(t.c.sha256 == sha, t.c.refcount <= 0))
+        db.session.info.setdefault("_blob_unlink", set()).add(sha)
+
+def _remove_dir(sha: str):
+    import shutil
+    for d in (rel_dir(sha), f"{PRIVATE_ROOT}/{sha[:2]}/{sha}"):
+        shutil.rmtree(abs_path(d), ignore_errors=True)
+
+def _on_commit(session):
+    gone = session.info.pop("_blob_unlink", None)
+    for sha in gone or ():
+        try:
+            _remove_dir(sha)
+        except Exception as e:
+            log.warning("[blobs] no se pudo borrar %s: %s", sha, e)
+
+def _on_rollback(session):
+    session.info.pop("_blob_unlink", None)
+
+def _install_hooks():
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    event.listen(Session, "after_commit", _on_commit)
+    event.listen(Session, "after_soft_rollback", lambda s, prev: _on_rollback(s))
+    _hooks_installed = True
+
+_install_hooks()   # al importar: release() puede llegar antes que cualquier put()
+
+def gc() -> dict:
+    """Recalcula refcounts desde las tablas de referencias y borra blobs sin uso (fila y carpeta)."""
+    t = Blob.__table__
+    no_statement_timeout(db.session.connection())
+    refs: Dict[str, int] = {}
+    insp = inspect(db.engine)
+    for tbl in REF_TABLES:
+        if not insp.has_table(tbl):
+            continue
+        for sha, n in db.session.execute(text(
+                f"SELECT blob_sha256, count(*) FROM {tbl} WHERE blob_sha256 IS NOT NULL GROUP BY blob_sha256")):
+            refs[sha] = refs.get(sha, 0) + int(n)
+    fixed = removed = 0
+    # margen: un original de photo_jobs tiene refcount 0 hasta que su foto se aplica
+    grace = datetime.utcnow() - timedelta(seconds=GC_GRACE_S)
+    for sha, rc, created in db.session.execute(
+            t.select().with_only_columns(t.c.sha256, t.c.refcount, t.c.created_at)).all():
+        want = refs.get(sha, 0)
+        if want == 0 and created is not None and created > grace:
+            continue
+        if want == 0:
+            db.session.execute(t.delete().where(t.c.sha256 == sha))
+            db.session.info.setdefault("_blob_unlink", set()).add(sha)
+            removed += 1
+        elif want != rc:
+            db.session.execute(t.update().where(t.c.sha256 == sha).values(refcount=want))
+            fixed += 1
+    known = {sha for (sha,) in db.session.execute(t.select().with_only_columns(t.c.sha256))}
+    db.session.commit()
+    # carpetas sin fila (commit fallido después de escribir ficheros)
+    orphans = 0
+    for root in (abs_path(ROOT), abs_path(PRIVATE_ROOT)):
+        if not os.path.isdir(root):
+            continue
+        for pre in os.listdir(root):
+            for sha in os.listdir(os.path.join(root, pre)):
+                d = os.path.join(root, pre, sha)
+                if sha not in known and sha not in refs and os.path.getmtime(d) < grace.timestamp():
+                    _remove_dir(sha)
+                    orphans += 1
+    # temporales de put_stream abandonados (worker muerto a mitad de copia)
+    inc = abs_path(INCOMING)
+    if os.path.isdir(inc):
+        for name in os.listdir(inc):
+            p = os.path.join(inc, name)
+            if os.path.getmtime(p) < grace.timestamp():
+                os.unlink(p)
+    return {"blobs": len(known), "refcount_fixed": fixed, "removed": removed, "orphan_dirs": orphans}
+
+if __name__ == "__main__":
+    if "--gc" not in sys.argv[1:]:
+        print("uso: python blob_store.py --gc")
+        sys.exit(2)
+    from app import create_app
+    application = create_app()
+    with application.app_context():
+        print(gc())
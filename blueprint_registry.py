@@ -0,0 +1,163 @@
+# blueprint_registry.py — Registro de blueprints desde un manifiesto
+#
+# create_app() importa y registra todos los routes_* del manifiesto antes de servir. No hay
+# carga perezosa por prefijo: registrar rutas con el servidor ya atendiendo peticiones obliga
+# a tocar el url_map de Flask desde varios hilos, y medido no compensa (el arranque lo
+# dominan Flask y SQLAlchemy; los módulos de rutas suman decenas de ms). Lo pesado de cada
+# módulo (pandas en routes_admin_franchise, google.auth en routes_push...) se importa
+# dentro de las funciones que lo usan, no al importar el módulo.
+# Un módulo que no se puede importar se salta (como el _try() de antes) y queda en report().
+#
+# Uso:
+#   from blueprint_registry import BlueprintRegistry, APP_BLUEPRINTS
+#   BlueprintRegistry(app, APP_BLUEPRINTS).install()
+#
+# Informe de tiempos de import (todos los módulos, sin levantar servidor):
+#   python blueprint_registry.py
+
+import os, sys, time
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class ManifestEntry:
+    """Entrada del manifiesto: dónde está el blueprint y con qué url_prefix se registra."""
+    name: str
+    module: str
+    attr: str
+    url_prefix: Optional[str] = None
+    # estado tras install()
+    state: str = "pending"          # pending|loaded|failed
+    import_ms: float = 0.0
+    error: Optional[str] = None
+
+
+def _bp(name, module, attr, url_prefix=None) -> ManifestEntry:
+    return ManifestEntry(name=name, module=module, attr=attr, url_prefix=url_prefix)
+
+# Manifiesto de app.create_app (mismo orden de registro que antes: importa
+# cuando dos módulos declaran la misma ruta, p.ej. /api/rooms/upload_photos).
+APP_BLUEPRINTS = [
+    _bp("rooms",             "routes_rooms",                 "bp_rooms"),
+    _bp("owner",             "routes_owner_cedula",          "bp_owner", url_prefix="/api/owner"),
+    _bp("owner_presign",     "routes_owner_presign",         "bp_owner_presign"),
+    _bp("owner_delete",      "routes_owner_delete",          "bp_owner_delete"),
+    _bp("contact",           "routes_contact",               "bp_contact"),
+    _bp("upload_generic",    "routes_upload_generic",        "bp_upload_generic"),
+    _bp("upload_rooms",      "routes_uploads_rooms",         "bp_upload_rooms"),
+    _bp("upload_rooms_auto", "routes_uploads_rooms_autofit", "bp_upload_rooms_autofit"),
+    _bp("auth",              "routes_auth",                  "bp_auth"),
+    _bp("kyc",               "routes_kyc",                   "bp_kyc"),
+    _bp("veriff",            "routes_veriff",                "bp_veriff"),
+    _bp("twilio",            "routes_twilio",                "bp_twilio"),
+    _bp("sms",               "routes_sms",                   "bp_sms", url_prefix="/sms"),
+    _bp("admin_franq",       "routes_admin_franchise",       "bp_admin_franq"),
+    _bp("leads",             "routes_leads",                 "bp_leads"),
+    _bp("franchise",         "routes_franchise",             "bp_franchise"),
+    _bp("wa",                "routes_wa",                    "bp_wa"),
+    _bp("wa_webhook",        "routes_wa",                    "bp_wa_webhook"),
+    _bp("push",              "routes_push",                  "bp_push"),
+    _bp("instance_files",    "routes_instance_files",        "bp_instance_files"),
+]
+
+# Manifiesto de codigo_api.create_app (servicio "API ONLY" de render.yaml)
+API_BLUEPRINTS = [
+    _bp("rooms",             "routes_rooms",                 "bp_rooms"),
+    _bp("contracts",         "routes_contracts",             "bp_contracts"),
+    _bp("contact",           "routes_contact",               "bp_contact"),
+    _bp("auth",              "routes_auth",                  "bp_auth"),
+    _bp("franchise",         "routes_franchise",             "bp_franchise"),
+    _bp("kyc",               "routes_kyc",                   "bp_kyc"),
+    _bp("reservas",          "routes_reservas",              "bp_reservas"),
+    _bp("remesas",           "routes_remesas",               "bp_remesas"),
+    _bp("leads",             "routes_leads",                 "bp_leads"),
+    _bp("upload_rooms",      "routes_uploads_rooms",         "bp_upload_rooms"),
+    _bp("upload_generic",    "routes_upload_generic",        "bp_upload_generic"),
+    _bp("sms",               "routes_sms",                   "bp_sms", url_prefix="/sms"),
+    _bp("admin_franq",       "routes_admin_franchise",       "bp_admin_franq"),
+    _bp("payments",          "routes_payments_api",          "bp_pay"),
+    _bp("instance_files",    "routes_instance_files",        "bp_instance_files"),
+]
+
+
+class BlueprintRegistry:
+    """
+    Importa y registra, en orden, los blueprints del manifiesto. Se llama desde create_app(),
+    antes de servir: nada toca el url_map después (ni hilos ni internals de Flask).
+    """
+
+    def __init__(self, app, manifest):
+        self.app = app
+        # copia: el estado (loaded/failed/ms) es por app
+        self.entries = [ManifestEntry(name=e.name, module=e.module, attr=e.attr, url_prefix=e.url_prefix)
+                        for e in manifest]
+
+    def install(self):
+        self.app.extensions["blueprint_registry"] = self
+        t0 = time.perf_counter()
+        for e in self.entries:
+            self._load_one(e)
+        self.app.logger.info("[BP] %d/%d módulos registrados en %.1f ms",
+                             sum(e.state == "loaded" for e in self.entries), len(self.entries),
+                             (time.perf_counter() - t0) * 1000)
+        return self
+
+    def _load_one(self, e: ManifestEntry):
+        app = self.app
+        t0 = time.perf_counter()
+        try:
+            mod = __import__(e.module, fromlist=[e.attr])
+            bp = getattr(mod, e.attr)
+        except Exception as ex:
+            e.state, e.error = "failed", str(ex)
+            e.import_ms = (time.perf_counter() - t0) * 1000
+            app.logger.info(f"{e.name} no disponible: {ex}")
+            return
+        e.import_ms = (time.perf_counter() - t0) * 1000
+        try:
+            if e.url_prefix:
+                app.register_blueprint(bp, url_prefix=e.url_prefix)
+            else:
+                app.register_blueprint(bp)
+            e.state = "loaded"
+        except Exception as ex:
+            e.state, e.error = "failed", str(ex)
+            app.logger.warning("[BP] %s: registro falló: %s", e.name, ex)
+
+    # ---------- informe ----------
+    def report(self):
+        return [dict(name=e.name, module=e.module, url_prefix=e.url_prefix, state=e.state,
+                     import_ms=round(e.import_ms, 1), error=e.error)
+                for e in self.entries]
+
+
+def print_import_report(manifest=None, out=sys.stdout):
+    """Importa cada módulo del manifiesto en frío y muestra su coste de import."""
+    manifest = manifest or (APP_BLUEPRINTS + API_BLUEPRINTS)
+    rows, seen = [], set()
+    base = set(sys.modules)
+    for e in manifest:
+        if e.module in seen:
+            continue
+        seen.add(e.module)
+        before = set(sys.modules)
+        t0 = time.perf_counter()
+        try:
+            __import__(e.module)
+            err = ""
+        except Exception as ex:
+            err = f"{type(ex).__name__}: {ex}"
+        ms = (time.perf_counter() - t0) * 1000
+        rows.append((e.module, ms, len(set(sys.modules) - before), err))
+    total = sum(r[1] for r in rows)
+    print(f"{'módulo':32} {'ms':>9} {'+mods':>6}  error", file=out)
+    for mod, ms, n, err in sorted(rows, key=lambda r: -r[1]):
+        print(f"{mod:32} {ms:9.1f} {n:6d}  {err[:60]}", file=out)
+    print(f"{'TOTAL':32} {total:9.1f} {len(set(sys.modules) - base):6d}", file=out)
+    return rows
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    print_import_report()
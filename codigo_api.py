@@ -3,6 +3,13 @@ import os
 from flask import Flask, jsonify, request, make_response
 from flask_cors import CORS
 from extensions import db
+from blueprint_registry import BlueprintRegistry, API_BLUEPRINTS
+from db_engine import normalize_url, engine_options
+from metrics import init_metrics
+from sql_accounting import init_sql_accounting
+from response_cache import init_response_cache
+from room_search import init_search
+from room_geo import init_geo
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.exc import OperationalError
 import psycopg2
@@ -26,18 +33,6 @@ def _allowed_origin(origin: str | None) -> bool:
         "http://127.0.0.1:8080",
     }
 
-def _try_register(app: Flask, module_name: str, attr: str, url_prefix: str | None = None):
-    try:
-        mod = __import__(module_name, fromlist=[attr])
-        bp = getattr(mod, attr)
-        if url_prefix:
-            app.register_blueprint(bp, url_prefix=url_prefix)
-        else:
-            app.register_blueprint(bp)
-        app.logger.info("BP OK: %s.%s -> %s", module_name, attr, url_prefix or "/")
-    except Exception as e:
-        app.logger.warning("BP SKIP: %s.%s (%s)", module_name, attr, e)
-
 def _import_models(app: Flask):
     """Importa modelos ANTES de create_all()."""
     for modname in [
@@ -103,21 +98,23 @@ def create_app():
 
     # -------------------- Config --------------------
     app.config["SECRET_KEY"] = env("SECRET_KEY", "sr-dev-secret")
-    db_uri = env("DATABASE_URL", "sqlite:///spainroom.db")
+    db_uri = normalize_url(env("DATABASE_URL"), "sqlite:///spainroom.db")
     app.config["SQLALCHEMY_DATABASE_URI"] = db_uri
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_pre_ping": True,
-        "pool_recycle": 300,
-        "pool_size": 5,
-        "max_overflow": 10,
-    }
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(db_uri)   # DB_POOL_* / SQLITE_* (db_engine.py)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # Métricas por endpoint + /metrics (antes que el resto de hooks)
+    init_metrics(app)
+
     # CORS (abierto; afinamos por respuesta)
     CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
     # -------------------- DB init --------------------
     db.init_app(app)
+    init_sql_accounting(app)
+    init_response_cache(app)   # ETag + invalidación por eventos de Room/ContractItem/FranchiseSlot
+    init_search(app)           # índice FTS de rooms al día en cada escritura
+    init_geo(app)              # room_geo (lat/lon + geohash) al día en cada escritura
 
     # 1) Importa modelos
     _import_models(app)
@@ -158,6 +155,7 @@ def create_app():
             ok=True,
             db_uri=app.config.get("SQLALCHEMY_DATABASE_URI", "sqlite"),
             blueprints=list(app.blueprints.keys()),
+            blueprint_imports=app.extensions["blueprint_registry"].report(),
         )
 
     @app.get("/")
@@ -177,22 +175,8 @@ def create_app():
             resp.headers["Access-Control-Allow-Methods"] = "GET,POST,PUT,PATCH,DELETE,OPTIONS"
         return resp
 
-    # -------------------- Blueprints --------------------
-    _try_register(app, "routes_rooms",             "bp_rooms",        None)
-    _try_register(app, "routes_contracts",         "bp_contracts",    None)
-    _try_register(app, "routes_contact",           "bp_contact",      None)
-    _try_register(app, "routes_auth",              "bp_auth",         None)
-    _try_register(app, "routes_franchise",         "bp_franchise",    None)
-    _try_register(app, "routes_kyc",               "bp_kyc",          None)
-    _try_register(app, "routes_reservas",          "bp_reservas",     None)
-    _try_register(app, "routes_remesas",           "bp_remesas",      None)
-    _try_register(app, "routes_leads",             "bp_leads",        None)
-    _try_register(app, "routes_uploads_rooms",     "bp_upload_rooms", None)
-    _try_register(app, "routes_upload_generic",    "bp_upload_generic", None)
-    _try_register(app, "routes_sms",               "bp_sms",          "/sms")
-    _try_register(app, "routes_admin_franchise",   "bp_admin_franq",  None)
-    # ✅ Pagos: /create-checkout-session
-    _try_register(app, "routes_payments_api",      "bp_pay",          None)
+    # -------------------- Blueprints (todos registrados aquí, antes de servir) --------------------
+    BlueprintRegistry(app, API_BLUEPRINTS).install()
 
     return app
 
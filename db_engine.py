@@ -0,0 +1,135 @@
+# db_engine.py — Fábrica única de engine (URL + opciones de pool + perfil SQLite)
+#
+# app.py, codigo_api.py, config.py y database.py sacan de aquí la URL normalizada y
+# las SQLALCHEMY_ENGINE_OPTIONS, en vez de repetir cada uno su diccionario.
+#
+# SQLite (dev y fallback): en cada conexión nueva se aplica un perfil de PRAGMAs
+#   journal_mode=WAL      lectores y escritor no se bloquean entre sí (gthread)
+#   synchronous=NORMAL    seguro con WAL, mucho menos fsync
+#   busy_timeout          espera al lock en vez de "database is locked" inmediato
+#   cache_size / mmap_size / temp_store=MEMORY
+# Postgres: pool explícito, timeout de transacción ociosa en el servidor y, si se pide
+#   (DB_STATEMENT_TIMEOUT_MS > 0, pensado para el servicio web), timeout de sentencia.
+#   Los trabajos largos (ingest, --rebuild, gc) lo quitan en su transacción con
+#   no_statement_timeout(); las migraciones de alembic usan su propio engine (env.py) y no lo llevan.
+#
+# Variables de entorno:
+#   SQLITE_WAL=1|0  SQLITE_SYNCHRONOUS=NORMAL  SQLITE_BUSY_TIMEOUT_MS=5000
+#   SQLITE_CACHE_KB=20000  SQLITE_MMAP_MB=256
+#   DB_POOL_SIZE=5  DB_MAX_OVERFLOW=10  DB_POOL_TIMEOUT=10  DB_POOL_RECYCLE=300
+#   DB_STATEMENT_TIMEOUT_MS=0 (desactivado)  DB_IDLE_TX_TIMEOUT_MS=60000  DB_CONNECT_TIMEOUT=5
+
+import os
+from typing import Optional
+
+from sqlalchemy import create_engine as _sa_create_engine, event
+from sqlalchemy.engine import Engine, make_url
+
+_listener_installed = False
+
+def _env(name: str, default: str = "") -> str:
+    return (os.getenv(name) or default).strip()
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int(_env(name, str(default)))
+    except Exception:
+        return default
+
+def _on(name: str, default: str = "1") -> bool:
+    return _env(name, default).lower() in ("1", "true", "yes", "on")
+
+# ---------- URL ----------
+def normalize_url(raw: Optional[str], default: str, require_ssl: bool = False) -> str:
+    """postgres:// → postgresql+psycopg2:// y, si se pide, sslmode=require (salvo localhost)."""
+    url = (raw or "").strip()
+    if not url:
+        return default
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql+psycopg2://", 1)
+    elif url.startswith("postgresql://"):
+        url = url.replace("postgresql://", "postgresql+psycopg2://", 1)
+    if require_ssl and "+psycopg2://" in url and "sslmode=" not in url:
+        host = make_url(url).host or ""
+        if host not in ("localhost", "127.0.0.1", "::1"):
+            url += ("&" if "?" in url else "?") + "sslmode=require"
+    return url
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+# ---------- Opciones de engine ----------
+def engine_options(url: str) -> dict:
+    """Diccionario para SQLALCHEMY_ENGINE_OPTIONS / create_engine(**opts)."""
+    install_sqlite_profile()
+    if is_sqlite(url):
+        return {
+            # el mismo fichero se usa desde varios threads (gthread)
+            "connect_args": {"check_same_thread": False,
+                             "timeout": _int("SQLITE_BUSY_TIMEOUT_MS", 5000) / 1000.0},
+        }
+    opts = {
+        "pool_pre_ping": True,
+        "pool_recycle": _int("DB_POOL_RECYCLE", 300),
+        "pool_size": _int("DB_POOL_SIZE", 5),
+        "max_overflow": _int("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _int("DB_POOL_TIMEOUT", 10),
+    }
+    if url.startswith("postgresql"):
+        server_opts = f"-c idle_in_transaction_session_timeout={_int('DB_IDLE_TX_TIMEOUT_MS', 60000)}"
+        stmt_ms = _int("DB_STATEMENT_TIMEOUT_MS", 0)
+        if stmt_ms > 0:
+            server_opts += f" -c statement_timeout={stmt_ms}"
+        opts["connect_args"] = {
+            "connect_timeout": _int("DB_CONNECT_TIMEOUT", 5),
+            "options": server_opts,
+            "application_name": _env("DB_APPLICATION_NAME", "spainroom-backend"),
+        }
+    return opts
+
+def no_statement_timeout(conn) -> None:
+    """Sin statement_timeout durante el resto de la transacción de conn (Postgres; en SQLite nada)."""
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql("SET LOCAL statement_timeout = 0")
+
+def create_engine(url: str, **overrides) -> Engine:
+    """create_engine() de SQLAlchemy con el perfil de este módulo (uso fuera de Flask)."""
+    opts = engine_options(url)
+    opts.update(overrides)
+    return _sa_create_engine(url, **opts)
+
+# ---------- Perfil SQLite ----------
+def sqlite_pragmas() -> list:
+    prag = []
+    if _on("SQLITE_WAL"):
+        prag.append("PRAGMA journal_mode=WAL")
+    prag += [
+        f"PRAGMA synchronous={_env('SQLITE_SYNCHRONOUS', 'NORMAL').upper()}",
+        f"PRAGMA busy_timeout={_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}",
+        f"PRAGMA cache_size=-{_int('SQLITE_CACHE_KB', 20000)}",
+        f"PRAGMA mmap_size={_int('SQLITE_MMAP_MB', 256) * 1024 * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    return prag
+
+def _on_connect(dbapi_conn, conn_record):
+    mod = type(dbapi_conn).__module__
+    if "sqlite" not in mod:
+        return
+    cur = dbapi_conn.cursor()
+    try:
+        for p in sqlite_pragmas():
+            try:
+                cur.execute(p)
+            except Exception:
+                pass   # p.ej. WAL sobre :memory: o BD de solo lectura
+    finally:
+        cur.close()
+
+def install_sqlite_profile():
+    """Engancha el perfil a toda conexión SQLite nueva del proceso (idempotente)."""
+    global _listener_installed
+    if _listener_installed:
+        return
+    event.listen(Engine, "connect", _on_connect)
+    _listener_installed = True
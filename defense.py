@@ -90,10 +90,10 @@ def _install_request_guards(app):
         if ua_re and ua_re.search(ua or ""):
             abort(403)
 
-        # Tamaño de JSON defensivo (además de MAX_CONTENT_LENGTH de Flask)
+        # Tamaño de JSON defensivo (además de MAX_CONTENT_LENGTH de Flask);
+        # por Content-Length: no se lee el body aquí (lo lee la vista, una vez)
         if request.mimetype and "json" in request.mimetype.lower():
-            raw = request.get_data(cache=True, as_text=False) or b""
-            if len(raw) > max_json:
+            if (request.content_length or 0) > max_json:
                 abort(413)
 
         # Enforce Admin Key en rutas internas si prefieres (prefijo configurable)
@@ -111,36 +111,13 @@ def _install_request_guards(app):
         return resp
 
 def _install_rate_limits(app):
-    # requiere flask-limiter
+    # token bucket compartido entre workers (rate_limit.py): límites globales por
+    # cliente (RATE_LIMITS) + ráfaga en /api/login, /api/admin/, /voice (RATE_LIMITS_BURST)
     try:
-        from flask_limiter import Limiter
-        from flask_limiter.util import get_remote_address
-
-        # Ejemplos: "100/minute; 1000/hour"
-        default_limits = _parse_csv(_env("RATE_LIMITS", "200/minute, 2000/hour"))
-        burst_limits   = _parse_csv(_env("RATE_LIMITS_BURST", "20/10seconds"))
-
-        def _key_func():
-            # permite agrupar por API key si existe
-            ak = request.headers.get("X-Admin-Key") or request.headers.get("Authorization")
-            return ak or get_remote_address()
-
-        limiter = Limiter(get_remote_address=_key_func, storage_uri=_env("LIMITER_STORAGE_URI", "memory://"))
-        limiter.init_app(app)
-
-        # Global default
-        for l in default_limits:
-            app.config.setdefault("RATELIMIT_DEFAULT", default_limits)
-
-        # Ejemplo de burst en rutas sensibles
-        @app.before_request
-        def _apply_dynamic_limits():
-            if request.path.startswith(("/api/login", "/api/admin/", "/voice")):
-                for l in burst_limits:
-                    limiter.limit(l)(lambda: None)()  # aplica límite inmediato
-
+        import rate_limit
+        rate_limit.init_rate_limits(app)
     except Exception as e:
-        current_app.logger.warning("[DEFENSE] Rate limiter not active: %s", e)
+        app.logger.warning("[DEFENSE] Rate limiter not active: %s", e)
 
 def _install_proxyfix_and_cookies(app):
     # Render usa proxy → fija forwards para scheme/host/port
@@ -8,8 +8,7 @@
 
 from functools import wraps
 from flask import request, Response, current_app, g
-import os, re, json, time, hmac, hashlib
-from urllib.parse import unquote_plus
+import os, re, json, time, hmac, hashlib, threading
 
 # ======================
 # Config por entorno
@@ -94,35 +93,191 @@ def _bad_headers():
             return f"bad_header:{h}"
     return None
 
-def _pattern_hit(patterns, text):
-    if not text: return None
-    for p in patterns:
-        if re.search(p, text):
-            return p
-    return None
+# ======================
+# Motor WAF precompilado
+# ======================
+# Todas las firmas de una familia van en UNA regex con un grupo con nombre por regla:
+# una sola pasada (finditer) por texto, y lastgroup dice qué regla saltó.
+WAF_BODY_BYTES = int(os.getenv("DEFENSE_WAF_BODY_BYTES", "4096"))  # prefijo de body inspeccionado
+_ENV_PREFIX = "spainroom.waf_body"                                     # clave en environ
+
+try:
+    from re import _parser as _sre_parse
+    from re._constants import LITERAL as _LITERAL
+except ImportError:                      # Python < 3.11
+    import sre_parse as _sre_parse
+    from sre_constants import LITERAL as _LITERAL
+
+def _required_literal(pattern):
+    """Literal más largo de la secuencia principal de la firma ('' si no hay)."""
+    try:
+        best = cur = ""
+        for op, av in _sre_parse.parse(pattern):
+            if op is _LITERAL:
+                cur += chr(av)
+            else:
+                best, cur = max(best, cur, key=len), ""
+        return max(best, cur, key=len)
+    except Exception:
+        return ""
+
+class WafEngine:
+    """
+    Matcher combinado de firmas {categoria: [patrones]} con contadores por regla.
+
+    Prefiltro: de cada firma se saca su literal obligatorio más largo ("select",
+    "<script", "../"...). Si ninguno aparece en el texto (lo normal), no se ejecuta
+    la regex: el coste es un puñado de búsquedas de subcadena en C.
+    """
+
+    def __init__(self, families):
+        self.rules = {}          # nombre -> patrón original
+        self.literals = []       # [(literal, ignorecase)]
+        self.always = False      # alguna firma sin literal: siempre regex
+        alts = []
+        for cat, patterns in families.items():
+            for i, p in enumerate(patterns):
+                name = f"{cat}_{i}"
+                self.rules[name] = p
+                body, icase = p, p.startswith("(?i)")
+                if icase:
+                    body = f"(?i:{body[4:]})"     # flag local: Python no admite (?i) a mitad
+                alts.append(f"(?P<{name}>{body})")
+                lit = _required_literal(p)
+                if lit:
+                    self.literals.append((lit.lower() if icase else lit, icase))
+                else:
+                    self.always = True
+        self.regex = re.compile("|".join(alts))
+        self.hits = {name: 0 for name in self.rules}
+        self._lock = threading.Lock()
+
+    def _maybe(self, text):
+        if self.always:
+            return True
+        low = None
+        for lit, icase in self.literals:
+            if icase:
+                if low is None:
+                    low = text.lower()
+                if lit in low:
+                    return True
+            elif lit in text:
+                return True
+        return False
+
+    def scan(self, text):
+        """Nombres de regla que aparecen en text (una pasada)."""
+        if not text or not self._maybe(text):
+            return []
+        found = []
+        for m in self.regex.finditer(text):
+            name = m.lastgroup
+            if name not in found:
+                found.append(name)
+        if found:
+            with self._lock:
+                for name in found:
+                    self.hits[name] += 1
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {name: n for name, n in self.hits.items() if n}
+
+WAF_PAYLOAD = WafEngine({"sqli": SQLI_PATTERNS, "xss": XSS_PATTERNS})
+WAF_PATH = WafEngine({"traversal": TRAVERSAL_PATTERNS})
+
+class _PrefixedStream:
+    """wsgi.input con los primeros bytes ya leídos por el WAF delante del resto."""
+
+    def __init__(self, prefix, stream):
+        self._buf, self._stream = prefix, stream
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            out, self._buf = self._buf + self._stream.read(), b""
+            return out
+        out, self._buf = self._buf[:size], self._buf[size:]
+        if len(out) < size:
+            out += self._stream.read(size - len(out))
+        return out
+
+    def readline(self, size=-1):
+        if not self._buf:
+            return self._stream.readline(size) if size is not None and size >= 0 else self._stream.readline()
+        nl = self._buf.find(b"\n")
+        stop = len(self._buf) if nl < 0 else nl + 1
+        if size is not None and size >= 0:
+            stop = min(stop, size)
+        out, self._buf = self._buf[:stop], self._buf[stop:]
+        if nl < 0 and not self._buf and (size is None or size < 0 or len(out) < size):
+            more = size - len(out) if size is not None and size >= 0 else -1
+            out += self._stream.readline(more) if more >= 0 else self._stream.readline()
+        return out
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+class WafBodyPeek:
+    """Middleware WSGI: lee UNA vez el prefijo del body y lo devuelve al stream de la vista."""
+
+    def __init__(self, wsgi_app, limit=WAF_BODY_BYTES):
+        self.wsgi_app, self.limit = wsgi_app, limit
+
+    def __call__(self, environ, start_response):
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if length > 0 and self.limit > 0:
+            stream = environ["wsgi.input"]
+            prefix = stream.read(min(length, self.limit))
+            environ[_ENV_PREFIX] = prefix
+            environ["wsgi.input"] = _PrefixedStream(prefix, stream)
+        return self.wsgi_app(environ, start_response)
+
+def _body_prefix():
+    """Prefijo del body ya leído por WafBodyPeek (sin tocar el stream de la vista)."""
+    prefix = request.environ.get(_ENV_PREFIX)
+    if prefix is None:
+        # sin middleware: solo si Flask ya lo tiene en caché (no consumimos el stream)
+        cached = getattr(request, "_cached_data", None)
+        prefix = cached[:WAF_BODY_BYTES] if cached else b""
+    return prefix.decode("utf-8", "ignore")
+
+def _category(rule_names):
+    return {n.split("_", 1)[0] for n in rule_names}
 
 def _traversal_ok(path):
-    if _pattern_hit(TRAVERSAL_PATTERNS, path) is not None:
+    if WAF_PATH.scan(path):
         return "traversal_path"
     return None
 
 def _qstring_ok():
-    qs = request.query_string.decode("utf-8","ignore")
-    if _pattern_hit(SQLI_PATTERNS, qs): return "sqli_qs"
-    if _pattern_hit(XSS_PATTERNS, qs):  return "xss_qs"
+    cats = _category(WAF_PAYLOAD.scan(request.query_string.decode("utf-8","ignore")))
+    if "sqli" in cats: return "sqli_qs"
+    if "xss" in cats:  return "xss_qs"
     return None
 
 def _body_ok():
-    try:
-        raw = request.get_data(cache=False, as_text=True)[:4096]  # inspección parcial
-    except Exception:
-        return None
-    if _pattern_hit(SQLI_PATTERNS, raw): return "sqli_body"
-    if _pattern_hit(XSS_PATTERNS, raw):  return "xss_body"
+    cats = _category(WAF_PAYLOAD.scan(_body_prefix()))
+    if "sqli" in cats: return "sqli_body"
+    if "xss" in cats:  return "xss_body"
     return None
 
+def waf_stats():
+    """Contadores de aciertos por regla (proceso actual)."""
+    return {"payload": WAF_PAYLOAD.stats(), "path": WAF_PATH.stats(),
+            "rules": dict(WAF_PAYLOAD.rules, **WAF_PATH.rules)}
+
 def waf_inspect():
     """Devuelve razón (str) si se bloquea, o None si pasa."""
+    t0 = time.perf_counter()
     score = 0
     reasons = []
 
@@ -150,6 +305,7 @@ def waf_inspect():
     if request.method not in CFG["ALLOW_METHODS"]:
         reasons.append(f"method_not_allowed:{request.method}"); score += 2
 
+    g.waf_us = (time.perf_counter() - t0) * 1e6
     if score >= CFG["ANOMALY_THRESHOLD"]:
         return f"blocked[{score}]:" + ",".join(reasons)
     return None
@@ -209,12 +365,27 @@ def verify_stripe(f):
 # ======================
 def register_defense(app):
     """Activa WAF + headers + CORS + rate limit (opcional) en la app."""
-    # WAF
+    # WAF: el prefijo del body se lee una vez en WSGI y la vista recibe el stream entero
+    app.wsgi_app = WafBodyPeek(app.wsgi_app)
+    try:
+        import metrics
+        metrics.describe("spainroom_waf_hits_total", "counter", "Aciertos de firmas WAF por regla")
+        metrics.describe("spainroom_waf_blocks_total", "counter", "Peticiones bloqueadas por el WAF")
+        metrics.describe("spainroom_waf_inspect_seconds", "histogram", "Tiempo de inspección WAF por petición")
+        metrics.add_collector(lambda: [("spainroom_waf_hits_total", {"rule": n}, v)
+                                       for eng in (WAF_PAYLOAD, WAF_PATH) for n, v in eng.stats().items()])
+    except Exception:
+        metrics = None
+
     @app.before_request
     def _waf_gate():
         reason = waf_inspect()
+        if metrics is not None:
+            metrics.observe("spainroom_waf_inspect_seconds", None, g.waf_us / 1e6)
         if reason:
-            _jlog("waf_block", reason=reason)
+            if metrics is not None:
+                metrics.inc("spainroom_waf_blocks_total")
+            _jlog("waf_block", reason=reason, waf_us=round(g.waf_us, 1))
             return Response(status=403)
 
     # Cabeceras seguras
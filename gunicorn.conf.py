@@ -0,0 +1,6 @@
+# gunicorn.conf.py — gunicorn lo carga solo desde la carpeta de arranque (Procfile, render.yaml)
+#
+# child_exit: al terminar un worker, sus métricas pasan a dead.json y se borra su fichero
+# (metrics.py); sin esto quedaba un worker_<pid>.json por cada worker que haya existido.
+
+from metrics import child_exit  # noqa: F401  (hook de gunicorn)
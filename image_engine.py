@@ -0,0 +1,326 @@
+# image_engine.py — Motor único de imágenes: una decodificación, varias variantes y formatos
+#
+# Sustituye a las cuatro tuberías que había (process_image, process_image_autofit,
+# utils_images.process_photo, services_images.process_to_webp), que decodificaban a
+# resolución completa y redimensionaban cada tamaño desde el original:
+#
+#   1. Image.open solo lee la cabecera: se comprueba el presupuesto de píxeles (bombas de
+#      descompresión) antes de decodificar nada.
+#   2. JPEG en modo draft: libjpeg decodifica ya a 1/2, 1/4 u 1/8 si la variante más grande
+#      cabe (12 MP → 1600 px decodifica ~3 MP en vez de 12).
+#   3. Orientación EXIF, RGB (transparencia sobre blanco) y recorte centrado opcional (4:3).
+#   4. Cadena de reducción: cada variante sale de la anterior más pequeña que aún la cubre
+#      (full → card → thumb), no del original.
+#   5. Cada variante se codifica en los formatos pedidos (jpeg, webp, avif, png).
+#
+# probe() valida una subida con una sola decodificación reducida (1/8 en JPEG) y calcula
+# las medidas de una variante sin codificar nada (variantes bajo demanda: image_variants.py).
+#
+#   from image_engine import Variant, render
+#   out = render(fp, [Variant("full", 1600, quality=88), Variant("thumb", 480, quality=82)], ratio=4/3)
+#   out["variants"]["full"] → {"w", "h", "jpeg": bytes}
+#
+# Variantes: fit (por defecto) = ancho máximo, proporción libre, nunca amplía;
+# cover (crop=True) = caja exacta width×height con recorte centrado (amplía si hace falta).
+#
+# Variables de entorno:
+#   IMAGE_MAX_PIXELS   píxeles máximos de la imagen de entrada (por defecto 50 000 000)
+#   IMAGE_AVIF_SPEED   velocidad del codificador AVIF, 0 (lento, mejor) … 10 (por defecto 6)
+#
+# Medida (CPU y memoria pico por foto, motor contra decodificación completa):
+#   python image_engine.py --bench
+
+import io, os, sys, math
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+DEFAULT_MAX_PIXELS = 50_000_000
+_ORIENT_SWAP = (5, 6, 7, 8)   # orientaciones EXIF que giran 90°
+
+class ImageTooLarge(ValueError):
+    """La imagen supera IMAGE_MAX_PIXELS (posible bomba de descompresión)."""
+
+@dataclass(frozen=True)
+class Variant:
+    name: str
+    width: int
+    height: int = 0              # solo con crop=True: alto exacto de la caja
+    crop: bool = False           # True = cover width×height; False = fit a `width` de ancho
+    formats: Tuple[str, ...] = ("jpeg",)
+    quality: Union[int, Dict[str, int]] = 85   # o por formato: {"jpeg": 82, "webp": 80}
+    progressive: bool = False
+
+def _int_env(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or str(default)).strip())
+    except Exception:
+        return default
+
+def max_pixels() -> int:
+    return _int_env("IMAGE_MAX_PIXELS", DEFAULT_MAX_PIXELS)
+
+def can_encode(fmt: str) -> bool:
+    """¿Este Pillow sabe codificar `fmt`? (AVIF depende de cómo se compiló)."""
+    from PIL import features
+    fmt = fmt.lower()
+    if fmt in ("jpeg", "jpg", "png"):
+        return True
+    try:
+        return bool(features.check(fmt))
+    except Exception:
+        return False
+
+# ---------- geometría ----------
+def _crop_box(w: int, h: int, ratio: float) -> Tuple[int, int, int, int]:
+    """Caja centrada de proporción `ratio` (ancho/alto) dentro de w×h."""
+    r = w / float(h)
+    if abs(r - ratio) < 1e-3:
+        return 0, 0, w, h
+    if r > ratio:
+        new_w = int(h * ratio)
+        x0 = (w - new_w) // 2
+        return x0, 0, x0 + new_w, h
+    new_h = int(w / ratio)
+    y0 = (h - new_h) // 2
+    return 0, y0, w, y0 + new_h
+
+def _target(v: Variant, w: int, h: int) -> Tuple[int, int]:
+    """Tamaño final de la variante a partir de una imagen w×h (ya recortada a la proporción global)."""
+    if v.crop:
+        return v.width, v.height
+    if w <= v.width:
+        return w, h
+    return v.width, max(1, int(h * (v.width / float(w))))
+
+def _need(v: Variant, w: int, h: int) -> Tuple[int, int]:
+    """Tamaño mínimo que debe tener la imagen de origen (w×h de proporción fija) para sacar `v`."""
+    tw, th = _target(v, w, h)
+    if not v.crop:
+        return tw, th
+    # cover: tras recortar a tw:th, el recorte debe medir ≥ tw×th
+    x0, y0, x1, y1 = _crop_box(w, h, tw / float(th))
+    s = max(tw / float(x1 - x0), th / float(y1 - y0))
+    return int(math.ceil(w * s)), int(math.ceil(h * s))
+
+# ---------- decodificación ----------
+def _orientation(im) -> int:
+    try:
+        return int(im.getexif().get(0x0112, 1) or 1)
+    except Exception:
+        return 1
+
+def _to_rgb(im: Image.Image) -> Image.Image:
+    if im.mode == "RGB":
+        return im
+    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+        im = im.convert("RGBA")
+        bg = Image.new("RGB", im.size, (255, 255, 255))
+        bg.paste(im, mask=im.split()[-1])
+        return bg
+    return im.convert("RGB")
+
+def decode(src, variants: Iterable[Variant], ratio: Optional[float] = None,
+           limit: Optional[int] = None) -> Image.Image:
+    """
+    Abre `src` (ruta, fichero o FileStorage) y devuelve la imagen RGB orientada y recortada a
+    `ratio`, decodificada a la menor escala JPEG que aún cubre la variante más exigente.
+    """
+    im = Image.open(getattr(src, "stream", src))
+    w, h = im.size
+    if w * h > (limit or max_pixels()):
+        raise ImageTooLarge(f"{w}x{h} supera {limit or max_pixels()} píxeles")
+
+    orient = _orientation(im)
+    ow, oh = (h, w) if orient in _ORIENT_SWAP else (w, h)   # tamaño ya orientado
+    cx0, cy0, cx1, cy1 = _crop_box(ow, oh, ratio) if ratio else (0, 0, ow, oh)
+    cw, ch = cx1 - cx0, cy1 - cy0
+
+    if im.format == "JPEG":
+        # escala mínima del original (orientado) para que el recorte cubra todas las variantes
+        s = 0.0
+        for v in variants:
+            nw, nh = _need(v, cw, ch)
+            s = max(s, nw / float(cw), nh / float(ch))
+        s = min(1.0, s)
+        req = (int(math.ceil(ow * s)), int(math.ceil(oh * s)))
+        if orient in _ORIENT_SWAP:
+            req = (req[1], req[0])
+        im.draft("RGB", req)
+
+    if orient != 1:
+        im = ImageOps.exif_transpose(im)   # sin orientación no hace falta la copia que devuelve
+    im = _to_rgb(im)
+    if ratio:
+        # el draft cambia el tamaño: recorte recalculado sobre lo decodificado
+        box = _crop_box(im.size[0], im.size[1], ratio)
+        if box != (0, 0, im.size[0], im.size[1]):
+            im = im.crop(box)
+    return im
+
+# ---------- reducción y codificación ----------
+def _resize(im: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    if im.size == size:
+        return im
+    # reducing_gap: primero reduce() entero (barato) y LANCZOS solo en el último tramo
+    return im.resize(size, Image.LANCZOS, reducing_gap=3.0 if im.size[0] > 2 * size[0] else None)
+
+def _make(base: Image.Image, v: Variant, chain: list) -> Image.Image:
+    """Variante `v` desde la imagen más pequeña de `chain` que la cubre (o desde base)."""
+    tw, th = _target(v, base.size[0], base.size[1])
+    if not v.crop:
+        # solo imágenes con la proporción de base (otras variantes fit)
+        cands = [im for im, key in chain if key is None and im.size[0] >= tw]
+        src = min(cands, key=lambda im: im.size[0], default=base)
+        return _resize(src, (tw, th))
+    # cover: de base o de una variante con su misma proporción o de proporción base
+    # (un recorte centrado de un recorte centrado de otra proporción cambiaría el encuadre)
+    r = tw / float(th)
+    cands = [im for im, key in chain
+             if (key is None or abs(key - r) < 1e-3) and _fits_cover(im, tw, th)]
+    src = min(cands, key=lambda im: im.size[0], default=base)
+    return _resize(src.crop(_crop_box(src.size[0], src.size[1], r)), (tw, th))
+
+def _fits_cover(im: Image.Image, tw: int, th: int) -> bool:
+    x0, y0, x1, y1 = _crop_box(im.size[0], im.size[1], tw / float(th))
+    return (x1 - x0) >= tw and (y1 - y0) >= th
+
+def encode(im: Image.Image, fmt: str, quality: int = 85, progressive: bool = False) -> bytes:
+    b = io.BytesIO()
+    fmt = fmt.lower()
+    if fmt in ("jpeg", "jpg"):
+        im.save(b, "JPEG", quality=quality, optimize=True, progressive=progressive)
+    elif fmt == "webp":
+        im.save(b, "WEBP", quality=quality, method=4)
+    elif fmt == "avif":
+        im.save(b, "AVIF", quality=quality, speed=_int_env("IMAGE_AVIF_SPEED", 6))
+    elif fmt == "png":
+        im.save(b, "PNG", optimize=True)
+    else:
+        raise ValueError(f"formato no soportado: {fmt}")
+    return b.getvalue()
+
+def render(src, variants: Iterable[Variant], ratio: Optional[float] = None,
+           limit: Optional[int] = None) -> dict:
+    """
+    Decodifica una vez y devuelve {"w", "h" (tras recorte), "variants": {name: {"w", "h", <fmt>: bytes}}}.
+    Las variantes se generan de mayor a menor, cada una desde la anterior que la cubre.
+    """
+    variants = list(variants)
+    base = decode(src, variants, ratio=ratio, limit=limit)
+    order = sorted(variants, key=lambda v: _target(v, *base.size)[0] * _target(v, *base.size)[1], reverse=True)
+    chain = []   # [(imagen, None = proporción de base | proporción del recorte cover)]
+    out = {}
+    for v in order:
+        im = _make(base, v, chain)
+        chain.append((im, v.width / float(v.height) if v.crop else None))
+        d = {"w": im.size[0], "h": im.size[1]}
+        for fmt in v.formats:
+            key = "jpeg" if fmt == "jpg" else fmt
+            q = v.quality.get(key, 85) if isinstance(v.quality, dict) else v.quality
+            d[key] = encode(im, fmt, q, v.progressive)
+        out[v.name] = d
+    return {"w": base.size[0], "h": base.size[1], "variants": out}
+
+def probe(src, width: Optional[int] = None, ratio: Optional[float] = None,
+          limit: Optional[int] = None) -> dict:
+    """
+    Valida la imagen decodificándola una vez a la menor escala posible y devuelve
+    {"w", "h"} de la variante fit a `width` (tras orientar y recortar a `ratio`),
+    {"src_w", "src_h"} del original orientado y "format" (JPEG, PNG, WEBP...).
+    """
+    im = Image.open(getattr(src, "stream", src))
+    w, h = im.size
+    if w * h > (limit or max_pixels()):
+        raise ImageTooLarge(f"{w}x{h} supera {limit or max_pixels()} píxeles")
+    fmt = im.format
+    ow, oh = (h, w) if _orientation(im) in _ORIENT_SWAP else (w, h)
+    if fmt == "JPEG":
+        im.draft("RGB", (max(1, w // 8), max(1, h // 8)))
+    im.load()   # datos truncados o corruptos fallan aquí, en la subida y no al servirla
+    tw, th = fit_size(ow, oh, width, ratio)
+    return {"w": tw, "h": th, "src_w": ow, "src_h": oh, "format": fmt}
+
+def fit_size(w: int, h: int, width: Optional[int] = None, ratio: Optional[float] = None) -> Tuple[int, int]:
+    """Medidas de una variante fit a `width` de una imagen w×h (orientada) recortada a `ratio`."""
+    x0, y0, x1, y1 = _crop_box(w, h, ratio) if ratio else (0, 0, w, h)
+    return _target(Variant("fit", width or (x1 - x0)), x1 - x0, y1 - y0)
+
+# ---------- Benchmark ----------
+def _sample(w: int, h: int) -> bytes:
+    small = Image.effect_noise((w // 16, h // 16), 80).convert("RGB")
+    b = io.BytesIO()
+    small.resize((w, h), Image.BICUBIC).save(b, "JPEG", quality=90)
+    return b.getvalue()
+
+def _legacy(raw: bytes) -> dict:
+    # lo que hacía process_image_autofit: decodificación completa, cada tamaño desde el recorte 4:3
+    im = _to_rgb(ImageOps.exif_transpose(Image.open(io.BytesIO(raw))))
+    im = im.crop(_crop_box(im.size[0], im.size[1], 4 / 3.0))
+    out = {}
+    for name, tw, q in (("full", 1600, 88), ("thumb", 480, 82)):
+        r = im.resize((tw, int(im.size[1] * tw / float(im.size[0]))), Image.LANCZOS)
+        out[name] = encode(r, "jpeg", q)
+    return out
+
+def _engine(raw: bytes) -> dict:
+    return render(io.BytesIO(raw), [Variant("full", 1600, quality=88, progressive=True),
+                                    Variant("thumb", 480, quality=82)], ratio=4 / 3.0)
+
+def _status_kb(field: str) -> int:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _rss_kb() -> int:
+    return _status_kb("VmRSS")
+
+def _peak_kb() -> int:
+    return _status_kb("VmHWM")
+
+def _one(kind: str, path: str, n: int) -> dict:
+    import time
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    fn = _legacy if kind == "legacy" else _engine
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")   # Linux: reinicia el pico de RSS (si no, cuenta la lectura del fichero)
+    except OSError:
+        pass
+    rss0 = _rss_kb()
+    c0 = time.process_time()
+    for _ in range(n):
+        fn(raw)
+    cpu = (time.process_time() - c0) / n
+    rss1 = _peak_kb()
+    return {"pipeline": kind, "cpu_ms_per_photo": round(cpu * 1000, 1),
+            "peak_rss_delta_mb": round((rss1 - rss0) / 1024.0, 1)}
+
+if __name__ == "__main__":
+    import argparse, json, subprocess, tempfile
+    ap = argparse.ArgumentParser(description="CPU y memoria pico por foto: motor contra decodificación completa")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--n", type=int, default=5)
+    ap.add_argument("--mp", type=float, default=12.0)
+    ap.add_argument("--one", nargs=2, metavar=("KIND", "PATH"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.one:
+        print(json.dumps(_one(args.one[0], args.one[1], args.n)))
+        sys.exit(0)
+    w = int((args.mp * 1e6 * 4 / 3) ** 0.5)
+    path = os.path.join(tempfile.mkdtemp(prefix="img-bench-"), "sample.jpg")
+    with open(path, "wb") as fh:
+        fh.write(_sample(w, int(w * 3 / 4)))
+    # cada tubería en su propio proceso: ru_maxrss es el pico de vida del proceso
+    res = [json.loads(subprocess.check_output([sys.executable, os.path.abspath(__file__), "--one", k, path,
+                                               "--n", str(args.n)]))
+           for k in ("legacy", "engine")]
+    print(json.dumps({"photo": f"{w}x{int(w * 3 / 4)}", "runs": res}, indent=2))
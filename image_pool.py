@@ -0,0 +1,216 @@
+# image_pool.py — Procesado de fotos en varios núcleos (ProcessPoolExecutor acotado por worker)
+#
+# Decodificar, redimensionar con LANCZOS y codificar JPEG es CPU puro; con el GIL, un lote
+# de files[] se procesaba foto a foto en un solo núcleo. process_many() reparte el lote en
+# un pool de procesos propio de cada worker de gunicorn y devuelve los resultados EN EL
+# ORDEN DE ENTRADA (la galería queda igual que en serie), con la excepción de cada foto en
+# su posición en vez de cortar el lote.
+#
+#   from image_pool import process_many
+#   # originales ya guardados en blob_store (put_stream); se leen según se envían
+#   for res in process_many(probe_photo_autofit, (load() for sha, load in sources), target_w=1600, ratio=4/3.0):
+#       if isinstance(res, Exception): ...   # esa foto falló
+#
+# En las subidas lo llama blob_store.prepare_photos, solo con los originales que aún no tienen
+# el PHOTO_PROFILE de la ruta.
+#
+# - fn tiene que ser una función de módulo (se manda por nombre al proceso hijo) y recibir
+#   un fichero abierto como primer argumento; aquí se le pasa io.BytesIO(bytes).
+# - Ventana de 2 × procesos fotos en vuelo: los bytes se leen según se van enviando.
+# - Lotes de 1 foto, PHOTO_PROCESSES ≤ 1 o un pool roto (hijo muerto por OOM) → en el
+#   propio hilo, igual que antes.
+#
+# Variables de entorno:
+#   PHOTO_PROCESSES      procesos por worker (por defecto min(2, nº de CPUs); 0/1 = sin pool)
+#   PHOTO_POOL_START     forkserver|spawn|fork (por defecto forkserver si existe: no hereda
+#                        hilos ni conexiones del worker)
+#
+# Benchmark (20 fotos de 12 MP con 1, 2 y 4 procesos): la validación de la subida (probe del
+# PHOTO_PROFILE autofit, lo que corre prepare_photos) y las variantes full/thumb 4:3 que genera
+# image_variants con image_engine.render en la primera petición:
+#   python image_pool.py --bench
+
+import os, io, sys, time, logging, threading, importlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Iterator, Optional
+
+log = logging.getLogger("image_pool")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid = None
+_pool_size = 0
+_lock = threading.Lock()
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or str(default)).strip())
+    except Exception:
+        return default
+
+def processes() -> int:
+    return max(0, _int("PHOTO_PROCESSES", min(2, os.cpu_count() or 1)))
+
+def _context():
+    import multiprocessing as mp
+    method = (os.getenv("PHOTO_POOL_START") or "").strip().lower()
+    if not method:
+        method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    ctx = mp.get_context(method)
+    if method == "forkserver":
+        ctx.set_forkserver_preload(["image_pool", "PIL.Image", "PIL.JpegImagePlugin"])
+    return ctx
+
+def _executor(n: int) -> ProcessPoolExecutor:
+    global _pool, _pool_pid, _pool_size
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid() or _pool_size != n:
+            if _pool is not None and _pool_pid == os.getpid():
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=n, mp_context=_context())
+            _pool_pid, _pool_size = os.getpid(), n
+        return _pool
+
+def _reset():
+    global _pool
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def shutdown():
+    _reset()
+
+def _work(module: str, name: str, raw: bytes, kwargs: dict):
+    # en el proceso hijo: la función se resuelve por nombre (no se serializa código)
+    fn = getattr(importlib.import_module(module), name)
+    return fn(io.BytesIO(raw), **kwargs)
+
+def _local(fn: Callable, raw: bytes, kwargs: dict):
+    try:
+        return fn(io.BytesIO(raw), **kwargs)
+    except Exception as e:
+        return e
+
+def process_many(fn: Callable, blobs: Iterable[bytes], n: Optional[int] = None, **kwargs) -> Iterator:
+    """
+    fn(io.BytesIO(blob), **kwargs) para cada blob, en paralelo en procesos.
+    Devuelve un iterador con el resultado (o la excepción) de cada blob, en el orden de entrada.
+    """
+    n = processes() if n is None else n
+    it = iter(blobs)
+    first = next(it, None)
+    if first is None:
+        return
+    second = next(it, None)
+    if second is None or n <= 1:
+        yield _local(fn, first, kwargs)
+        if second is not None:
+            yield _local(fn, second, kwargs)
+            for raw in it:
+                yield _local(fn, raw, kwargs)
+        return
+
+    def _all():
+        yield first
+        yield second
+        yield from it
+
+    src = _all()
+    pool = _executor(n)
+    window = deque()   # (future, raw): raw se guarda por si hay que repetir en local
+    broken = False
+
+    def _submit():
+        raw = next(src, None)
+        if raw is None:
+            return False
+        window.append((pool.submit(_work, fn.__module__, fn.__name__, raw, kwargs), raw))
+        return True
+
+    try:
+        while len(window) < 2 * n and _submit():
+            pass
+        while window:
+            fut, raw = window.popleft()
+            if broken:
+                yield _local(fn, raw, kwargs)
+                continue
+            try:
+                yield fut.result()
+            except BrokenProcessPool:
+                log.warning("[image_pool] pool roto; sigo en el propio hilo")
+                broken = True
+                _reset()
+                yield _local(fn, raw, kwargs)
+                continue
+            except Exception as e:
+                yield e
+            _submit()
+        for raw in src:   # pool roto: lo que quede, en local
+            yield _local(fn, raw, kwargs)
+    finally:
+        for fut, _ in window:
+            fut.cancel()
+
+# ---------- Benchmark ----------
+def _sample(w: int, h: int, seed: int) -> bytes:
+    # ruido suave (no un color plano): JPEG de tamaño y coste de foto real
+    from PIL import Image
+    small = Image.effect_noise((w // 16, h // 16), 60 + seed % 40).convert("RGB")
+    im = small.resize((w, h), Image.BICUBIC)
+    b = io.BytesIO()
+    im.save(b, "JPEG", quality=90)
+    return b.getvalue()
+
+def render_variants(fp, widths: tuple, ratio: Optional[float] = None, quality: int = 84) -> dict:
+    """Variantes JPEG de esos anchos con image_engine.render, como las genera image_variants.get."""
+    from image_engine import Variant, render
+    return render(fp, [Variant(f"w{w}", w, quality=quality, progressive=w >= 800) for w in widths],
+                  ratio=ratio)
+
+def _bench(photos: int, procs: list, mp: float) -> dict:
+    import image_variants
+    from routes_uploads_rooms_autofit import FULL_W, THUMB_W, RATIO, PHOTO_PROFILE, probe_photo_autofit
+    ratio = image_variants.ratios()[RATIO]
+    stages = {
+        # subida: validación + medidas, lo que hace blob_store.prepare_photos con el perfil
+        "upload_probe": (probe_photo_autofit, {"target_w": FULL_W, "ratio": ratio}),
+        # primera petición de /img/<sha>?w=..&r=4:3 de cada tamaño de galería
+        "variants": (render_variants, {"widths": (FULL_W, THUMB_W), "ratio": ratio,
+                                       "quality": image_variants.QUALITY["jpeg"]}),
+    }
+    w = int((mp * 1e6 * 4 / 3) ** 0.5)
+    h = int(w * 3 / 4)
+    blobs = [_sample(w, h, i) for i in range(photos)]
+    out = {"photos": photos, "size": f"{w}x{h}", "mb_in": round(sum(map(len, blobs)) / 1e6, 1),
+           "cpus": os.cpu_count(), "profile": PHOTO_PROFILE, "stages": {}}
+    for stage, (fn, kwargs) in stages.items():
+        runs = []
+        for n in procs:
+            if n > 1:
+                list(process_many(fn, blobs[:2], n=n, **kwargs))   # arranque del pool fuera de la medida
+            t0 = time.perf_counter()
+            res = list(process_many(fn, blobs, n=n, **kwargs))
+            dt = time.perf_counter() - t0
+            errs = sum(isinstance(r, Exception) for r in res)
+            runs.append({"processes": n, "wall_s": round(dt, 2), "photos_per_s": round(photos / dt, 2),
+                         "errors": errs})
+            shutdown()
+        base = runs[0]["wall_s"]
+        for r in runs:
+            r["speedup"] = round(base / r["wall_s"], 2) if r["wall_s"] else None
+        out["stages"][stage] = runs
+    return out
+
+if __name__ == "__main__":
+    import argparse, json
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    ap = argparse.ArgumentParser(description="Benchmark del procesado de fotos en paralelo")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--photos", type=int, default=20)
+    ap.add_argument("--mp", type=float, default=12.0, help="megapíxeles por foto")
+    ap.add_argument("--procs", default="1,2,4")
+    args = ap.parse_args()
+    print(json.dumps(_bench(args.photos, [int(x) for x in args.procs.split(",")], args.mp), indent=2))
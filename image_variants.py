@@ -0,0 +1,232 @@
+# image_variants.py — Variantes de fotos bajo demanda con caché LRU en disco
+#
+# Las subidas ya no generan tamaños: guardan el original en blob_store (una decodificación
+# para validarlo, image_engine.probe) y las URLs de galería apuntan aquí:
+#
+#   GET /img/<sha256 del original>?w=480&r=4:3&fmt=auto
+#
+#   w     ancho máximo; se redondea hacia arriba a IMAGE_VARIANT_WIDTHS (nunca amplía)
+#   r     recorte centrado a esa proporción (IMAGE_VARIANT_RATIOS); sin r = proporción original
+#   fmt   jpeg|webp|avif|auto (por defecto auto: AVIF o WebP según Accept, si no JPEG)
+#
+# - La variante se genera en la primera petición (una decodificación en draft + una
+#   codificación) y se guarda en uploads/.variants/<versión>/<sha[:2]>/<sha>/<w>_<r>.<fmt>;
+#   las siguientes son un stat() y send_file/X-Accel como cualquier fichero de uploads.
+# - La caché es LRU acotada a IMAGE_CACHE_MAX_MB: cada acierto refresca el mtime (como mucho
+#   una vez por hora y fichero) y al pasarse del límite se borran los menos usados hasta
+#   quedar en el 90 %. Borrar la caché entera es seguro: se regenera sola.
+# - Mismo sha + parámetros = mismos bytes siempre → ETag fuerte e immutable; si cambia la
+#   receta (calidades, filtro), subir RECIPE y las URLs cacheadas dejan de coincidir.
+#
+# Variables de entorno:
+#   IMAGE_CACHE_MAX_MB      tamaño máximo de la caché de variantes (por defecto 1024)
+#   IMAGE_VARIANT_WIDTHS    anchos permitidos (por defecto 160,320,480,640,800,1024,1280,1600,2048)
+#   IMAGE_VARIANT_RATIOS    proporciones permitidas (por defecto 4:3,3:4,1:1,16:9,3:2)
+#   IMAGE_AVIF              0 = no ofrecer AVIF aunque el navegador lo acepte (por defecto 1)
+
+import os, re, time, logging, threading, mimetypes
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+
+import metrics
+from image_engine import Variant, render, can_encode
+
+log = logging.getLogger("image_variants")
+
+RECIPE = "v1"
+CACHE_ROOT = "uploads/.variants"   # bajo uploads/: la misma location interna de nginx (X-Accel) sirve
+QUALITY = {"jpeg": 84, "webp": 80, "avif": 55}
+EXT = {"jpeg": "jpg", "webp": "webp", "avif": "avif"}
+_SHA_RX = re.compile(r"^[0-9a-f]{64}$")
+_TOUCH_EVERY_S = 3600
+
+mimetypes.add_type("image/avif", ".avif")   # send_file lo adivina por extensión
+mimetypes.add_type("image/webp", ".webp")
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+_evict_lock = threading.Lock()
+_approx_bytes: Optional[int] = None   # estimación por worker; se recalcula al recorrer la caché
+_writes_since_scan = 0
+
+metrics.describe("spainroom_image_variants_total", "counter", "Peticiones de variantes de imagen por formato y resultado de caché")
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or str(default)).strip())
+    except Exception:
+        return default
+
+def widths() -> List[int]:
+    raw = os.getenv("IMAGE_VARIANT_WIDTHS") or "160,320,480,640,800,1024,1280,1600,2048"
+    return sorted({int(x) for x in raw.split(",") if x.strip().isdigit() and int(x) > 0})
+
+def ratios() -> Dict[str, float]:
+    out = {}
+    for r in (os.getenv("IMAGE_VARIANT_RATIOS") or "4:3,3:4,1:1,16:9,3:2").split(","):
+        a, _, b = r.strip().partition(":")
+        if a.isdigit() and b.isdigit() and int(a) and int(b):
+            out[f"{int(a)}:{int(b)}"] = int(a) / float(b)
+    return out
+
+def snap_width(w: Optional[int]) -> int:
+    ws = widths()
+    if not w:
+        return ws[-1]
+    return next((x for x in ws if x >= w), ws[-1])
+
+def url(sha: str, w: Optional[int] = None, r: Optional[str] = None, fmt: Optional[str] = None) -> str:
+    """URL de la variante (la que guardan galería y tarjetas)."""
+    q = [f"w={snap_width(w)}"]
+    if r:
+        q.append(f"r={r}")
+    if fmt and fmt != "auto":
+        q.append(f"fmt={fmt}")
+    return f"/img/{sha}?" + "&".join(q)
+
+def negotiate(fmt: Optional[str], accept: str) -> Tuple[Optional[str], bool]:
+    """(formato, depende de Accept). None si el formato pedido no existe o no se puede codificar."""
+    fmt = (fmt or "auto").strip().lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt != "auto":
+        return (fmt if fmt in EXT and can_encode(fmt) else None), False
+    accept = (accept or "").lower()
+    if "image/avif" in accept and _int("IMAGE_AVIF", 1) and can_encode("avif"):
+        return "avif", True
+    if "image/webp" in accept and can_encode("webp"):
+        return "webp", True
+    return "jpeg", True
+
+def cache_rel(sha: str, w: int, r: Optional[str], fmt: str) -> str:
+    tag = r.replace(":", "x") if r else "orig"
+    return f"{CACHE_ROOT}/{RECIPE}/{sha[:2]}/{sha}/{w}_{tag}.{EXT[fmt]}"
+
+def etag(sha: str, w: int, r: Optional[str], fmt: str) -> str:
+    return f"{sha}:{RECIPE}:{w}:{r or 'orig'}:{fmt}"
+
+def _abs(rel: str) -> str:
+    return os.path.join(current_app.instance_path, *rel.split("/"))
+
+def _source(sha: str) -> Optional[str]:
+    """
+    Original del blob; en blobs anteriores a las variantes bajo demanda, la variante full más grande.
+    Solo uploads/blobs: los documentos de uploads/private no tienen variantes.
+    """
+    d = _abs(f"uploads/blobs/{sha[:2]}/{sha}")
+    if not os.path.isdir(d):
+        return None
+    best, best_size = None, -1
+    for entry in os.scandir(d):
+        if entry.is_file() and entry.name.startswith("original."):
+            return entry.path
+        if entry.is_dir():
+            p = os.path.join(entry.path, "full.jpg")
+            if os.path.exists(p) and os.path.getsize(p) > best_size:
+                best, best_size = p, os.path.getsize(p)
+    return best
+
+def _key_lock(key: str) -> threading.Lock:
+    with _locks_guard:
+        if len(_locks) > 256:
+            _locks.clear()   # solo evita trabajo duplicado en el mismo worker
+        return _locks.setdefault(key, threading.Lock())
+
+def _touch(path: str, st) -> None:
+    if time.time() - st.st_mtime > _TOUCH_EVERY_S:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+def get(sha: str, w: int, r: Optional[str], fmt: str) -> Optional[str]:
+    """
+    Ruta absoluta de la variante (generándola si no está en caché), o None si el blob
+    no existe. ValueError/OSError si el original no es una imagen válida.
+    """
+    if not _SHA_RX.match(sha):
+        return None
+    path = _abs(cache_rel(sha, w, r, fmt))
+    try:
+        _touch(path, os.stat(path))
+        metrics.inc("spainroom_image_variants_total", {"fmt": fmt, "cache": "hit"})
+        return path
+    except FileNotFoundError:
+        pass
+    with _key_lock(path):
+        if os.path.exists(path):   # la ha generado otro hilo mientras esperábamos
+            return path
+        src = _source(sha)
+        if src is None:
+            return None
+        t0 = time.perf_counter()
+        out = render(src, [Variant("v", w, formats=(fmt,), quality=QUALITY[fmt],
+                                   progressive=(fmt == "jpeg" and w >= 800))],
+                     ratio=ratios().get(r) if r else None)
+        data = out["variants"]["v"][fmt]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        metrics.inc("spainroom_image_variants_total", {"fmt": fmt, "cache": "miss"})
+        log.info("[img] %s w=%s r=%s %s: %d bytes en %.0f ms", sha[:12], w, r, fmt, len(data),
+                 (time.perf_counter() - t0) * 1000)
+    _account(len(data))
+    return path
+
+# ---------- LRU ----------
+def _account(n: int) -> None:
+    global _approx_bytes, _writes_since_scan
+    limit = _int("IMAGE_CACHE_MAX_MB", 1024) * 1024 * 1024
+    with _evict_lock:
+        _writes_since_scan += 1
+        if _approx_bytes is not None:
+            _approx_bytes += n
+        # los demás workers también escriben: se recorre de vez en cuando aunque la estimación no llegue
+        if _approx_bytes is not None and _approx_bytes <= limit and _writes_since_scan < 200:
+            return
+        _writes_since_scan = 0
+    evict(limit)
+
+def evict(limit: Optional[int] = None) -> dict:
+    """Borra las variantes menos usadas (mtime) hasta dejar la caché en el 90 % de `limit`."""
+    global _approx_bytes
+    limit = limit if limit is not None else _int("IMAGE_CACHE_MAX_MB", 1024) * 1024 * 1024
+    root = _abs(CACHE_ROOT)
+    files = []
+    for dirpath, _, names in os.walk(root):
+        for n in names:
+            p = os.path.join(dirpath, n)
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+    total = sum(f[1] for f in files)
+    removed = 0
+    if total > limit:
+        target = int(limit * 0.9)
+        for mtime, size, p in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.unlink(p)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+    with _evict_lock:
+        _approx_bytes = total
+    return {"files": len(files) - removed, "bytes": total, "removed": removed}
+
+if __name__ == "__main__":
+    import sys
+    if "--evict" not in sys.argv[1:]:
+        print("uso: python image_variants.py --evict   (aplica IMAGE_CACHE_MAX_MB a la caché de variantes)")
+        sys.exit(2)
+    from app import create_app
+    application = create_app()
+    with application.app_context():
+        print(evict())
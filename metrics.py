@@ -0,0 +1,351 @@
+# metrics.py — Métricas HTTP por endpoint (latencia, throughput, en curso) y /metrics Prometheus
+#
+# Cada worker de gunicorn acumula sus contadores en memoria (coste por petición: un
+# perf_counter y un par de sumas con lock) y cada METRICS_FLUSH_SECS los vuelca a un
+# fichero JSON propio en METRICS_DIR (escritura atómica). /metrics lee los ficheros
+# de todos los workers y los suma, así da igual a qué worker le toque responder.
+#
+# Un worker que termina (reinicio, max_requests, kill -9) no debe dejar su fichero para
+# siempre ni hacer bajar los contadores: sus contadores/histogramas se suman a dead.json
+# y su fichero se borra (mark_process_dead). Lo hace el hook child_exit de gunicorn
+# (gunicorn.conf.py) y, si no llegó a correr, el siguiente /metrics que lo vea muerto.
+# Las carpetas por defecto de másters que ya no existen se borran al crear la nueva.
+#
+# Uso:
+#   import metrics
+#   metrics.init_metrics(app)          # hooks + GET /metrics
+#   metrics.inc("spainroom_x_total", {"k": "v"})
+#   metrics.observe("spainroom_x_seconds", {"k": "v"}, 0.012)
+#
+# Variables de entorno:
+#   METRICS_DIR          carpeta compartida entre workers (por defecto <tmp>/spainroom-metrics/<pid master>)
+#   METRICS_FLUSH_SECS   cada cuánto vuelca un worker (por defecto 1)
+#   METRICS_TOKEN        /metrics exige ?token= o cabecera X-Metrics-Token; sin definir, /metrics responde 403
+#   METRICS_ENABLED      0 = no instala nada (por defecto 1)
+
+import os, json, time, atexit, shutil, tempfile, threading, contextlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import request, g, Response
+
+# Buckets de latencia (segundos)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_HELP: Dict[str, Tuple[str, str]] = {
+    "spainroom_http_requests_total": ("counter", "Peticiones HTTP por regla, método y clase de estado"),
+    "spainroom_http_request_duration_seconds": ("histogram", "Latencia de peticiones HTTP por regla"),
+    "spainroom_http_requests_in_flight": ("gauge", "Peticiones HTTP en curso"),
+}
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, tuple], float] = {}
+_hists: Dict[Tuple[str, tuple], list] = {}          # [b0..bn, +Inf, sum, count]
+_gauges: Dict[Tuple[str, tuple], float] = {}
+_collectors: List[Callable[[], list]] = []
+_last_flush = 0.0
+_dir: Optional[str] = None
+DEAD_FILE = "dead.json"   # contadores e histogramas acumulados de workers que ya no existen
+_DEAD_KEEP = 1024          # pids fusionados que se recuerdan (fusión idempotente)
+
+def _env(name: str, default: str = "") -> str:
+    return (os.getenv(name) or default).strip()
+
+def _flush_secs() -> float:
+    try:
+        return float(_env("METRICS_FLUSH_SECS", "1"))
+    except Exception:
+        return 1.0
+
+def describe(name: str, kind: str, help_text: str):
+    """Registra TYPE/HELP de una métrica (counter|gauge|histogram)."""
+    _HELP[name] = (kind, help_text)
+
+def add_collector(fn: Callable[[], list]):
+    """fn() -> [(name, labels_dict, valor_acumulado)] leído en cada volcado (contadores por proceso)."""
+    _collectors.append(fn)
+
+def _key(name: str, labels: Optional[dict]) -> Tuple[str, tuple]:
+    return name, tuple(sorted((labels or {}).items()))
+
+def inc(name: str, labels: Optional[dict] = None, value: float = 1.0):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0.0) + value
+
+def gauge_add(name: str, labels: Optional[dict] = None, value: float = 1.0):
+    k = _key(name, labels)
+    with _lock:
+        _gauges[k] = _gauges.get(k, 0.0) + value
+
+def observe(name: str, labels: Optional[dict], seconds: float):
+    k = _key(name, labels)
+    with _lock:
+        h = _hists.get(k)
+        if h is None:
+            h = _hists[k] = [0] * (len(BUCKETS) + 3)
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+# ---------- Volcado a disco (agregación entre workers) ----------
+def _dir_for(master_pid: int) -> str:
+    return _env("METRICS_DIR") or _env("PROMETHEUS_MULTIPROC_DIR") or \
+        os.path.join(tempfile.gettempdir(), "spainroom-metrics", str(master_pid))
+
+def metrics_dir() -> str:
+    global _dir
+    if _dir is None:
+        # los workers comparten el pid del máster de gunicorn
+        d = _dir_for(os.getppid())
+        if not os.path.isdir(d) and not (_env("METRICS_DIR") or _env("PROMETHEUS_MULTIPROC_DIR")):
+            _prune_masters(os.path.dirname(d))
+        os.makedirs(d, exist_ok=True)
+        _dir = d
+    return _dir
+
+def _prune_masters(parent: str):
+    """Borra las carpetas por defecto de másters que ya no existen."""
+    try:
+        names = os.listdir(parent)
+    except OSError:
+        return
+    for name in names:
+        if name.isdigit() and not _pid_alive(int(name)):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+def _snapshot() -> dict:
+    with _lock:
+        counters = [[n, list(l), v] for (n, l), v in _counters.items()]
+        hists = [[n, list(l), list(h)] for (n, l), h in _hists.items()]
+        gauges = [[n, list(l), v] for (n, l), v in _gauges.items()]
+    for fn in _collectors:
+        try:
+            for n, labels, v in fn():
+                counters.append([n, sorted(labels.items()), v])
+        except Exception:
+            pass
+    return {"pid": os.getpid(), "ts": time.time(), "counters": counters, "hists": hists, "gauges": gauges}
+
+def flush(force: bool = False):
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < _flush_secs():
+        return
+    _last_flush = now
+    try:
+        d = metrics_dir()
+        path = os.path.join(d, f"worker_{os.getpid()}.json")
+        _write_json(path, _snapshot())
+    except Exception:
+        pass
+
+def _write_json(path: str, data: dict):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, separators=(",", ":"))
+    os.replace(tmp, path)
+
+atexit.register(lambda: flush(force=True))
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except Exception:
+        return True
+
+def _read(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except Exception:
+        return None
+
+def _add(counters: dict, hists: dict, snap: dict):
+    for n, l, v in snap.get("counters", []):
+        k = (n, tuple(tuple(x) for x in l))
+        counters[k] = counters.get(k, 0.0) + v
+    for n, l, h in snap.get("hists", []):
+        k = (n, tuple(tuple(x) for x in l))
+        acc = hists.get(k)
+        if acc is None:
+            hists[k] = list(h)
+        else:
+            for i, x in enumerate(h):
+                acc[i] += x
+
+@contextlib.contextmanager
+def _dir_lock(d: str):
+    """Lock entre procesos sobre la carpeta (fusiones en dead.json de una en una)."""
+    try:
+        import fcntl
+    except ImportError:   # Windows: sin gunicorn, un solo proceso
+        yield
+        return
+    with open(os.path.join(d, ".lock"), "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+def mark_process_dead(pid: int, d: Optional[str] = None):
+    """Suma contadores/histogramas del worker `pid` (ya terminado) a dead.json y borra su fichero."""
+    d = d or metrics_dir()
+    path = os.path.join(d, f"worker_{pid}.json")
+    if not os.path.exists(path):
+        return
+    with _dir_lock(d):
+        snap = _read(path)
+        if snap is None:   # ya fusionado por otro proceso, o fichero roto
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+            return
+        dead = _read(os.path.join(d, DEAD_FILE)) or {}
+        merged = dead.get("merged") or {}
+        # si un fallo dejó el fichero después de fusionarlo, no se vuelve a sumar
+        if merged.get(str(pid)) != snap.get("ts"):
+            counters, hists = {}, {}
+            _add(counters, hists, dead)
+            _add(counters, hists, snap)
+            merged[str(pid)] = snap.get("ts")
+            _write_json(os.path.join(d, DEAD_FILE), {
+                "counters": [[n, [list(x) for x in l], v] for (n, l), v in counters.items()],
+                "hists": [[n, [list(x) for x in l], h] for (n, l), h in hists.items()],
+                "merged": dict(list(merged.items())[-_DEAD_KEEP:]),
+            })
+        os.unlink(path)
+
+def child_exit(server, worker):
+    """Hook de gunicorn (gunicorn.conf.py): corre en el máster cuando un worker termina."""
+    mark_process_dead(worker.pid, _dir_for(os.getpid()))
+
+def collect() -> dict:
+    """Suma los volcados de todos los workers y de dead.json (los gauges solo de workers vivos)."""
+    flush(force=True)
+    counters: Dict[Tuple[str, tuple], float] = {}
+    hists: Dict[Tuple[str, tuple], list] = {}
+    gauges: Dict[Tuple[str, tuple], float] = {}
+    d = metrics_dir()
+    for fn in os.listdir(d):
+        if not (fn.startswith("worker_") and fn.endswith(".json")):
+            continue
+        pid = fn[len("worker_"):-len(".json")]
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            mark_process_dead(int(pid), d)   # child_exit no llegó a correr (máster caído, kill -9...)
+            continue
+        snap = _read(os.path.join(d, fn))
+        if snap is None:
+            continue
+        _add(counters, hists, snap)
+        for n, l, v in snap.get("gauges", []):
+            k = (n, tuple(tuple(x) for x in l))
+            gauges[k] = gauges.get(k, 0.0) + v
+    _add(counters, hists, _read(os.path.join(d, DEAD_FILE)) or {})
+    return {"counters": counters, "hists": hists, "gauges": gauges}
+
+# ---------- Formato Prometheus ----------
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: tuple, extra: Optional[tuple] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in items) + "}"
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def render_prometheus(data: Optional[dict] = None) -> str:
+    data = data or collect()
+    by_name: Dict[str, list] = {}
+    for kind in ("counters", "gauges", "hists"):
+        for (n, l), v in data[kind].items():
+            by_name.setdefault(n, []).append((kind, l, v))
+    out = []
+    for name in sorted(by_name):
+        kind, help_text = _HELP.get(name, (None, ""))
+        rows = sorted(by_name[name], key=lambda r: r[1])
+        if not kind:
+            kind = {"counters": "counter", "gauges": "gauge", "hists": "histogram"}[rows[0][0]]
+        if help_text:
+            out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for src, l, v in rows:
+            if src != "hists":
+                out.append(f"{name}{_labels(l)} {_num(v)}")
+                continue
+            cum = 0
+            for i, b in enumerate(BUCKETS):
+                cum += v[i]
+                out.append(f"{name}_bucket{_labels(l, ('le', _num(b)))} {cum}")
+            cum += v[len(BUCKETS)]
+            out.append(f"{name}_bucket{_labels(l, ('le', '+Inf'))} {cum}")
+            out.append(f"{name}_sum{_labels(l)} {round(v[-2], 6)}")
+            out.append(f"{name}_count{_labels(l)} {_num(v[-1])}")
+    return "\n".join(out) + "\n"
+
+# ---------- Integración Flask ----------
+def _rule_labels() -> dict:
+    rule = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    return {"rule": rule, "method": request.method, "blueprint": request.blueprint or ""}
+
+def _services_http_collector():
+    import sys
+    sh = sys.modules.get("services_http")
+    if sh is None:
+        return []
+    rows = []
+    for prov, st in sh.stats().items():
+        rows.append(("spainroom_outbound_requests_total", {"provider": prov}, st["count"]))
+        rows.append(("spainroom_outbound_errors_total", {"provider": prov}, st["errors"] + st["http_5xx"]))
+        rows.append(("spainroom_outbound_duration_seconds_total", {"provider": prov}, st["lat_sum_ms"] / 1000.0))
+    return rows
+
+def init_metrics(app):
+    if _env("METRICS_ENABLED", "1").lower() in ("0", "false", "no", "off"):
+        return
+    if app.extensions.get("metrics"):
+        return
+    app.extensions["metrics"] = True
+    describe("spainroom_outbound_requests_total", "counter", "Llamadas salientes por proveedor (services_http)")
+    describe("spainroom_outbound_errors_total", "counter", "Errores salientes (excepción o 5xx) por proveedor")
+    describe("spainroom_outbound_duration_seconds_total", "counter", "Tiempo total en llamadas salientes por proveedor")
+    add_collector(_services_http_collector)
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_t0 = time.perf_counter()
+        gauge_add("spainroom_http_requests_in_flight", None, 1)
+
+    @app.after_request
+    def _metrics_status(resp):
+        g._metrics_status = resp.status_code
+        return resp
+
+    @app.teardown_request
+    def _metrics_end(exc):
+        t0 = g.pop("_metrics_t0", None)
+        if t0 is None:
+            return
+        gauge_add("spainroom_http_requests_in_flight", None, -1)
+        status = g.pop("_metrics_status", 500 if exc else 200)
+        labels = _rule_labels()
+        observe("spainroom_http_request_duration_seconds", labels, time.perf_counter() - t0)
+        labels["status"] = f"{status // 100}xx"
+        inc("spainroom_http_requests_total", labels)
+        flush()
+
+    @app.get("/metrics")
+    def metrics_endpoint():
+        # cerrado por defecto: nombres de rutas, proveedores y volumen no son públicos
+        token = _env("METRICS_TOKEN")
+        if not token or token not in (request.args.get("token"), request.headers.get("X-Metrics-Token")):
+            return Response("forbidden\n", status=403, mimetype="text/plain")
+        return Response(render_prometheus(), mimetype="text/plain; version=0.0.4; charset=utf-8")
@@ -28,3 +28,4 @@ class FranchiseUpload(db.Model):
     mime       = db.Column(db.String(80))
     size_bytes = db.Column(db.Integer)
     sha256     = db.Column(db.String(64))
+    blob_sha256 = db.Column(db.String(64), index=True)  # → blobs.sha256 (blob_store.py)
@@ -17,14 +17,97 @@ class Room(db.Model):
     notas      = db.Column(db.Text)
 
     published  = db.Column(db.Boolean, default=False, nullable=False)
-    images_json= db.Column(db.JSON)  # {gallery:[{url,thumb,w,h,sub_ref}], cover:{...}}
+    images_json= db.Column(db.JSON)  # {meta:{...}}; galería, zonas comunes y fichas en room_images
 
-    def to_dict(self, with_images=True):
+    # catálogo (/api/rooms/catalog): keyset por id dentro de published, con igualdad en ciudad/provincia
+    __table_args__ = (
+        db.Index("ix_rooms_pub_id", "published", "id"),
+        db.Index("ix_rooms_pub_ciudad_id", "published", "ciudad", "id"),
+        db.Index("ix_rooms_pub_provincia_id", "published", "provincia", "id"),
+        db.Index("ix_rooms_pub_precio", "published", "precio"),
+    )
+
+    def to_dict(self, with_images=True, images=None):
         d = dict(
             id=self.id, code=self.code, direccion=self.direccion, ciudad=self.ciudad,
             provincia=self.provincia, m2=self.m2, precio=self.precio, estado=self.estado,
             notas=self.notas, published=self.published
         )
         if with_images:
-            d["images"] = self.images_json or {}
+            # misma forma de siempre {gallery, cover, common, sheets, sheet, forms, meta}
+            if images is None:
+                import room_images
+                images = room_images.images_of(self)
+            d["images"] = images
         return d
+
+class RoomImage(db.Model):
+    """Foto de galería/zona común o ficha de una habitación (room_images.py compone images)."""
+    __tablename__ = "room_images"
+    id          = db.Column(db.Integer, primary_key=True)
+    room_id     = db.Column(db.Integer, db.ForeignKey("rooms.id", ondelete="CASCADE"), nullable=False)
+    created_at  = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    scope       = db.Column(db.String(16), nullable=False)             # gallery | common | sheet | form
+    common_type = db.Column(db.String(24), default="", nullable=False) # kitchen|bathroom|... (scope=common)
+    sort        = db.Column(db.Integer, default=0, nullable=False)
+
+    sha         = db.Column(db.String(64))     # el "sha" de la entrada (hex16 en fotos, sha256 en fichas)
+    url         = db.Column(db.String(300))
+    thumb       = db.Column(db.String(300))
+    w           = db.Column(db.Integer)
+    h           = db.Column(db.Integer)
+    sub_ref     = db.Column(db.String(40))
+    extra       = db.Column(db.JSON)           # resto de claves de la entrada (ratio, ts, form_id, type...)
+
+    __table_args__ = (
+        db.Index("ix_room_images_room_scope_sort", "room_id", "scope", "common_type", "sort"),
+    )
+
+class RoomCard(db.Model):
+    """Proyección compacta de Room para listados (room_cards.py la mantiene y la reconstruye)."""
+    __tablename__ = "room_cards"
+    room_id     = db.Column(db.Integer, db.ForeignKey("rooms.id", ondelete="CASCADE"), primary_key=True)
+    updated_at  = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    code        = db.Column(db.String(32))
+    direccion   = db.Column(db.String(240))
+    ciudad      = db.Column(db.String(120))
+    provincia   = db.Column(db.String(120))
+    m2          = db.Column(db.Integer)
+    precio      = db.Column(db.Integer)
+    estado      = db.Column(db.String(32))
+    published   = db.Column(db.Boolean, default=False, nullable=False)
+
+    cover_url   = db.Column(db.String(300))
+    cover_thumb = db.Column(db.String(300))
+    cover_w     = db.Column(db.Integer)
+    cover_h     = db.Column(db.Integer)
+    photo_count = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_room_cards_pub_id", "published", "room_id"),
+        db.Index("ix_room_cards_pub_ciudad_id", "published", "ciudad", "room_id"),
+        db.Index("ix_room_cards_pub_provincia_id", "published", "provincia", "room_id"),
+        db.Index("ix_room_cards_pub_precio", "published", "precio"),
+        db.Index("ix_room_cards_pub_m2", "published", "m2"),
+    )
+
+    def to_dict(self):
+        cover = None
+        if self.cover_url:
+            cover = dict(url=self.cover_url, thumb=self.cover_thumb, w=self.cover_w, h=self.cover_h)
+        return dict(
+            id=self.room_id, code=self.code, direccion=self.direccion, ciudad=self.ciudad,
+            provincia=self.provincia, m2=self.m2, precio=self.precio, estado=self.estado,
+            published=self.published, cover=cover, photos=int(self.photo_count or 0)
+        )
+
+class RoomGeo(db.Model):
+    """Coordenadas de Room + geohash para búsqueda por radio (room_geo.py la mantiene)."""
+    __tablename__ = "room_geo"
+    room_id     = db.Column(db.Integer, db.ForeignKey("rooms.id", ondelete="CASCADE"), primary_key=True)
+    lat         = db.Column(db.Float)
+    lon         = db.Column(db.Float)
+    geohash     = db.Column(db.String(12), index=True)   # precisión 9 (~5 m); NULL = sin coordenadas
+    source      = db.Column(db.String(16))               # sheet | centroid | none
@@ -16,3 +16,38 @@ class Upload(db.Model):
     width       = db.Column(db.Integer)
     height      = db.Column(db.Integer)
     sha256      = db.Column(db.String(64))
+    blob_sha256 = db.Column(db.String(64), index=True)   # → blobs.sha256 (blob_store.py), hash del original
+
+class PhotoJob(db.Model):
+    """Subida de fotos en segundo plano (photo_jobs.py): originales ya en disco, variantes pendientes."""
+    __tablename__ = "photo_jobs"
+    id          = db.Column(db.String(40), primary_key=True)            # PJ-<uuid hex>
+    created_at  = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at  = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    status      = db.Column(db.String(16), nullable=False, default="queued", index=True)  # queued|running|done|error
+    mode        = db.Column(db.String(16), nullable=False)   # plain|autofit (qué endpoint la creó)
+    room_id     = db.Column(db.Integer, nullable=False, index=True)
+    item_id     = db.Column(db.Integer, nullable=False)
+    options     = db.Column(db.JSON)                         # {scope, common_type}
+    files       = db.Column(db.JSON)                         # [{name, path} | {name, error}] en orden de subida
+    results     = db.Column(db.JSON)                         # igual que "uploaded" del modo síncrono
+    error       = db.Column(db.Text)
+
+    def to_dict(self):
+        files, results = self.files or [], self.results or []
+        return {"job_id": self.id, "status": self.status, "mode": self.mode,
+                "total": len(files), "done": len(results), "uploaded": results,
+                "error": self.error,
+                "created_at": self.created_at.isoformat() if self.created_at else None,
+                "updated_at": self.updated_at.isoformat() if self.updated_at else None}
+
+class Blob(db.Model):
+    """Contenido subido, direccionado por el sha256 del original (blob_store.py)."""
+    __tablename__ = "blobs"
+    sha256      = db.Column(db.String(64), primary_key=True)
+    created_at  = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    size_bytes  = db.Column(db.BigInteger)                   # tamaño del original
+    mime        = db.Column(db.String(80))
+    refcount    = db.Column(db.Integer, nullable=False, default=0)  # filas de uploads/franchise_uploads que lo usan
+    files       = db.Column(db.JSON)                         # {"original.pdf": {...}, "plain-v1/full.jpg": {size, sha, w, h}}
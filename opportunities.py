@@ -93,13 +93,13 @@ def create_lead():
     webhook = os.getenv("OPPORTUNITIES_WEBHOOK_URL")
     if webhook:
         try:
-            import requests  # solo cuando se usa
-            requests.post(
+            import services_http  # solo cuando se usa
+            services_http.post(
+                "opportunities",
                 webhook,
                 json={
                     "text": f"Nuevo lead ({lead.tipo}) — {lead.nombre} <{lead.email}> — {lead.telefono or '-'} — {lead.ciudad or '-'}"
                 },
-                timeout=5,
             )
         except Exception:
             # No rompemos el flujo si el webhook falla
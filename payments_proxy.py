@@ -0,0 +1,84 @@
+# payments_proxy.py — Proxy de checkout hacia backend-1 (streaming + circuit breaker)
+#
+# Sustituye a los dos proxy_checkout_* duplicados de app.py:
+#   - conexión reutilizada (services_http, proveedor "payments")
+#   - la respuesta de backend-1 se reenvía en streaming, sin cargarla entera en memoria
+#   - circuit breaker: tras PAY_CB_FAILS fallos seguidos (excepción o 5xx) se abre y
+#     durante PAY_CB_OPEN_SECS se responde al momento con un 503 precalculado, en vez
+#     de dejar cada thread de gunicorn esperando hasta 12 s a un backend-1 dormido.
+#
+# Variables de entorno:
+#   PAY_PROXY_BASE     (por defecto https://spainroom-backend-1.onrender.com)
+#   PAY_CB_FAILS       fallos seguidos para abrir (por defecto 5)
+#   PAY_CB_OPEN_SECS   segundos abierto antes de probar de nuevo (por defecto 30)
+
+import os, json
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+
+import services_http
+
+bp_pay_proxy = Blueprint("pay_proxy", __name__)
+
+PAY_PROXY_BASE = os.getenv("PAY_PROXY_BASE", "https://spainroom-backend-1.onrender.com").rstrip("/")
+CHUNK = 16 * 1024
+
+def _int_env(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+breaker = services_http.CircuitBreaker(
+    "payments",
+    fails=_int_env("PAY_CB_FAILS", 5),
+    open_secs=float(_int_env("PAY_CB_OPEN_SECS", 30)),
+)
+
+# 503 precalculado: mientras el breaker está abierto no se serializa nada por petición
+_UNAVAILABLE_BODY = json.dumps({"ok": False, "error": "payments_unavailable"}).encode("utf-8")
+
+# Cabeceras de backend-1 que se reenvían al cliente
+_PASS_HEADERS = ("Content-Type", "Cache-Control", "Location")
+
+def _unavailable():
+    return Response(_UNAVAILABLE_BODY, status=503, mimetype="application/json",
+                    headers={"Retry-After": str(breaker.retry_after())})
+
+def _proxy(path: str):
+    if not breaker.allow():
+        return _unavailable()
+    try:
+        r = services_http.post(
+            "payments",
+            f"{PAY_PROXY_BASE}{path}",
+            json=(request.get_json(silent=True) or {}),
+            headers={"Content-Type": "application/json"},
+            stream=True,
+        )
+    except Exception as e:
+        breaker.failure()
+        current_app.logger.warning(f"proxy payments error: {e}")
+        return jsonify(ok=False, error="proxy_error"), 502
+
+    if r.status_code >= 500:
+        breaker.failure()
+    else:
+        breaker.success()
+
+    def body():
+        try:
+            for chunk in r.iter_content(chunk_size=CHUNK):
+                if chunk:
+                    yield chunk
+        finally:
+            r.close()   # devuelve la conexión al pool
+
+    headers = {k: r.headers[k] for k in _PASS_HEADERS if k in r.headers}
+    headers.setdefault("Content-Type", "application/json")
+    return Response(stream_with_context(body()), status=r.status_code, headers=headers)
+
+@bp_pay_proxy.route("/create-checkout-session", methods=["POST", "OPTIONS"])
+@bp_pay_proxy.route("/api/payments/create-checkout-session", methods=["POST", "OPTIONS"])
+def proxy_checkout():
+    if request.method == "OPTIONS": return ("", 204)
+    return _proxy("/create-checkout-session")
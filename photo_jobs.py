@@ -0,0 +1,210 @@
+# photo_jobs.py — Cola de procesado de fotos de habitaciones (subida asíncrona)
+#
+# Con async=1 (form o query) o "Prefer: respond-async", /api/rooms/upload_photos solo
+# guarda los originales en blob_store, crea un PhotoJob y responde 202 con job_id; un pool
+# de hilos del worker (con el lote repartido en procesos, image_pool.py) valida cada foto
+# (las variantes se generan al pedirlas, image_variants.py) con el MISMO código que el modo
+# síncrono (prepare_photos / apply_photo / publish del módulo de rutas que creó el
+# trabajo) y al terminar actualiza galería, tarjeta y publicación.
+#
+#   GET /api/rooms/photo_jobs/<job_id>   → {status: queued|running|done|error, total, done, uploaded...}
+#
+# - Estado en la tabla photo_jobs (la consulta puede caer en otro worker de gunicorn; la crea la
+#   migración 0008_photo_jobs).
+# - Cada foto se aplica en su propia transacción con la habitación bloqueada (FOR UPDATE
+#   en Postgres): es una fila más en room_images, y el bloqueo mantiene el orden de la galería
+#   frente a otro trabajo o una subida síncrona a la misma habitación.
+# - Un trabajo sin avances en PHOTO_JOBS_STALE_S (worker reiniciado a medias) lo retoma
+#   el worker que atienda la siguiente consulta de estado, desde la primera foto pendiente.
+# - Los originales se conservan en su blob (original.<ext>) para reprocesar; una foto que
+#   ya tenga variantes del perfil no se vuelve a procesar.
+#
+# Variables de entorno:
+#   PHOTO_JOBS_WORKERS   hilos de procesado por worker (por defecto 2)
+#   PHOTO_JOBS_STALE_S   segundos sin avance para dar un trabajo por abandonado (por defecto 300)
+
+import os, uuid, logging, threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+from extensions import db
+from models_rooms import Room
+from models_contracts import ContractItem
+from models_uploads import PhotoJob
+import metrics
+import room_cards
+import room_images
+import blob_store
+
+log = logging.getLogger("photo_jobs")
+
+# modo → módulo de rutas con prepare_photos/apply_photo/publish (se importa al usarlo: esos módulos importan photo_jobs)
+MODES = {"plain": "routes_uploads_rooms",
+         "autofit": "routes_uploads_rooms_autofit"}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+metrics.describe("spainroom_photo_jobs_total", "counter", "Trabajos de fotos terminados por modo y estado")
+metrics.describe("spainroom_photo_job_files_total", "counter", "Fotos procesadas en segundo plano por resultado")
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or str(default)).strip())
+    except Exception:
+        return default
+
+def wants_async(req) -> bool:
+    v = (req.form.get("async") or req.args.get("async") or "").strip().lower()
+    if v in ("1", "true", "yes", "on"):
+        return True
+    return "respond-async" in (req.headers.get("Prefer") or "").lower()
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool, _pool_pid
+    with _pool_lock:
+        # gunicorn hace fork después de importar: cada worker necesita sus propios hilos
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=max(1, _int("PHOTO_JOBS_WORKERS", 2)),
+                                       thread_name_prefix="photo-job")
+            _pool_pid = os.getpid()
+        return _pool
+
+def _pipeline(mode: str):
+    import importlib
+    mod = importlib.import_module(MODES[mode])
+    return mod.prepare_photos, mod.apply_photo, mod.publish
+
+# ---------- encolar (hilo de la petición) ----------
+def enqueue(mode: str, contract, item, room, files, options: Optional[dict] = None,
+            allowed_ext=(".jpg", ".jpeg", ".png")) -> PhotoJob:
+    """Guarda los originales (blob_store), crea el trabajo (commit) y lo manda al pool. Devuelve el PhotoJob."""
+    entries = []
+    for fs in files:
+        name = secure_filename(fs.filename or "")
+        ext = os.path.splitext(name)[1].lower()
+        if ext not in allowed_ext:
+            entries.append({"name": name, "error": "ERR:bad_image_type"})
+            continue
+        blob = blob_store.put_stream(fs.stream, ext, fs.mimetype)   # por bloques, sin fs.read()
+        if blob is None:
+            entries.append({"name": name, "error": "ERR:invalid_image"})
+            continue
+        entries.append({"name": name, "path": blob["rel"], "blob": blob["blob"]})
+
+    job = PhotoJob(id="PJ-" + uuid.uuid4().hex, status="queued", mode=mode,
+                   room_id=room.id, item_id=item.id,
+                   options=dict(options or {}), files=entries, results=[])
+    db.session.add(job)
+    db.session.commit()
+    submit(job.id)
+    return job
+
+def submit(job_id: str):
+    _executor().submit(_run, current_app._get_current_object(), job_id)
+
+# ---------- consulta de estado ----------
+def get(job_id: str) -> Optional[PhotoJob]:
+    return db.session.get(PhotoJob, job_id)
+
+def _stale_before() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=_int("PHOTO_JOBS_STALE_S", 300))
+
+def resume_if_stale(job: PhotoJob) -> bool:
+    """Si el trabajo lleva PHOTO_JOBS_STALE_S sin avanzar (worker muerto), lo retoma este worker."""
+    if job.status not in ("queued", "running") or job.updated_at > _stale_before():
+        return False
+    log.warning("[photo_jobs] retomando %s (sin avances desde %s)", job.id, job.updated_at)
+    submit(job.id)
+    return True
+
+# ---------- procesado (hilos del pool) ----------
+def _claim(job_id: str) -> bool:
+    """queued (o running abandonado) → running; solo un hilo/worker gana."""
+    n = (db.session.query(PhotoJob)
+         .filter(PhotoJob.id == job_id,
+                 (PhotoJob.status == "queued") |
+                 ((PhotoJob.status == "running") & (PhotoJob.updated_at <= _stale_before())))
+         .update({"status": "running", "updated_at": datetime.utcnow()}, synchronize_session=False))
+    db.session.commit()
+    return n == 1
+
+def _locked(job_id: str):
+    """(job, room, item, contract) releídos con la habitación bloqueada hasta el commit."""
+    job = db.session.get(PhotoJob, job_id, populate_existing=True)
+    room = (db.session.query(Room).filter(Room.id == job.room_id)
+            .with_for_update().populate_existing().one())
+    item = db.session.get(ContractItem, job.item_id, populate_existing=True)
+    return job, room, item, item.contract
+
+def _original(app, rel_path: str) -> bytes:
+    try:
+        with open(os.path.join(app.instance_path, *rel_path.split("/")), "rb") as fh:
+            return fh.read()
+    except OSError:
+        return b""   # process() fallará con esa foto → ERR:invalid_image
+
+def _run(app, job_id: str):
+    with app.app_context():
+        mode = ""
+        try:
+            if not _claim(job_id):
+                return
+            job = db.session.get(PhotoJob, job_id)
+            mode = job.mode
+            prepare_photos, apply_photo, publish = _pipeline(job.mode)
+            opts = dict(job.options or {})
+            pending = list(job.files or [])[len(job.results or []):]
+            # decodificar y codificar fuera de la transacción (es lo lento), en varios núcleos;
+            # el original solo se lee del disco si su blob no tiene ya las variantes
+            prepared = prepare_photos(
+                (f["blob"], lambda p=f["path"]: _original(app, p)) if f.get("blob") else _original(app, f["path"])
+                for f in pending if not f.get("error"))
+            for f in pending:
+                photo, res = None, f.get("error")
+                if not res:
+                    _, photo = next(prepared)
+                    if isinstance(photo, Exception):
+                        log.warning("[photo_jobs] %s: no se pudo procesar %s: %s", job_id, f.get("name"), photo)
+                        photo, res = None, "ERR:invalid_image"
+                job, room, item, contract = _locked(job_id)
+                if photo is not None:
+                    try:
+                        rows = []
+                        res = apply_photo(contract, item, room, photo, rows, **opts)
+                        room_images.add(room, rows)
+                        room_cards.sync(room)
+                    except Exception:
+                        log.exception("[photo_jobs] %s: no se pudo guardar %s", job_id, f.get("name"))
+                        db.session.rollback()
+                        job, room, item, contract = _locked(job_id)
+                        res = "ERR:save_fail"
+                job.results = list(job.results or []) + [res]
+                job.updated_at = datetime.utcnow()
+                db.session.commit()
+                metrics.inc("spainroom_photo_job_files_total", {"result": "error" if res.startswith("ERR:") else "ok"})
+
+            job, room, item, contract = _locked(job_id)
+            publish(room, item, any(not r.startswith("ERR:") for r in job.results or []))
+            room_cards.sync(room)
+            job.status, job.updated_at = "done", datetime.utcnow()
+            db.session.commit()
+            metrics.inc("spainroom_photo_jobs_total", {"mode": mode, "status": "done"})
+        except Exception as e:
+            log.exception("[photo_jobs] %s falló", job_id)
+            db.session.rollback()
+            try:
+                db.session.query(PhotoJob).filter(PhotoJob.id == job_id).update(
+                    {"status": "error", "error": str(e)[:500], "updated_at": datetime.utcnow()},
+                    synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+            metrics.inc("spainroom_photo_jobs_total", {"mode": mode, "status": "error"})
+        finally:
+            db.session.remove()
@@ -0,0 +1,423 @@
+# rate_limit.py — Rate limit por token bucket compartido entre workers
+#
+# Un solo limitador para toda la app (sustituye al dict _rl de routes_contact y a
+# flask_limiter con memory:// de defense.py, que multiplicaban el límite por el nº de
+# workers y crecían sin tope):
+#   - políticas declaradas una vez en POLICIES ("1/2seconds", "20/10seconds", ...)
+#   - backend compartido: SQLite (fichero local, WAL; por defecto), Redis (opcional)
+#     o memoria (un solo proceso / tests)
+#   - tablas de claves acotadas (LRU): memoria con OrderedDict; SQLite/Redis con
+#     expiración por inactividad y poda de las más antiguas
+#   - una petición se comprueba contra todos sus buckets a la vez (take_all): si uno
+#     deniega no se descuenta de ninguno, así un cliente bloqueado no gasta su cupo horario
+#   - clave por cliente: request.remote_addr (ProxyFix de defense.py ya pone ahí la IP que
+#     añade el proxy); X-Forwarded-For y las cabeceras de auth las elige el cliente
+#
+# Uso:
+#   import rate_limit
+#   d = rate_limit.hit("contact", "opp:" + rate_limit.client_key(request))
+#   if not d.allowed: return jsonify(ok=False, error="rate_limited"), 429
+#
+#   rate_limit.init_rate_limits(app)     # límites globales + ráfaga por prefijo (ROUTE_POLICIES)
+#
+# Variables de entorno:
+#   RATE_LIMIT_URI        sqlite:///ruta.db (por defecto <tmp>/spainroom-ratelimit.db) | redis://... | memory://
+#                         (se acepta también LIMITER_STORAGE_URI, el nombre que usaba flask_limiter)
+#   RATE_LIMIT_MAX_KEYS   claves máximas por backend (por defecto 100000)
+#   RATE_LIMITS           límites globales por cliente (por defecto "200/minute, 2000/hour")
+#   RATE_LIMITS_BURST     ráfaga en /api/login, /api/admin/, /voice (por defecto "20/10seconds")
+#   RATE_LIMIT_ENABLED    0 = todo permitido (por defecto 1)
+#
+# Microbenchmark del backend:
+#   python rate_limit.py --bench [--uri memory://] [--threads 4] [--n 50000]
+
+import os, re, time, sqlite3, tempfile, threading
+from collections import OrderedDict, namedtuple
+from typing import Dict, List, Optional, Tuple
+
+Decision = namedtuple("Decision", "allowed remaining retry_after")
+Rate = namedtuple("Rate", "capacity per_sec text")
+
+_UNITS = {"s": 1, "sec": 1, "second": 1, "seconds": 1,
+          "m": 60, "min": 60, "minute": 60, "minutes": 60,
+          "h": 3600, "hour": 3600, "hours": 3600,
+          "d": 86400, "day": 86400, "days": 86400}
+_RATE_RE = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d*)\s*([a-z]+)\s*$", re.I)
+
+def _env(name: str, default: str = "") -> str:
+    return (os.getenv(name) or default).strip()
+
+def parse_rate(text: str) -> Rate:
+    """'20/10seconds' → Rate(capacity=20, per_sec=2.0). Acepta '/', 'per', s|minute|hour|day."""
+    m = _RATE_RE.match(text or "")
+    if not m or m.group(3).lower() not in _UNITS:
+        raise ValueError(f"rate inválido: {text!r}")
+    n = int(m.group(1))
+    period = int(m.group(2) or 1) * _UNITS[m.group(3).lower()]
+    return Rate(capacity=float(n), per_sec=n / float(period), text=text.strip())
+
+def parse_rates(text: str) -> List[Rate]:
+    return [parse_rate(x) for x in re.split(r"[;,]", text or "") if x.strip()]
+
+# ---------- Políticas (declaradas una vez) ----------
+POLICIES: Dict[str, List[Rate]] = {
+    "contact": parse_rates("1/2seconds"),                 # formularios de contacto, por IP+form
+    "global":  parse_rates(_env("RATE_LIMITS", "200/minute, 2000/hour")),
+    "burst":   parse_rates(_env("RATE_LIMITS_BURST", "20/10seconds")),
+}
+
+# prefijo de ruta → política adicional (además de "global")
+ROUTE_POLICIES: List[Tuple[str, str]] = [
+    ("/api/login", "burst"),
+    ("/api/admin/", "burst"),
+    ("/voice", "burst"),
+]
+
+# ---------- Backends ----------
+class MemoryBackend:
+    """Buckets en memoria del proceso (LRU acotado). Solo para un worker o tests."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._b: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: Rate, cost: float = 1.0, now: Optional[float] = None) -> Decision:
+        now = time.time() if now is None else now
+        with self._lock:
+            b = self._b.get(key)
+            if b is None:
+                b = [rate.capacity, now]
+                self._b[key] = b
+                if len(self._b) > self.max_keys:
+                    self._b.popitem(last=False)
+            else:
+                self._b.move_to_end(key)
+            tokens = min(rate.capacity, b[0] + (now - b[1]) * rate.per_sec)
+            b[1] = now
+            if tokens >= cost:
+                b[0] = tokens - cost
+                return Decision(True, b[0], 0.0)
+            b[0] = tokens
+            return Decision(False, tokens, (cost - tokens) / rate.per_sec)
+
+    def take_all(self, items: List[Tuple[str, Rate]], cost: float = 1.0, now: Optional[float] = None) -> Decision:
+        now = time.time() if now is None else now
+        with self._lock:
+            buckets = []
+            for key, rate in items:
+                b = self._b.get(key)
+                if b is None:
+                    b = self._b[key] = [rate.capacity, now]
+                else:
+                    self._b.move_to_end(key)
+                b[0] = min(rate.capacity, b[0] + (now - b[1]) * rate.per_sec)   # recarga: no consume
+                b[1] = now
+                buckets.append((b, rate))
+            while len(self._b) > self.max_keys:
+                self._b.popitem(last=False)
+            tokens = [b[0] for b, _ in buckets]
+            d = _decide(tokens, [r for _, r in items], cost)
+            if d.allowed:
+                for b, _ in buckets:
+                    b[0] -= cost
+            return d
+
+    def size(self) -> int:
+        return len(self._b)
+
+class SQLiteBackend:
+    """
+    Buckets en un fichero SQLite compartido por todos los workers de la máquina.
+    Cada comprobación es UNA sentencia UPSERT ... RETURNING (atómica, autocommit, WAL).
+    """
+
+    _UPSERT = (
+        "INSERT INTO rl_buckets(k, tokens, ts, ok) VALUES (?1, ?2 - ?3, ?4, 1) "
+        "ON CONFLICT(k) DO UPDATE SET "
+        "  ok = (min(?2, tokens + (?4 - ts) * ?5) >= ?3), "
+        "  tokens = min(?2, tokens + (?4 - ts) * ?5) - "
+        "           CASE WHEN min(?2, tokens + (?4 - ts) * ?5) >= ?3 THEN ?3 ELSE 0 END, "
+        "  ts = ?4 "
+        "RETURNING ok, tokens"
+    )
+    PRUNE_EVERY = 5000
+
+    def __init__(self, path: str, max_keys: int = 100_000):
+        self.path, self.max_keys = path, max_keys
+        self._local = threading.local()
+        self._ops = 0
+        self._returning = sqlite3.sqlite_version_info >= (3, 35, 0)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS rl_buckets ("
+            " k TEXT PRIMARY KEY, tokens REAL NOT NULL, ts REAL NOT NULL, ok INTEGER NOT NULL DEFAULT 1)")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS ix_rl_buckets_ts ON rl_buckets(ts)")
+
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            c = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=OFF")      # contadores efímeros: no merecen fsync
+            c.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = c
+        return c
+
+    def take(self, key: str, rate: Rate, cost: float = 1.0, now: Optional[float] = None) -> Decision:
+        now = time.time() if now is None else now
+        c = self._conn()
+        if self._returning:
+            ok, tokens = c.execute(self._UPSERT, (key, rate.capacity, cost, now, rate.per_sec)).fetchone()
+        else:
+            ok, tokens = self._take_txn(c, key, rate, cost, now)
+        self._ops += 1
+        if self._ops % self.PRUNE_EVERY == 0:
+            self.prune(now)
+        if ok:
+            return Decision(True, tokens, 0.0)
+        return Decision(False, tokens, (cost - tokens) / rate.per_sec)
+
+    def take_all(self, items: List[Tuple[str, Rate]], cost: float = 1.0, now: Optional[float] = None) -> Decision:
+        """Todos los buckets en una transacción IMMEDIATE: se descuenta de todos o de ninguno."""
+        if len(items) == 1:
+            return self.take(items[0][0], items[0][1], cost, now)
+        now = time.time() if now is None else now
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [k for k, _ in items]
+            rows = dict((k, (t, ts)) for k, t, ts in c.execute(
+                "SELECT k, tokens, ts FROM rl_buckets WHERE k IN (%s)" % ",".join("?" * len(keys)), keys))
+            tokens = []
+            for key, rate in items:
+                t, ts = rows.get(key, (rate.capacity, now))
+                tokens.append(min(rate.capacity, t + (now - ts) * rate.per_sec))
+            d = _decide(tokens, [r for _, r in items], cost)
+            spent = cost if d.allowed else 0.0
+            c.executemany("INSERT OR REPLACE INTO rl_buckets(k, tokens, ts, ok) VALUES (?, ?, ?, ?)",
+                          [(k, t - spent, now, int(d.allowed)) for k, t in zip(keys, tokens)])
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        self._ops += 1
+        if self._ops % self.PRUNE_EVERY == 0:
+            self.prune(now)
+        return d
+
+    def _take_txn(self, c, key, rate, cost, now):
+        # SQLite < 3.35 (sin RETURNING): misma lógica en una transacción IMMEDIATE
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            row = c.execute("SELECT tokens, ts FROM rl_buckets WHERE k = ?", (key,)).fetchone()
+            tokens = rate.capacity if row is None else min(rate.capacity, row[0] + (now - row[1]) * rate.per_sec)
+            ok = tokens >= cost
+            if ok:
+                tokens -= cost
+            c.execute("INSERT OR REPLACE INTO rl_buckets(k, tokens, ts, ok) VALUES (?, ?, ?, ?)",
+                      (key, tokens, now, int(ok)))
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        return ok, tokens
+
+    def prune(self, now: Optional[float] = None, idle_secs: float = 86400.0):
+        """Borra claves inactivas y, si aún sobran, las de uso más antiguo (LRU por ts)."""
+        now = time.time() if now is None else now
+        c = self._conn()
+        try:
+            c.execute("DELETE FROM rl_buckets WHERE ts < ?", (now - idle_secs,))
+            n = c.execute("SELECT count(*) FROM rl_buckets").fetchone()[0]
+            if n > self.max_keys:
+                c.execute("DELETE FROM rl_buckets WHERE k IN "
+                          "(SELECT k FROM rl_buckets ORDER BY ts LIMIT ?)", (n - self.max_keys,))
+        except sqlite3.OperationalError:
+            pass     # otro worker tiene el lock; ya podará él
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT count(*) FROM rl_buckets").fetchone()[0]
+
+class RedisBackend:
+    """Token bucket en Redis (script Lua atómico). Requiere el paquete `redis`."""
+
+    _LUA = """
+    local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+    local cap, cost, now, rate = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local t = tonumber(b[1]) or cap
+    local ts = tonumber(b[2]) or now
+    t = math.min(cap, t + (now - ts) * rate)
+    local ok = 0
+    if t >= cost then t = t - cost; ok = 1 end
+    redis.call('HSET', KEYS[1], 't', t, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(cap / rate) + 1)
+    return {ok, tostring(t)}
+    """
+
+    # todos o ninguno: ARGV = cost, now, cap1, rate1, cap2, rate2, ...
+    _LUA_ALL = """
+    local cost, now = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local tk, ok = {}, 1
+    for i, k in ipairs(KEYS) do
+      local cap, rate = tonumber(ARGV[1 + 2 * i]), tonumber(ARGV[2 + 2 * i])
+      local b = redis.call('HMGET', k, 't', 'ts')
+      local t = math.min(cap, (tonumber(b[1]) or cap) + (now - (tonumber(b[2]) or now)) * rate)
+      tk[i] = t
+      if t < cost then ok = 0 end
+    end
+    for i, k in ipairs(KEYS) do
+      local cap, rate = tonumber(ARGV[1 + 2 * i]), tonumber(ARGV[2 + 2 * i])
+      if ok == 1 then tk[i] = tk[i] - cost end
+      redis.call('HSET', k, 't', tk[i], 'ts', now)
+      redis.call('EXPIRE', k, math.ceil(cap / rate) + 1)
+      tk[i] = tostring(tk[i])
+    end
+    return {ok, tk}
+    """
+
+    def __init__(self, url: str):
+        import redis   # opcional
+        self.r = redis.Redis.from_url(url)
+        self._script = self.r.register_script(self._LUA)
+        self._script_all = self.r.register_script(self._LUA_ALL)
+
+    def take(self, key: str, rate: Rate, cost: float = 1.0, now: Optional[float] = None) -> Decision:
+        now = time.time() if now is None else now
+        ok, tokens = self._script(keys=[f"rl:{key}"], args=[rate.capacity, cost, now, rate.per_sec])
+        tokens = float(tokens)
+        if int(ok):
+            return Decision(True, tokens, 0.0)
+        return Decision(False, tokens, (cost - tokens) / rate.per_sec)
+
+    def take_all(self, items: List[Tuple[str, Rate]], cost: float = 1.0, now: Optional[float] = None) -> Decision:
+        now = time.time() if now is None else now
+        args = [cost, now]
+        for _, rate in items:
+            args += [rate.capacity, rate.per_sec]
+        ok, tokens = self._script_all(keys=[f"rl:{k}" for k, _ in items], args=args)
+        d = _decide([float(t) for t in tokens], [r for _, r in items], cost)
+        if int(ok):
+            # el script ya ha descontado: lo que queda es lo que devuelve
+            return Decision(True, min(float(t) for t in tokens), 0.0)
+        return d
+
+    def size(self) -> int:
+        return -1   # Redis expira las claves solo (EXPIRE = tiempo de recarga completa)
+
+def _decide(tokens: List[float], rates: List[Rate], cost: float) -> Decision:
+    """Decisión conjunta: permitida si todos los buckets tienen `cost` fichas (antes de descontar)."""
+    if all(t >= cost for t in tokens):
+        return Decision(True, min(t - cost for t in tokens), 0.0)
+    wait = max((cost - t) / r.per_sec for t, r in zip(tokens, rates) if t < cost)
+    return Decision(False, min(tokens), wait)
+
+def make_backend(uri: Optional[str] = None):
+    uri = (uri or _env("RATE_LIMIT_URI") or _env("LIMITER_STORAGE_URI")   # nombre antiguo (flask_limiter)
+           or "sqlite:///" + os.path.join(tempfile.gettempdir(), "spainroom-ratelimit.db"))
+    max_keys = int(_env("RATE_LIMIT_MAX_KEYS", "100000") or 100000)
+    if uri.startswith("memory://"):
+        return MemoryBackend(max_keys)
+    if uri.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(uri)
+    if uri.startswith("sqlite:///"):
+        return SQLiteBackend(uri[len("sqlite:///"):], max_keys)
+    raise ValueError(f"RATE_LIMIT_URI no soportada: {uri}")
+
+# ---------- API ----------
+_backend = None
+_backend_lock = threading.Lock()
+
+def backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    _backend = make_backend()
+                except Exception:
+                    # p.ej. redis:// sin el paquete instalado: mejor limitar por worker que no limitar
+                    _backend = MemoryBackend(int(_env("RATE_LIMIT_MAX_KEYS", "100000") or 100000))
+    return _backend
+
+def set_backend(b):
+    """Sustituye el backend (tests / benchmark)."""
+    global _backend
+    _backend = b
+
+def enabled() -> bool:
+    return _env("RATE_LIMIT_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+
+def hit_all(policies: List[str], key: str, cost: float = 1.0) -> Decision:
+    """
+    Consume `cost` fichas de cada límite de las políticas si TODOS lo permiten; si alguno
+    deniega no se descuenta de ninguno (retry_after = la espera del más restrictivo).
+    """
+    if not enabled():
+        return Decision(True, 0.0, 0.0)
+    items = [(f"{p}:{i}:{key}", rate) for p in policies for i, rate in enumerate(POLICIES[p])]
+    if not items:
+        return Decision(True, 0.0, 0.0)
+    return backend().take_all(items, cost, time.time())
+
+def hit(policy: str, key: str, cost: float = 1.0) -> Decision:
+    """hit_all() de una sola política."""
+    return hit_all([policy], key, cost)
+
+def client_key(request) -> str:
+    """
+    IP del cliente: request.remote_addr, que ProxyFix (defense.py) reescribe con la que añade
+    el proxy de confianza. No se usan X-Forwarded-For ni cabeceras de auth sin verificar: las
+    pone el cliente y con un valor distinto en cada petición nunca se le limitaría.
+    """
+    return "ip:" + (request.remote_addr or "")
+
+def init_rate_limits(app, route_policies: Optional[List[Tuple[str, str]]] = None):
+    """before_request: política "global" para todo y la de ROUTE_POLICIES por prefijo."""
+    from flask import request, jsonify
+    routes = ROUTE_POLICIES if route_policies is None else route_policies
+
+    @app.before_request
+    def _rate_limit_gate():
+        if request.method == "OPTIONS":
+            return None
+        policies = ["global"] + [pol for prefix, pol in routes if request.path.startswith(prefix)]
+        d = hit_all(policies, client_key(request))
+        if not d.allowed:
+            resp = jsonify(ok=False, error="rate_limited", message="Demasiadas solicitudes")
+            resp.status_code = 429
+            resp.headers["Retry-After"] = str(max(1, int(d.retry_after + 0.999)))
+            return resp
+        return None
+
+# ---------- Microbenchmark ----------
+def _bench(uri: str, threads: int, n: int, keys: int) -> dict:
+    b = make_backend(uri)
+    rate = parse_rate("100/second")
+    per = n // threads
+
+    def work(tid):
+        for i in range(per):
+            b.take(f"bench:{(tid * per + i) % keys}", rate)
+
+    ts = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts: t.start()
+    for t in ts: t.join()
+    dt = time.perf_counter() - t0
+    return {"uri": uri, "threads": threads, "checks": per * threads, "keys": keys,
+            "checks_per_sec": round(per * threads / dt), "table_size": b.size()}
+
+if __name__ == "__main__":
+    import argparse, json
+    ap = argparse.ArgumentParser(description="Microbenchmark del rate limiter")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--uri", action="append", help="backend(s) a medir (por defecto memory:// y sqlite temporal)")
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--n", type=int, default=50_000)
+    ap.add_argument("--keys", type=int, default=10_000)
+    args = ap.parse_args()
+    uris = args.uri or ["memory://", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="rl-bench-"), "rl.db")]
+    print(json.dumps([_bench(u, args.threads, args.n, args.keys) for u in uris], indent=2))
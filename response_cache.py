@@ -0,0 +1,253 @@
+# response_cache.py — Caché de respuestas GET con ETag fuerte e invalidación por eventos de modelo
+#
+# Para endpoints de lectura que el front y admin-lite.html consultan en bucle
+# (/api/rooms/published, /api/rooms/<id>/sheet, /api/admin/franquicia/summary|slots).
+#
+#   from response_cache import cached
+#
+#   @bp.get("/api/rooms/published")
+#   @cached("rooms")
+#   def list_published(): ...
+#
+# - Clave: endpoint + view_args + query string (+ hash de las cabeceras de `vary`,
+#   p.ej. X-Admin-Key, así una clave incorrecta nunca acierta una entrada buena).
+# - Se guarda el cuerpo ya serializado y un ETag fuerte (hash del contenido). Un acierto
+#   cuesta una búsqueda en dict + un stat() por etiqueta; con If-None-Match → 304 sin cuerpo.
+#   Como el ETag es hash del contenido, el 304 funciona aunque responda otro worker.
+# - Invalidación: cada etiqueta tiene una "generación" compartida entre workers (mtime_ns
+#   de un fichero vacío en RESPONSE_CACHE_DIR). Los eventos after_insert/update/delete de
+#   Room/RoomCard/RoomImage, ContractItem y FranchiseSlot (y los INSERT/UPDATE/DELETE masivos
+#   del ORM) apuntan las etiquetas en la sesión y al hacer commit se sube la generación →
+#   entradas viejas fuera.
+# - Escrituras por fuera del ORM (scripts, SQL a mano): invalidate("rooms") o el TTL.
+#
+# Variables de entorno:
+#   RESPONSE_CACHE_ENABLED     0 = desactivado (por defecto 1)
+#   RESPONSE_CACHE_DIR         carpeta compartida de generaciones (por defecto <tmp>/spainroom-cache/<pid master>)
+#   RESPONSE_CACHE_TTL         segundos máximos de una entrada aunque no haya escrituras (por defecto 300)
+#   RESPONSE_CACHE_MAX_ENTRIES entradas por worker (por defecto 512)
+#   RESPONSE_CACHE_MAX_MB      tamaño total de cuerpos por worker (por defecto 64)
+
+import os, time, hashlib, tempfile, threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Dict, Iterable, Optional, Tuple
+
+from flask import current_app, request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+import metrics
+
+# modelo → etiquetas que invalida (ContractItem cambia qué habitación se publica/ficha)
+WATCHED = (
+    ("models_rooms", "Room", ("rooms",)),
+    ("models_rooms", "RoomCard", ("rooms",)),
+    ("models_rooms", "RoomImage", ("rooms",)),
+    ("models_contracts", "ContractItem", ("rooms",)),
+    ("models_franchise_slots", "FranchiseSlot", ("franchise_slots",)),
+)
+
+_lock = threading.Lock()
+_entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+_bytes = 0
+_dir: Optional[str] = None
+_tags_by_class: Dict[type, Tuple[str, ...]] = {}
+_hooks_installed = False
+
+def _env(name: str, default: str = "") -> str:
+    return (os.getenv(name) or default).strip()
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int(_env(name, str(default)))
+    except Exception:
+        return default
+
+def enabled() -> bool:
+    return _env("RESPONSE_CACHE_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+
+class _Entry:
+    __slots__ = ("gens", "etag", "body", "mimetype", "expires")
+
+    def __init__(self, gens, etag, body, mimetype, expires):
+        self.gens = gens
+        self.etag = etag
+        self.body = body
+        self.mimetype = mimetype
+        self.expires = expires
+
+# ---------- generaciones (compartidas entre workers) ----------
+def cache_dir() -> str:
+    global _dir
+    if _dir is None:
+        d = _env("RESPONSE_CACHE_DIR")
+        if not d:
+            # los workers comparten el pid del máster de gunicorn
+            d = os.path.join(tempfile.gettempdir(), "spainroom-cache", str(os.getppid()))
+        os.makedirs(d, exist_ok=True)
+        _dir = d
+    return _dir
+
+def _tag_path(tag: str) -> str:
+    return os.path.join(cache_dir(), f"gen_{tag}")
+
+def generation(tag: str) -> int:
+    try:
+        return os.stat(_tag_path(tag)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def invalidate(*tags: str):
+    """Sube la generación de las etiquetas (todas las entradas que dependen de ellas caducan)."""
+    for tag in tags:
+        p = _tag_path(tag)
+        ns = time.time_ns()
+        try:
+            os.utime(p, ns=(ns, ns))
+        except FileNotFoundError:
+            with open(p, "a"):
+                pass
+            os.utime(p, ns=(ns, ns))
+        metrics.inc("spainroom_response_cache_invalidations_total", {"tag": tag})
+
+def clear():
+    """Vacía la caché de este worker (las generaciones no se tocan)."""
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _bytes = 0
+
+# ---------- almacén LRU por worker ----------
+def _get(key) -> Optional[_Entry]:
+    with _lock:
+        e = _entries.get(key)
+        if e is not None:
+            _entries.move_to_end(key)
+        return e
+
+def _put(key, entry: _Entry):
+    global _bytes
+    max_entries = _int("RESPONSE_CACHE_MAX_ENTRIES", 512)
+    max_bytes = _int("RESPONSE_CACHE_MAX_MB", 64) * 1024 * 1024
+    if len(entry.body) > max_bytes // 4:
+        return
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _bytes -= len(old.body)
+        _entries[key] = entry
+        _bytes += len(entry.body)
+        while _entries and (len(_entries) > max_entries or _bytes > max_bytes):
+            _, ev = _entries.popitem(last=False)
+            _bytes -= len(ev.body)
+
+def stats() -> dict:
+    with _lock:
+        return {"entries": len(_entries), "bytes": _bytes}
+
+# ---------- decorador ----------
+def _request_key(vary: Iterable[str]) -> tuple:
+    hv = tuple(hashlib.sha256((request.headers.get(h) or "").encode("utf-8")).hexdigest()[:16] for h in vary)
+    return (request.endpoint,
+            tuple(sorted((request.view_args or {}).items())),
+            tuple(sorted(request.args.items(multi=True))),
+            hv)
+
+def _respond(entry: _Entry, cache_control: str, result: str) -> Response:
+    metrics.inc("spainroom_response_cache_total", {"endpoint": request.endpoint or "", "result": result})
+    if request.if_none_match.contains(entry.etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(entry.body, mimetype=entry.mimetype)
+    resp.set_etag(entry.etag)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+def cached(*tags: str, vary: Tuple[str, ...] = (), private: bool = False):
+    """Cachea la respuesta 200 de un GET; se invalida cuando cambian las `tags`."""
+    cache_control = ("private, " if private else "") + "no-cache"
+
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET" or not current_app.extensions.get("response_cache"):
+                return fn(*args, **kwargs)
+            key = _request_key(vary)
+            # generación leída ANTES de consultar: si alguien escribe mientras tanto,
+            # la entrada nace ya caducada y no se sirve nunca
+            gens = tuple(generation(t) for t in tags)
+            now = time.monotonic()
+            e = _get(key)
+            if e is not None and e.gens == gens and e.expires > now:
+                return _respond(e, cache_control, "hit")
+
+            resp = current_app.make_response(fn(*args, **kwargs))
+            if resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed:
+                return resp
+            body = resp.get_data()
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+            e = _Entry(gens, etag, body, resp.mimetype, now + _int("RESPONSE_CACHE_TTL", 300))
+            _put(key, e)
+            return _respond(e, cache_control, "miss")
+        return wrapper
+    return deco
+
+# ---------- eventos de modelo ----------
+def _mark(session, tags: Iterable[str]):
+    if session is not None:
+        session.info.setdefault("_cache_tags", set()).update(tags)
+
+def _on_row_change(mapper, connection, target):
+    tags = _tags_by_class.get(type(target))
+    if tags:
+        _mark(object_session(target), tags)
+
+def _on_orm_execute(state):
+    # UPDATE/DELETE/INSERT masivos (session.execute(update(Model)...)) no disparan eventos por fila
+    if not (state.is_update or state.is_delete or state.is_insert):
+        return
+    mapper = state.bind_mapper
+    tags = _tags_by_class.get(mapper.class_) if mapper is not None else None
+    if tags:
+        _mark(state.session, tags)
+
+def _on_commit(session):
+    tags = session.info.pop("_cache_tags", None)
+    if tags:
+        try:
+            invalidate(*sorted(tags))
+        except Exception:
+            pass   # sin carpeta de generaciones queda el TTL
+
+def watch(model, *tags: str):
+    """Las escrituras de `model` (al hacer commit) invalidan `tags`."""
+    _tags_by_class[model] = tuple(tags)
+    for ev in ("after_insert", "after_update", "after_delete"):
+        if not event.contains(model, ev, _on_row_change):
+            event.listen(model, ev, _on_row_change)
+
+def _install_hooks():
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    import importlib
+    for mod, cls, tags in WATCHED:
+        try:
+            watch(getattr(importlib.import_module(mod), cls), *tags)
+        except Exception:
+            pass
+    event.listen(Session, "do_orm_execute", _on_orm_execute)
+    event.listen(Session, "after_commit", _on_commit)
+    _hooks_installed = True
+
+def init_response_cache(app):
+    if not enabled() or app.extensions.get("response_cache"):
+        return
+    _install_hooks()
+    cache_dir()
+    app.extensions["response_cache"] = True
+    metrics.describe("spainroom_response_cache_total", "counter", "Respuestas cacheadas por endpoint y resultado (hit|miss)")
+    metrics.describe("spainroom_response_cache_invalidations_total", "counter", "Invalidaciones por etiqueta")
+    metrics.describe("spainroom_response_cache_bytes", "gauge", "Bytes de cuerpos cacheados (suma de workers)")
+    metrics.add_collector(lambda: [("spainroom_response_cache_bytes", {}, stats()["bytes"])])
@@ -0,0 +1,99 @@
+# room_cards.py — Proyección room_cards (tarjeta de listado) mantenida al escribir
+#
+# Pintar una tarjeta de listado solo necesita código, ciudad, precio, m2 y la miniatura
+# de portada, pero la habitación arrastra galería, zonas comunes, histórico de fichas
+# y formularios (room_images). room_cards guarda lo justo en columnas planas:
+#
+#   - sync(room)   lo llaman los endpoints que tocan la habitación (fotos, ficha) antes
+#                  del commit; misma transacción que el cambio en rooms
+#   - fill(conn)   regenera la tabla entera desde rooms (portada y nº de fotos de room_images)
+#                  con la conexión dada: la usan la migración 0005 y rebuild()
+#
+# La tabla la crea y la llena la migración 0005_room_cards; las lecturas no hacen DDL.
+# Reconstrucción manual (BD sin alembic, o tarjetas descuadradas):
+#   python room_cards.py --rebuild
+
+import sys
+from typing import Optional
+
+from sqlalchemy import select
+
+from db_engine import no_statement_timeout
+from extensions import db
+from models_rooms import Room, RoomCard
+import room_images
+
+_ROOM_COLS = ("id", "code", "direccion", "ciudad", "provincia", "m2", "precio", "estado", "published")
+
+def cover_of(images: Optional[dict]) -> Optional[dict]:
+    """Portada compacta {url, thumb, w, h} a partir de images (room_images.images_of) o None."""
+    images = images or {}
+    c = images.get("cover") or next(iter(images.get("gallery") or []), None)
+    if not isinstance(c, dict) or not c.get("url"):
+        return None
+    return {"url": c.get("url"), "thumb": c.get("thumb") or c.get("url"), "w": c.get("w"), "h": c.get("h")}
+
+def card_values(room, summary=(None, 0)) -> dict:
+    """Valores de la tarjeta; summary = (primera foto, nº de fotos) de room_images.gallery_summary."""
+    first, n = summary
+    cover = cover_of({"cover": first}) or {}
+    return dict(
+        room_id=room.id, code=room.code, direccion=room.direccion, ciudad=room.ciudad,
+        provincia=room.provincia, m2=room.m2, precio=room.precio, estado=room.estado,
+        published=bool(room.published),
+        cover_url=cover.get("url"), cover_thumb=cover.get("thumb"),
+        cover_w=cover.get("w"), cover_h=cover.get("h"),
+        photo_count=n,
+    )
+
+def sync(room):
+    """
+    Actualiza (o crea) la tarjeta de `room` en la sesión actual; el commit lo hace quien llama.
+    Solo escribe en room_cards: no marca nada de rooms como modificado.
+    """
+    if room.id is None:
+        db.session.flush()
+    vals = card_values(room, room_images.gallery_summary([room.id]).get(room.id, (None, 0)))
+    card = db.session.get(RoomCard, room.id)
+    if card is None:
+        db.session.add(RoomCard(**vals))
+    else:
+        for k, v in vals.items():
+            setattr(card, k, v)
+    return card
+
+def fill(conn, batch: int = 1000) -> int:
+    """Borra y regenera room_cards desde rooms con `conn` (sin commit). Devuelve nº de tarjetas."""
+    rooms, cards = Room.__table__, RoomCard.__table__
+    conn.execute(cards.delete())
+    total, last_id = 0, 0
+    cols = [rooms.c[n] for n in _ROOM_COLS]
+    while True:
+        # filas sueltas: card_values() solo lee atributos
+        rows = conn.execute(select(*cols).where(rooms.c.id > last_id)
+                            .order_by(rooms.c.id).limit(batch)).fetchall()
+        if not rows:
+            break
+        summary = room_images.gallery_summary([r.id for r in rows], conn)
+        conn.execute(cards.insert(), [card_values(r, summary.get(r.id, (None, 0))) for r in rows])
+        total += len(rows)
+        last_id = rows[-1].id
+    return total
+
+def rebuild(batch: int = 1000) -> int:
+    """Regenera room_cards en la sesión actual y hace commit (CLI --rebuild)."""
+    conn = db.session.connection()
+    no_statement_timeout(conn)   # recorre todas las habitaciones: sin el límite del servicio web
+    n = fill(conn, batch)
+    db.session.commit()
+    return n
+
+if __name__ == "__main__":
+    if "--rebuild" not in sys.argv[1:]:
+        print("uso: python room_cards.py --rebuild")
+        sys.exit(2)
+    from app import create_app
+    application = create_app()
+    with application.app_context():
+        n = rebuild()
+        print(f"room_cards: {n} tarjetas regeneradas")
@@ -0,0 +1,254 @@
+# room_geo.py — Coordenadas de habitaciones + índice geohash para "habitaciones a R km"
+#
+# Cada Room tiene una fila en room_geo (lat, lon, geohash de precisión 9, source):
+#   1. sheet     lat/lon de la ficha (images_json.meta.lat/lon, routes_rooms_sheet_json)
+#   2. centroid  centroide del municipio (ciudad + provincia) leído de GEO_CENTROIDS_CSV
+#                (provincia,municipio,lat,lon); sin CSV con coordenadas no hay fallback
+#   3. none      sin coordenadas (geohash NULL, no sale en búsquedas por radio)
+#
+# Búsqueda: se elige la precisión de geohash cuya celda mide ≥ R km, y solo se leen las
+# habitaciones de la celda del punto y sus 8 vecinas (9 rangos por prefijo sobre el índice
+# de geohash). Después distancia exacta (haversine), filtro ≤ R y orden por distancia.
+#
+# Mantenimiento: init_geo(app) engancha after_insert/update/delete de Room (misma
+# transacción). La tabla la crea y la llena la migración 0007_room_geo; las búsquedas y
+# escrituras no hacen DDL. Reconstrucción (BD sin alembic, o CSV de centroides nuevo):
+#   python room_geo.py --rebuild
+#
+# Variables de entorno:
+#   GEO_CENTROIDS_CSV   CSV provincia,municipio,lat,lon (por defecto municipios_coords.csv junto al código)
+
+import os, csv, math, sys, logging
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, or_, and_, select
+
+from db_engine import no_statement_timeout
+from extensions import db
+from models_rooms import Room, RoomGeo
+
+log = logging.getLogger("room_geo")
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+EARTH_KM = 6371.0088
+PRECISION = 9
+MAX_RADIUS_KM = 500.0
+
+_centroids: Optional[Dict[Tuple[str, str], Tuple[float, float]]] = None
+_hooks_installed = False
+
+# ---------- geohash ----------
+def encode(lat: float, lon: float, precision: int = PRECISION) -> str:
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch, lon_lo = (ch << 1) | 1, mid
+            else:
+                ch, lon_hi = ch << 1, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch, lat_lo = (ch << 1) | 1, mid
+            else:
+                ch, lat_hi = ch << 1, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(out)
+
+def bounds(gh: str) -> Tuple[float, float, float, float]:
+    """(lat_lo, lat_hi, lon_lo, lon_hi) de la celda."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in gh:
+        v = _DECODE[c]
+        for shift in range(4, -1, -1):
+            bit = (v >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lat_hi, lon_lo, lon_hi
+
+def neighbours(gh: str) -> List[str]:
+    """La celda y sus 8 vecinas (misma precisión), sin duplicados."""
+    lat_lo, lat_hi, lon_lo, lon_hi = bounds(gh)
+    dlat, dlon = lat_hi - lat_lo, lon_hi - lon_lo
+    clat, clon = (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
+    out = []
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            la = clat + i * dlat
+            if not -90.0 < la < 90.0:
+                continue
+            lo = (clon + j * dlon + 180.0) % 360.0 - 180.0
+            c = encode(la, lo, len(gh))
+            if c not in out:
+                out.append(c)
+    return out
+
+def cell_km(precision: int, lat: float) -> Tuple[float, float]:
+    """(alto, ancho) en km de una celda de esa precisión a esa latitud."""
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    h = 180.0 / (1 << lat_bits) * 111.32
+    w = 360.0 / (1 << lon_bits) * 111.32 * max(math.cos(math.radians(lat)), 0.01)
+    return h, w
+
+def precision_for(radius_km: float, lat: float) -> int:
+    """Mayor precisión cuya celda mide ≥ R en ambos ejes (las 9 celdas cubren el círculo)."""
+    for p in range(PRECISION, 0, -1):
+        if min(cell_km(p, lat)) >= radius_km:
+            return p
+    return 1
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_KM * math.asin(min(1.0, math.sqrt(a)))
+
+# ---------- fuentes de coordenadas ----------
+def _key(prov, muni) -> Tuple[str, str]:
+    from room_search import fold
+    return fold(str(prov or "")).strip(), fold(str(muni or "")).strip()
+
+def centroids() -> Dict[Tuple[str, str], Tuple[float, float]]:
+    global _centroids
+    if _centroids is None:
+        path = (os.getenv("GEO_CENTROIDS_CSV") or "").strip() or \
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "municipios_coords.csv")
+        out = {}
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as fh:
+                for r in csv.DictReader(fh):
+                    try:
+                        out[_key(r.get("provincia"), r.get("municipio"))] = (float(r["lat"]), float(r["lon"]))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+        except OSError:
+            pass
+        _centroids = out
+    return _centroids
+
+def _valid(lat, lon) -> Optional[Tuple[float, float]]:
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0:
+        return lat, lon
+    return None
+
+def coords_for(room) -> Tuple[Optional[float], Optional[float], str]:
+    meta = (room.images_json or {}).get("meta") or {}
+    ll = _valid(meta.get("lat"), meta.get("lon"))
+    if ll:
+        return ll[0], ll[1], "sheet"
+    ll = centroids().get(_key(room.provincia, room.ciudad))
+    if ll:
+        return ll[0], ll[1], "centroid"
+    return None, None, "none"
+
+def geo_values(room) -> dict:
+    lat, lon, source = coords_for(room)
+    return dict(room_id=room.id, lat=lat, lon=lon, source=source,
+                geohash=encode(lat, lon) if lat is not None else None)
+
+# ---------- mantenimiento ----------
+_T = RoomGeo.__table__
+
+def _write(connection, room, insert: bool = True):
+    connection.execute(_T.delete().where(_T.c.room_id == room.id))
+    if insert:
+        connection.execute(_T.insert(), [geo_values(room)])
+
+def _on_change(mapper, connection, target, insert=True):
+    try:
+        if connection.dialect.name == "postgresql":
+            with connection.begin_nested():   # un fallo aquí no aborta la transacción
+                _write(connection, target, insert)
+        else:
+            _write(connection, target, insert)
+    except Exception as e:
+        log.warning("[geo] no se pudo actualizar room %s: %s", target.id, e)
+
+def _on_delete(mapper, connection, target):
+    _on_change(mapper, connection, target, insert=False)
+
+def init_geo(app=None):
+    """Engancha room_geo a las escrituras de Room (idempotente)."""
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    event.listen(Room, "after_insert", _on_change)
+    event.listen(Room, "after_update", _on_change)
+    event.listen(Room, "after_delete", _on_delete)
+    _hooks_installed = True
+
+def fill(conn, batch: int = 1000) -> int:
+    """Vacía y regenera room_geo desde rooms con `conn` (sin commit). Devuelve nº de filas."""
+    conn.execute(_T.delete())
+    rooms = Room.__table__
+    cols = [rooms.c[n] for n in ("id", "ciudad", "provincia", "images_json")]
+    total, last_id = 0, 0
+    while True:
+        rows = conn.execute(select(*cols).where(rooms.c.id > last_id)
+                            .order_by(rooms.c.id).limit(batch)).fetchall()
+        if not rows:
+            break
+        conn.execute(_T.insert(), [geo_values(r) for r in rows])
+        total += len(rows)
+        last_id = rows[-1].id
+    return total
+
+def rebuild(batch: int = 1000) -> int:
+    """Regenera room_geo en la sesión actual y hace commit (CLI --rebuild)."""
+    conn = db.session.connection()
+    no_statement_timeout(conn)   # recorre todas las habitaciones: sin el límite del servicio web
+    n = fill(conn, batch)
+    db.session.commit()
+    return n
+
+# ---------- consulta ----------
+def near(lat: float, lon: float, radius_km: float, limit: int = 100, published_only: bool = True):
+    """[(room_id, distancia_km)] a ≤ radius_km de (lat, lon), de más cerca a más lejos."""
+    p = precision_for(radius_km, lat)
+    cells = neighbours(encode(lat, lon, p))
+    # prefijo p → rango [p, p+"{") sobre el índice ("{" va justo después de "z" en ASCII)
+    ranges = [and_(RoomGeo.geohash >= c, RoomGeo.geohash < c + "{") for c in cells]
+    q = db.session.query(RoomGeo.room_id, RoomGeo.lat, RoomGeo.lon).filter(or_(*ranges))
+    hits = []
+    for rid, la, lo in q:
+        d = haversine_km(lat, lon, la, lo)
+        if d <= radius_km:
+            hits.append((rid, d))
+    hits.sort(key=lambda x: (x[1], x[0]))
+    if published_only and hits:
+        # aparte y no con JOIN: con el JOIN SQLite recorre rooms por published en vez de usar el geohash
+        pub = set()
+        ids = [rid for rid, _ in hits]
+        for i in range(0, len(ids), 900):
+            pub.update(r for (r,) in db.session.query(Room.id).filter(
+                Room.id.in_(ids[i:i + 900]), Room.published.is_(True)))
+        hits = [h for h in hits if h[0] in pub]
+    return hits[:limit]
+
+if __name__ == "__main__":
+    if "--rebuild" not in sys.argv[1:]:
+        print("uso: python room_geo.py --rebuild")
+        sys.exit(2)
+    from app import create_app
+    application = create_app()
+    with application.app_context():
+        n = rebuild()
+        print(f"room_geo: {n} habitaciones")
@@ -0,0 +1,203 @@
+# room_images.py — Galería, zonas comunes y fichas de cada habitación en filas (room_images)
+#
+# Antes todo vivía en Room.images_json: cada foto subida copiaba la lista entera, añadía una
+# entrada y reescribía la columna JSON completa (coste creciente con la galería) y dos subidas
+# a la vez a la misma habitación se pisaban la lista. Ahora cada foto/ficha es una fila:
+#
+#   room_images(room_id, scope, common_type, sort, sha, url, thumb, w, h, sub_ref, extra)
+#     scope = gallery | common (common_type = kitchen|bathroom|...) | sheet | form
+#
+# - add(room, rows)            las filas (row()) de una subida en un solo INSERT multi-fila, al
+#                               final de su lista; no lee ni reescribe las que ya hay
+# - images_of(room) / images_for(rooms)
+#                               la forma de siempre {gallery, cover, common, sheets, sheet, forms,
+#                               meta...}: lo que queda en images_json (meta) + las filas; cover es la
+#                               primera de la galería y sheet la ficha/formulario más reciente
+# - gallery_summary(ids)        portada y nº de fotos por habitación (room_cards) sin leer la galería
+# - backfill()                  pasa a filas las listas que aún estén en images_json y las quita de
+#                               ahí (lo mismo que la migración 0004_room_images)
+#
+# La tabla y el paso de datos antiguos son cosa de la migración 0004; las peticiones solo leen
+# y escriben filas. Backfill manual (BD sin alembic):
+#   python room_images.py --backfill
+
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import String, cast, func, insert, or_, select, update
+
+from extensions import db
+from models_rooms import Room, RoomImage
+
+# claves de images_json que pasan a room_images (el resto, p.ej. meta, se queda en la columna)
+KEYS = ("gallery", "cover", "common", "sheets", "sheet", "forms")
+_COLS = ("sha", "url", "thumb", "w", "h", "sub_ref")
+
+def _ts(entry: dict) -> datetime:
+    try:
+        return datetime.fromisoformat(str(entry.get("ts")))
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+def row(scope: str, entry: dict, common_type: str = "", sort: int = 0, room_id: Optional[int] = None) -> dict:
+    """Fila de room_images para una entrada {url, thumb, w, h, sha, sub_ref, ...} de images_json."""
+    return dict(
+        room_id=room_id, scope=scope, common_type=common_type or "", sort=sort,
+        created_at=_ts(entry),
+        **{c: entry.get(c) for c in _COLS},
+        extra={k: v for k, v in entry.items() if k not in _COLS} or None,
+    )
+
+def entry(r) -> dict:
+    """Entrada de images_json a partir de una fila (las columnas vacías no aparecen)."""
+    d = {c: getattr(r, c) for c in _COLS if getattr(r, c) is not None}
+    d.update(r.extra or {})
+    return d
+
+def split(images: Optional[dict]) -> Tuple[List[dict], dict]:
+    """(filas sin room_id, images_json sin las listas) para pasar un images_json antiguo a filas."""
+    images = images if isinstance(images, dict) else {}
+    rest = {k: v for k, v in images.items() if k not in KEYS}
+    rows = []
+
+    def _add(scope, entries, common_type=""):
+        for i, e in enumerate(e for e in entries or [] if isinstance(e, dict)):
+            rows.append(row(scope, e, common_type, i))
+
+    _add("gallery", images.get("gallery"))
+    for ct, bucket in (images.get("common") or {}).items():
+        _add("common", bucket, ct)
+    _add("sheet", images.get("sheets"))
+    _add("form", images.get("forms"))
+    # ficha "principal" que no esté en ningún histórico (datos anteriores a sheets/forms)
+    latest = images.get("sheet")
+    if isinstance(latest, dict) and latest.get("url") and \
+            not any(r["scope"] in ("sheet", "form") and r["url"] == latest.get("url") for r in rows):
+        rows.append(row("sheet", latest, sort=sum(1 for r in rows if r["scope"] == "sheet")))
+    return rows, rest
+
+def add(room, rows: List[dict]) -> int:
+    """
+    Inserta las filas de una subida (hechas con row()) al final de sus listas, en un solo
+    INSERT multi-fila. Devuelve cuántas. El commit lo hace quien llama.
+    """
+    if not rows:
+        return 0
+    if room.id is None:
+        db.session.flush()
+    nxt = {}
+    for r in rows:
+        key = (r["scope"], r["common_type"])
+        if key not in nxt:
+            last = (db.session.query(func.max(RoomImage.sort))
+                    .filter(RoomImage.room_id == room.id, RoomImage.scope == key[0],
+                            RoomImage.common_type == key[1]).scalar())
+            nxt[key] = 0 if last is None else last + 1
+        r["room_id"], r["sort"] = room.id, nxt[key]
+        nxt[key] += 1
+    db.session.execute(insert(RoomImage), rows)   # ORM: response_cache ve la escritura
+    return len(rows)
+
+def entries(room_id: int, scope: str) -> List[dict]:
+    """Entradas de una lista de la habitación, en orden."""
+    q = (db.session.query(RoomImage).filter(RoomImage.room_id == room_id, RoomImage.scope == scope)
+         .order_by(RoomImage.common_type, RoomImage.sort, RoomImage.id))
+    return [entry(r) for r in q]
+
+def count(room_id: int, scope: str = "gallery") -> int:
+    return (db.session.query(func.count(RoomImage.id))
+            .filter(RoomImage.room_id == room_id, RoomImage.scope == scope).scalar() or 0)
+
+def images_for(rooms: Iterable[Tuple[int, Optional[dict]]]) -> Dict[int, dict]:
+    """
+    {room_id: images} para pares (room_id, images_json), con una sola consulta a room_images
+    para todas. Misma forma que el images_json de antes.
+    """
+    base = {rid: {k: v for k, v in (images or {}).items() if k not in KEYS}
+            for rid, images in rooms}
+    if not base:
+        return {}
+    q = (db.session.query(RoomImage).filter(RoomImage.room_id.in_(list(base)))
+         .order_by(RoomImage.room_id, RoomImage.scope, RoomImage.common_type, RoomImage.sort, RoomImage.id))
+    return compose(base, q)
+
+def compose(base: Dict[int, dict], rows: Iterable) -> Dict[int, dict]:
+    """Añade a base[room_id] (images_json sin las listas) las filas, ordenadas por lista y sort."""
+    latest = {}
+    for r in rows:
+        d, e = base.setdefault(r.room_id, {}), entry(r)
+        if r.scope == "gallery":
+            d.setdefault("gallery", []).append(e)
+        elif r.scope == "common":
+            d.setdefault("common", {}).setdefault(r.common_type, []).append(e)
+        else:
+            d.setdefault("sheets" if r.scope == "sheet" else "forms", []).append(e)
+            if r.room_id not in latest or (r.created_at, r.id) >= latest[r.room_id][0]:
+                latest[r.room_id] = ((r.created_at, r.id), e)
+    for rid, d in base.items():
+        if d.get("gallery"):
+            d["cover"] = d["gallery"][0]
+        if rid in latest:
+            d["sheet"] = latest[rid][1]
+    return base
+
+def images_of(room) -> dict:
+    return images_for([(room.id, room.images_json)])[room.id]
+
+def gallery_summary(room_ids: Iterable[int], conn=None) -> Dict[int, Tuple[Optional[dict], int]]:
+    """
+    {room_id: (primera foto de la galería, nº de fotos)}; las que no tienen fotos no aparecen.
+    conn: conexión a usar (migraciones); por defecto la sesión.
+    """
+    ids = list(room_ids)
+    if not ids:
+        return {}
+    t = RoomImage.__table__
+    sub = (select(t.c.room_id, func.min(t.c.sort).label("first"), func.count(t.c.id).label("n"))
+           .where(t.c.room_id.in_(ids), t.c.scope == "gallery")
+           .group_by(t.c.room_id).subquery())
+    q = (select(t.c.id, t.c.room_id, t.c.extra, *[t.c[c] for c in _COLS], sub.c.n)
+         .join(sub, (t.c.room_id == sub.c.room_id) & (t.c.sort == sub.c.first))
+         .where(t.c.scope == "gallery")
+         .order_by(t.c.id.desc()))   # empate de sort (subidas simultáneas): gana el id menor
+    rows = (db.session if conn is None else conn).execute(q)
+    return {r.room_id: (entry(r), int(r.n)) for r in rows}
+
+def backfill(batch: int = 500) -> int:
+    """Pasa a room_images las listas que sigan en images_json. Devuelve nº de habitaciones migradas."""
+    # solo las habitaciones cuyo JSON aún menciona alguna de las claves
+    legacy = or_(*[cast(Room.images_json, String).like(f'%"{k}"%') for k in KEYS])
+    moved, last_id = 0, 0
+    while True:
+        rooms = (db.session.query(Room.id, Room.images_json).filter(Room.id > last_id, legacy)
+                 .order_by(Room.id).limit(batch).all())
+        if not rooms:
+            break
+        last_id = rooms[-1].id
+        inserts, updates = [], []
+        for rid, images in rooms:
+            if not isinstance(images, dict) or not any(k in images for k in KEYS):
+                continue
+            rows, rest = split(images)
+            for r in rows:
+                r["room_id"] = rid
+            inserts.extend(rows)
+            updates.append({"id": rid, "images_json": rest or None})
+        if inserts:
+            db.session.execute(insert(RoomImage), inserts)
+        if updates:
+            db.session.execute(update(Room), updates)   # UPDATE por clave primaria
+        db.session.commit()
+        moved += len(updates)
+    return moved
+
+if __name__ == "__main__":
+    if "--backfill" not in sys.argv[1:]:
+        print("uso: python room_images.py --backfill")
+        sys.exit(2)
+    from app import create_app
+    application = create_app()
+    with application.app_context():
+        n = backfill()
+        print(f"room_images: {n} habitaciones pasadas de images_json a filas")
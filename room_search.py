@@ -0,0 +1,236 @@
+# room_search.py — Búsqueda de texto completo sobre rooms + metadatos de ficha
+#
+# Índice real en la BD:
+#   SQLite    tabla virtual FTS5 room_fts (rowid = rooms.id), ranking bm25
+#   Postgres  tabla room_search con tsvector generado + índice GIN, ranking ts_rank
+#
+# El texto se normaliza en Python igual al indexar y al buscar: minúsculas, sin tildes
+# (ñ → n) y stemming ligero en español (habitación/habitaciones → habit, baño/baños → ban),
+# así las dos BDs se comportan igual sin depender de unaccent ni de diccionarios.
+#
+# Campos (con peso): título = code, ciudad, meta.barrio · lugar = direccion, provincia,
+# meta.metro · cuerpo = notas, meta.descripcion/normas/orientacion/otros.
+#
+# Incremental: init_search(app) engancha after_insert/update/delete de Room, que reescriben
+# su fila del índice en la misma transacción (una ficha nueva cambia images_json.meta →
+# update de Room). El índice lo crea y lo llena la migración 0006_room_search; las búsquedas
+# y escrituras no hacen DDL. Reconstrucción (BD sin alembic, o índice descuadrado):
+#   python room_search.py --rebuild
+
+import re, sys, logging, unicodedata
+from functools import lru_cache
+from typing import List, Optional
+
+from sqlalchemy import event, select, text
+
+from db_engine import no_statement_timeout
+from extensions import db
+from models_rooms import Room
+
+log = logging.getLogger("room_search")
+
+STOPWORDS = frozenset("""
+a al con de del el en la las lo los para por que se su sus un una unos unas y o e u muy mas
+""".split())
+
+# sufijos de más largo a más corto; se quita el primero que deje una raíz de ≥ 3 letras
+_SUFFIXES = sorted("""
+amientos imientos amiento imiento aciones iciones uciones acion icion ucion
+idades idad mente ables ibles able ible istas ista ismos ismo osos osas oso osa
+ivos ivas ivo iva ados adas ado ada idos idas ido ida antes ante encias encia ores or
+""".split(), key=len, reverse=True)
+
+_RE_TOKEN = re.compile(r"[a-z0-9]+")
+
+_hooks_installed = False
+
+# ---------- normalización ----------
+def fold(s: str) -> str:
+    """minúsculas y sin diacríticos (á→a, ñ→n, ü→u)."""
+    s = s or ""
+    if s.isascii():
+        return s.lower()
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+
+@lru_cache(maxsize=65536)   # el vocabulario es pequeño: cada palabra se analiza una vez
+def stem(w: str) -> str:
+    if w.isdigit() or len(w) <= 3:
+        return w
+    for suf in _SUFFIXES:
+        if w.endswith(suf) and len(w) - len(suf) >= 3:
+            return w[: -len(suf)]
+    if w.endswith("s") and len(w) > 4:
+        w = w[:-1]
+    if w[-1] in "aeo" and len(w) > 4:
+        w = w[:-1]
+    return w
+
+def terms(s: str) -> List[str]:
+    return [stem(t) for t in _RE_TOKEN.findall(fold(s)) if t not in STOPWORDS]
+
+def _doc(*parts) -> str:
+    return " ".join(terms(" ".join(str(p) for p in parts if p)))
+
+def documents(room) -> dict:
+    meta = (room.images_json or {}).get("meta") or {}
+    return dict(
+        id=room.id,
+        title=_doc(room.code, room.ciudad, meta.get("barrio")),
+        place=_doc(room.direccion, room.provincia, meta.get("metro")),
+        body=_doc(room.notas, meta.get("descripcion"), meta.get("normas"),
+                  meta.get("orientacion"), meta.get("otros")),
+    )
+
+# ---------- DDL por dialecto ----------
+def _is_pg(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+_DDL_SQLITE = ["CREATE VIRTUAL TABLE IF NOT EXISTS room_fts USING fts5("
+               "title, place, body, tokenize='unicode61 remove_diacritics 2')",
+               "CREATE VIRTUAL TABLE IF NOT EXISTS room_fts_vocab USING fts5vocab(room_fts, 'row')"]
+_DDL_PG = [
+    "CREATE TABLE IF NOT EXISTS room_search ("
+    " room_id INTEGER PRIMARY KEY REFERENCES rooms(id) ON DELETE CASCADE,"
+    " title TEXT NOT NULL DEFAULT '', place TEXT NOT NULL DEFAULT '', body TEXT NOT NULL DEFAULT '',"
+    " tsv tsvector GENERATED ALWAYS AS ("
+    "  setweight(to_tsvector('simple', title), 'A') ||"
+    "  setweight(to_tsvector('simple', place), 'B') ||"
+    "  setweight(to_tsvector('simple', body), 'C')) STORED)",
+    "CREATE INDEX IF NOT EXISTS ix_room_search_tsv ON room_search USING GIN (tsv)",
+]
+
+def create(conn):
+    """Crea el índice del dialecto de `conn` (IF NOT EXISTS)."""
+    for stmt in (_DDL_PG if _is_pg(conn) else _DDL_SQLITE):
+        conn.execute(text(stmt))
+
+def _delete(conn, room_id: int):
+    if _is_pg(conn):
+        conn.execute(text("DELETE FROM room_search WHERE room_id = :id"), {"id": room_id})
+    else:
+        conn.execute(text("DELETE FROM room_fts WHERE rowid = :id"), {"id": room_id})
+
+def _insert(conn, docs: list):
+    if not docs:
+        return
+    if _is_pg(conn):
+        conn.execute(text("INSERT INTO room_search (room_id, title, place, body) "
+                          "VALUES (:id, :title, :place, :body)"), docs)
+    else:
+        conn.execute(text("INSERT INTO room_fts (rowid, title, place, body) "
+                          "VALUES (:id, :title, :place, :body)"), docs)
+
+# ---------- mantenimiento ----------
+def fill(conn, batch: int = 1000) -> int:
+    """Crea si falta, vacía y regenera el índice desde rooms con `conn` (sin commit). Devuelve nº de documentos."""
+    create(conn)
+    conn.execute(text("DELETE FROM " + ("room_search" if _is_pg(conn) else "room_fts")))
+    rooms = Room.__table__
+    cols = [rooms.c[n] for n in ("id", "code", "ciudad", "direccion", "provincia", "notas", "images_json")]
+    total, last_id = 0, 0
+    while True:
+        # filas sueltas: documents() solo lee atributos
+        rows = conn.execute(select(*cols).where(rooms.c.id > last_id)
+                            .order_by(rooms.c.id).limit(batch)).fetchall()
+        if not rows:
+            break
+        _insert(conn, [documents(r) for r in rows])
+        total += len(rows)
+        last_id = rows[-1].id
+    return total
+
+def rebuild(batch: int = 1000) -> int:
+    """Regenera el índice en la sesión actual y hace commit (CLI --rebuild)."""
+    conn = db.session.connection()
+    no_statement_timeout(conn)   # recorre todas las habitaciones: sin el límite del servicio web
+    n = fill(conn, batch)
+    db.session.commit()
+    return n
+
+def _reindex(connection, target, insert: bool):
+    _delete(connection, target.id)
+    if insert:
+        _insert(connection, [documents(target)])
+
+def _on_change(mapper, connection, target, insert=True):
+    try:
+        if _is_pg(connection):
+            with connection.begin_nested():   # un fallo del índice no aborta la transacción
+                _reindex(connection, target, insert)
+        else:
+            _reindex(connection, target, insert)
+    except Exception as e:
+        log.warning("[search] no se pudo indexar room %s: %s", target.id, e)
+
+def _on_delete(mapper, connection, target):
+    _on_change(mapper, connection, target, insert=False)
+
+def init_search(app=None):
+    """Engancha el índice a las escrituras de Room (idempotente)."""
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    event.listen(Room, "after_insert", _on_change)
+    event.listen(Room, "after_update", _on_change)
+    event.listen(Room, "after_delete", _on_delete)
+    _hooks_installed = True
+
+# ---------- consulta ----------
+# términos presentes en más de esta fracción de habitaciones ("habitación", "baño"...) casi no
+# puntúan en bm25 pero obligan a puntuar medio índice: se quitan del MATCH si queda alguno
+MAX_DF = 0.25
+
+def _selective(conn, ts: List[str]) -> List[str]:
+    n = int(conn.execute(text("SELECT max(id) FROM rooms")).scalar() or 0)
+    if n < 1000:
+        return ts
+    rows = conn.execute(text("SELECT term, doc FROM room_fts_vocab WHERE term IN (%s)"
+                             % ",".join(f":t{i}" for i in range(len(ts)))),
+                        {f"t{i}": t for i, t in enumerate(ts)}).all()
+    df = {t: d for t, d in rows}
+    keep = [t for t in ts if df.get(t, 0) <= MAX_DF * n]
+    return keep or ts
+
+def match_query(ts: List[str], dialect: str) -> Optional[str]:
+    """Términos normalizados → expresión MATCH (FTS5) / tsquery (PG); OR con prefijo, rankeado."""
+    if not ts:
+        return None
+    if dialect == "postgresql":
+        return " | ".join(f"{t}:*" for t in ts)
+    return " OR ".join(f'"{t}"*' for t in ts)
+
+def search(q: str, limit: int = 20, published_only: bool = True) -> list:
+    """[(room_id, score)] de más a menos relevante (score mayor = mejor)."""
+    conn = db.session.connection()
+    pg = _is_pg(conn)
+    ts = list(dict.fromkeys(terms(q)))[:12]
+    if ts and not pg:
+        ts = _selective(conn, ts)
+    mq = match_query(ts, "postgresql" if pg else "sqlite")
+    if not mq:
+        return []
+    pub = " AND r.published = :pub" if published_only else ""
+    if pg:
+        sql = ("SELECT s.room_id, ts_rank(s.tsv, to_tsquery('simple', :q)) AS score "
+               "FROM room_search s JOIN rooms r ON r.id = s.room_id "
+               f"WHERE s.tsv @@ to_tsquery('simple', :q){pub} ORDER BY score DESC, s.room_id DESC LIMIT :n")
+    else:
+        # bm25: más negativo = mejor; pesos título > lugar > cuerpo
+        sql = ("SELECT f.rowid, -bm25(room_fts, 10.0, 5.0, 1.0) AS score "
+               "FROM room_fts f JOIN rooms r ON r.id = f.rowid "
+               f"WHERE room_fts MATCH :q{pub} ORDER BY score DESC, f.rowid DESC LIMIT :n")
+    params = {"q": mq, "n": int(limit)}
+    if published_only:
+        params["pub"] = True
+    return [(int(rid), float(score)) for rid, score in conn.execute(text(sql), params)]
+
+if __name__ == "__main__":
+    if "--rebuild" not in sys.argv[1:]:
+        print("uso: python room_search.py --rebuild")
+        sys.exit(2)
+    from app import create_app
+    application = create_app()
+    with application.app_context():
+        n = rebuild()
+        print(f"room_search: {n} habitaciones indexadas")
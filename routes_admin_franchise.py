@@ -1,12 +1,17 @@
 # routes_admin_franchise.py — Admin franquicia (autocreate + ingest robusto + debug de versión)
 import io, math, os
-import pandas as pd
+from typing import TYPE_CHECKING
 from flask import Blueprint, request, jsonify, send_file
 from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
+from db_engine import no_statement_timeout
 from extensions import db
 from models_franchise_slots import FranchiseSlot
+from response_cache import cached
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 bp_admin_franq = Blueprint("admin_franq", __name__)
 ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "ramon")
@@ -34,8 +39,13 @@ def _slots_rule(municipio: str, provincia: str, poblacion: int) -> int:
         return max(1, math.ceil(poblacion / 20000))
     return max(1, math.ceil(poblacion / 10000))
 
-def _read_dataframe(fs) -> pd.DataFrame:
+def _pd():
+    import pandas   # ~300 ms de import: solo lo pagan ingest/export, no el arranque del worker
+    return pandas
+
+def _read_dataframe(fs) -> "pd.DataFrame":
     """Lee FileStorage como CSV/Excel con heurística (UTF-8 con/sin BOM; ; o ,)."""
+    pd = _pd()
     name = (getattr(fs, "filename", "") or "").lower()
     mimetype = (getattr(fs, "mimetype", "") or "").lower()
     raw = fs.read()
@@ -59,7 +69,7 @@ def _read_dataframe(fs) -> pd.DataFrame:
     except Exception:
         return pd.read_csv(io.StringIO(text), sep=",", engine="python")
 
-def _find_col(df: pd.DataFrame, *keys):
+def _find_col(df: "pd.DataFrame", *keys):
     cols = list(df.columns)
     low = [str(c).strip().lower() for c in cols]
     # exactos
@@ -113,12 +123,13 @@ def ingest_csv():
         df.columns = ["provincia","municipio","poblacion"]
         df["provincia"] = df["provincia"].astype(str).str.strip()
         df["municipio"] = df["municipio"].astype(str).str.strip()
-        df["poblacion"] = pd.to_numeric(df["poblacion"], errors="coerce").fillna(0).astype(int)
+        df["poblacion"] = _pd().to_numeric(df["poblacion"], errors="coerce").fillna(0).astype(int)
         df = df[(df["provincia"]!="") & (df["municipio"]!="") & (df["poblacion"]>0)]
         if df.empty:
             return jsonify(ok=False, error="no_valid_rows"), 400
 
         inserted = updated = skipped = errors = 0
+        no_statement_timeout(db.session.connection())   # ingest entero en una transacción
 
         for _, r in df.iterrows():
             try:
@@ -143,6 +154,7 @@ def ingest_csv():
                         inserted += 1
                     except IntegrityError:
                         db.session.rollback()
+                        no_statement_timeout(db.session.connection())
                         row = (db.session.query(FranchiseSlot)
                                .filter(func.lower(FranchiseSlot.provincia)==prov.lower(),
                                        func.lower(FranchiseSlot.municipio)==mun.lower())
@@ -164,6 +176,7 @@ def ingest_csv():
 
             except Exception:
                 db.session.rollback()
+                no_statement_timeout(db.session.connection())
                 errors += 1
                 continue
 
@@ -181,6 +194,7 @@ def ingest_csv():
         return jsonify(ok=False, error="ingest_failed", detail=str(e)), 500
 
 @bp_admin_franq.get("/api/admin/franquicia/summary")
+@cached("franchise_slots", vary=("X-Admin-Key",), private=True)
 def summary():
     if not _auth():
         return jsonify(ok=False, error="forbidden"), 403
@@ -206,6 +220,7 @@ def summary():
         return jsonify(ok=False, error="summary_failed", detail=str(e)), 500
 
 @bp_admin_franq.get("/api/admin/franquicia/slots")
+@cached("franchise_slots", vary=("X-Admin-Key",), private=True)
 def list_slots():
     if not _auth():
         return jsonify(ok=False, error="forbidden"), 403
@@ -278,6 +293,7 @@ def export_xlsx():
         rows = db.session.query(FranchiseSlot).order_by(FranchiseSlot.provincia, FranchiseSlot.municipio).all()
         if not rows: return jsonify(ok=False, error="no_data"), 400
 
+        pd = _pd()
         df = pd.DataFrame([r.to_dict() for r in rows])
         g = df.groupby("provincia", as_index=False).agg({
             "poblacion":"sum", "plazas":"sum", "ocupadas":"sum", "libres":"sum"
@@ -16,6 +16,7 @@ JWT_TTL_MIN = int(os.getenv("JWT_TTL_MIN", "720"))
 PASSLINK_TTL_MIN = int(os.getenv("PASSLINK_TTL_MIN", "15"))
 FRONTEND_BASE_URL = os.getenv("FRONTEND_BASE_URL", "http://localhost:5173").rstrip("/")
 ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "ramon")
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "").strip().rstrip("/")   # otro host para la API (stub de bench.py)
 
 PHONE_RE = re.compile(r"^\+?\d{9,15}$")
 
@@ -73,7 +74,10 @@ def _twilio_client_or_none():
     frm = os.getenv("TWILIO_PHONE_NUMBER") or ""
     if not (sid and tok and frm):
         return None, None, None
-    return Client(sid, tok), frm, sid
+    client = Client(sid, tok)
+    if TWILIO_API_BASE:
+        client.api.base_url = TWILIO_API_BASE   # mismas rutas /2010-04-01/... contra ese host
+    return client, frm, sid
 
 def send_sms(phone_to: str, body: str) -> bool:
     try:
@@ -1,10 +1,11 @@
 # routes_auto_check.py — Auto-check de cédula: address -> refcat -> registro en BD (no bloquea UI)
 # Nora · 2025-10-11
-import os, uuid, threading, time, json, requests
+import os, uuid, threading, time, json
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from sqlalchemy import text
 from extensions import db
+import services_http
 
 bp_autocheck = Blueprint("auto_check", __name__)
 
@@ -38,9 +39,9 @@ def _worker_run(task_id: str, payload: dict, base: str):
         # 1) resolver refcat
         refcat = None
         try:
-            r = requests.post(f"{base}/api/catastro/resolve_direccion", json={
+            r = services_http.post("auto_check", f"{base}/api/catastro/resolve_direccion", json={
                 "direccion": direccion, "municipio": municipio, "provincia": provincia, "cp": cp
-            }, timeout=8)
+            })
             j = r.json()
             refcat = j.get("refcat")
         except Exception:
@@ -50,7 +51,7 @@ def _worker_run(task_id: str, payload: dict, base: str):
         catastro_info = None
         if refcat and len(refcat) == 20:
             try:
-                r2 = requests.post(f"{base}/api/catastro/consulta_refcat", json={"refcat": refcat}, timeout=8)
+                r2 = services_http.post("auto_check", f"{base}/api/catastro/consulta_refcat", json={"refcat": refcat})
                 j2 = r2.json(); catastro_info = j2 if j2.get("ok") else None
             except Exception:
                 pass
@@ -17,9 +17,9 @@
 import os
 import re
 import unicodedata
-import requests
 import xml.etree.ElementTree as ET
 from flask import Blueprint, request, jsonify, Response, current_app
+import services_http
 
 bp_catastro = Blueprint("bp_catastro", __name__)
 
@@ -134,7 +134,7 @@ def resolve_direccion():
   </soap:Body>
 </soap:Envelope>"""
         headers = {"Content-Type": "text/xml; charset=utf-8", "SOAPAction": ACT_RESOLVE}
-        r = requests.post(URL_RESOLVE, data=envelope.encode("utf-8"), headers=headers, timeout=TIMEOUT)
+        r = services_http.post("catastro", URL_RESOLVE, data=envelope.encode("utf-8"), headers=headers, timeout=TIMEOUT)
         r.raise_for_status()
         root = ET.fromstring(r.text)
         rc = _first_text_by_suffix(root) or None
@@ -203,7 +203,7 @@ def consulta_refcat():
   </soap:Body>
 </soap:Envelope>"""
             headers = {"Content-Type": "text/xml; charset=utf-8", "SOAPAction": ACT_REF}
-            r = requests.post(URL_REF, data=envelope.encode("utf-8"), headers=headers, timeout=TIMEOUT)
+            r = services_http.post("catastro", URL_REF, data=envelope.encode("utf-8"), headers=headers, timeout=TIMEOUT)
             r.raise_for_status()
             # TODO: Parsear valores reales si el XML los aporta (uso/superficie/antigüedad)
             return _corsify(jsonify(ok=True, uso="Residencial", superficie_m2=78, antiguedad="2004", mode="soap"))
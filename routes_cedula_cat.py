@@ -8,8 +8,8 @@ import json
 from datetime import datetime
 from typing import Optional, Dict, Any
 
-import requests
 from flask import Blueprint, request, jsonify, Response
+import services_http
 try:
     # Fallback suave si no está instalada; solo se usará si configuras el modo HTML
     from bs4 import BeautifulSoup  # pip install beautifulsoup4
@@ -88,7 +88,8 @@ def _api_lookup(refcat: str) -> Optional[Dict[str, Any]]:
     if CATA_CAT_API_KEY:
         headers["Authorization"] = f"Bearer {CATA_CAT_API_KEY}"
     try:
-        r = requests.get(
+        r = services_http.get(
+            "cedula_cat",
             CATA_CAT_API_URL,
             params={"refcat": refcat},
             headers=headers,
@@ -113,11 +114,10 @@ def _html_lookup(refcat: str) -> Optional[Dict[str, Any]]:
     if not CATA_CAT_HTML_URL or not BeautifulSoup:
         return None
     try:
-        sess = requests.Session()
         if CATA_CAT_HTML_METHOD == "POST":
-            r = sess.post(CATA_CAT_HTML_URL, data={CATA_CAT_HTML_PARAM_RC: refcat}, timeout=CATA_CAT_TIMEOUT)
+            r = services_http.post("cedula_cat", CATA_CAT_HTML_URL, data={CATA_CAT_HTML_PARAM_RC: refcat}, timeout=CATA_CAT_TIMEOUT)
         else:
-            r = sess.get(CATA_CAT_HTML_URL, params={CATA_CAT_HTML_PARAM_RC: refcat}, timeout=CATA_CAT_TIMEOUT)
+            r = services_http.get("cedula_cat", CATA_CAT_HTML_URL, params={CATA_CAT_HTML_PARAM_RC: refcat}, timeout=CATA_CAT_TIMEOUT)
         r.raise_for_status()
         soup = BeautifulSoup(r.text, "html.parser")
 
@@ -1,8 +1,8 @@
 # routes_cedula_ocr.py — Verificación documental de cédulas (PDF/JPG/PNG) con OCR opcional
 # Nora · 2025-10-11
-import io, os, re
+import os, re
 from datetime import datetime, date
-from typing import Optional, Tuple, Dict, Any
+from typing import BinaryIO, Optional, Tuple, Dict, Any
 from flask import Blueprint, request, jsonify, Response
 from werkzeug.utils import secure_filename
 
@@ -91,11 +91,12 @@ def _status_from_dates(issue_iso: Optional[str], expiry_iso: Optional[str]) -> s
             pass
     return 'no_consta'
 
-def _extract_text_from_pdf(data: bytes, max_pages: int = 2) -> Tuple[str, str]:
+def _extract_text_from_pdf(src: BinaryIO, max_pages: int = 2) -> Tuple[str, str]:
     if _pdf_backends.get('pdfplumber'):
         try:
             text = ''
-            with pdfplumber.open(io.BytesIO(data)) as pdf:
+            src.seek(0)
+            with pdfplumber.open(src) as pdf:
                 for i, page in enumerate(pdf.pages[:max_pages]):
                     text += (page.extract_text() or '') + '\n'
             if text.strip():
@@ -104,7 +105,8 @@ def _extract_text_from_pdf(data: bytes, max_pages: int = 2) -> Tuple[str, str]:
             pass
     if _pdf_backends.get('pypdf2'):
         try:
-            reader = PyPDF2.PdfReader(io.BytesIO(data))
+            src.seek(0)
+            reader = PyPDF2.PdfReader(src)
             text = ''
             for i, page in enumerate(reader.pages[:max_pages]):
                 try:
@@ -117,11 +119,12 @@ def _extract_text_from_pdf(data: bytes, max_pages: int = 2) -> Tuple[str, str]:
             pass
     return ('none', '')
 
-def _extract_text_from_image(data: bytes) -> Tuple[str, str]:
+def _extract_text_from_image(src: BinaryIO) -> Tuple[str, str]:
     if not (pytesseract and Image):
         return ('none', '')
     try:
-        img = Image.open(io.BytesIO(data)).convert('RGB')
+        src.seek(0)
+        img = Image.open(src).convert('RGB')
         txt = pytesseract.image_to_string(img, lang='spa+cat')
         return ('ocr', txt or '')
     except Exception:
@@ -140,7 +143,7 @@ def cedula_ocr():
         return _corsify(jsonify(ok=False, error='no_file')), 400
 
     filename = secure_filename(f.filename)
-    data = f.read()
+    data = f.stream   # fichero ya en disco (upload_ingest): se lee en sitio, sin copiarlo a memoria
     ext = _detect_ext(filename)
 
     text, method = '', 'none'
@@ -1,9 +1,10 @@
 # routes_contact.py
-import os, re, smtplib, time
+import os, re, smtplib
 from email.mime.text import MIMEText
 from flask import Blueprint, request, jsonify
 from extensions import db
 from models_contact import ContactMessage
+import rate_limit
 
 bp_contact = Blueprint("contact", __name__)
 
@@ -15,15 +16,6 @@ def norm_phone(p: str) -> str:
     if re.fullmatch(r"\d{9,15}", p): return "+34" + p
     return p
 
-# rate limit simple en memoria (por IP+endpoint)
-_rl = {}
-def rate_limit(key: str, per_sec: float) -> bool:
-    now = time.time()
-    last = _rl.get(key, 0)
-    if now - last < per_sec:
-        return False
-    _rl[key] = now
-    return True
 
 def send_email(to_email: str, subject: str, body: str) -> bool:
     host = os.getenv("SMTP_HOST")
@@ -52,8 +44,8 @@ def send_email(to_email: str, subject: str, body: str) -> bool:
 
 @bp_contact.post("/api/contacto/oportunidades")
 def contacto_oportunidades():
-    ip = request.headers.get("x-forwarded-for") or request.remote_addr or "0.0.0.0"
-    if not rate_limit(f"contact:opp:{ip}", per_sec=2.0):
+    # política "contact": 1/2seconds, por IP real (no por X-Forwarded-For, que elige el cliente)
+    if not rate_limit.hit("contact", "opp:" + rate_limit.client_key(request)).allowed:
         return jsonify(ok=False, error="rate_limited"), 429
 
     data = request.get_json(silent=True) or {}
@@ -103,8 +95,7 @@ def contacto_oportunidades():
 
 @bp_contact.post("/api/contacto/tenants")
 def contacto_tenants():
-    ip = request.headers.get("x-forwarded-for") or request.remote_addr or "0.0.0.0"
-    if not rate_limit(f"contact:ten:{ip}", per_sec=2.0):
+    if not rate_limit.hit("contact", "ten:" + rate_limit.client_key(request)).allowed:
         return jsonify(ok=False, error="rate_limited"), 429
 
     data = request.get_json(silent=True) or {}
@@ -1,10 +1,10 @@
 # routes_franchise.py
 import os, hashlib, secrets
-from datetime import datetime
 from io import BytesIO
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 from extensions import db
 from models_franchise import FranchiseApplication, FranchiseUpload
+import blob_store
 
 bp_franchise = Blueprint("franchise", __name__)
 
@@ -57,25 +57,16 @@ def franchise_apply_upload():
     if not app_row:
         return jsonify(ok=False, error="app_not_found"), 404
 
-    yyyymm = datetime.utcnow().strftime("%Y%m")
-    base_dir = os.path.join(current_app.instance_path, "uploads", "franchise", subject_id, yyyymm)
-    _ensure_dir(base_dir)
-
-    b = fs.read()
-    if not b:
-        return jsonify(ok=False, error="empty_file"), 400
-    hexname = _sha256_bytes(b)[:16]
     ext = ".bin"
     if fs.filename and "." in fs.filename:
         ext = "." + fs.filename.rsplit(".",1)[-1].lower()
         if len(ext) > 8: ext = ".bin"
 
-    fname = f"{category}_{hexname}{ext}"
-    fpath = os.path.join(base_dir, fname)
-    with open(fpath, "wb") as f:
-        f.write(b)
-
-    rel = f"uploads/franchise/{subject_id}/{yyyymm}/{fname}"
-    up = FranchiseUpload(app_key=subject_id, category=category, path=rel, mime=fs.mimetype, size_bytes=len(b), sha256=hexname)
-    db.session.add(up); db.session.commit()
-    return jsonify(ok=True, file={"category": category, "path": f"/instance/{rel}"})
+    # por bloques, sin cargar el fichero entero; documento repetido → mismo fichero (privado)
+    blob = blob_store.put_stream(fs.stream, ext, fs.mimetype, private=True)
+    if blob is None:
+        return jsonify(ok=False, error="empty_file"), 400
+    up = FranchiseUpload(app_key=subject_id, category=category, path=blob["rel"], mime=fs.mimetype,
+                         size_bytes=blob["size"], sha256=blob["sha"], blob_sha256=blob["blob"])
+    db.session.add(up); blob_store.link(blob["blob"]); db.session.commit()
+    return jsonify(ok=True, file={"category": category, "path": blob["url"]})
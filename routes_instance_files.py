@@ -0,0 +1,150 @@
+# routes_instance_files.py — Servir /instance/uploads/... (fotos, fichas) sin gastar el worker
+#
+# Las galerías apuntan a /instance/uploads/...; hasta ahora nadie servía esas URLs.
+#
+#   GET|HEAD /instance/uploads/<ruta>
+#   GET|HEAD /img/<sha256>?w=&r=&fmt=    variantes de fotos bajo demanda (image_variants.py)
+#
+# - Nombres direccionados por contenido (blobs/<sha[:2]>/<sha>/..., y los antiguos con el
+#   hash en el nombre, p.ej. contracts/.../<hex16>_t.jpg): el contenido de esa ruta no cambia
+#   nunca → ETag fuerte con el hash de la propia ruta y Cache-Control immutable de un año.
+#   El navegador/CDN no vuelve a preguntar; si pregunta, If-None-Match → 304 sin leer el fichero.
+# - Descarga delegada al proxy si está configurado (UPLOADS_OFFLOAD):
+#     x-accel     nginx: X-Accel-Redirect a UPLOADS_ACCEL_PREFIX (location internal con alias
+#                 a <instance>/uploads/); nginx hace Range, sendfile y keep-alive
+#     x-sendfile  Apache/lighttpd: X-Sendfile con la ruta absoluta
+#   Sin proxy: send_file con wsgi.file_wrapper (gunicorn lo manda con sendfile(), sin copiar
+#   a Python) y Range/If-Range/If-None-Match resueltos por werkzeug (206/304/416).
+# - Solo se sirven los prefijos de UPLOADS_PUBLIC_PREFIXES (fotos y fichas de habitaciones);
+#   uploads/<rol>/<tel>/... antiguos y uploads/private (DNI, documentos de candidaturas:
+#   blob_store con private=True) nunca, aunque se añadan a la lista: el sha256 de la URL es
+#   el hash del contenido y se devuelve a los clientes, no es un secreto.
+#
+# Variables de entorno:
+#   UPLOADS_OFFLOAD          x-accel|x-sendfile|vacío (por defecto vacío: sirve el worker)
+#   UPLOADS_ACCEL_PREFIX     location interna de nginx (por defecto /_uploads/)
+#   UPLOADS_PUBLIC_PREFIXES  prefijos servibles bajo uploads/ (por defecto blobs,contracts)
+#   UPLOADS_MAX_AGE          segundos de caché de los nombres direccionados (por defecto 31536000)
+
+import os, re, mimetypes
+from typing import Optional
+
+from flask import Blueprint, request, current_app, send_file, abort, jsonify, Response
+from werkzeug.security import safe_join
+
+import metrics
+import image_variants
+
+bp_instance_files = Blueprint("instance_files", __name__)
+
+_BLOB_RX = re.compile(r"^blobs/[0-9a-f]{2}/(?P<sha>[0-9a-f]{64})/(?P<name>.+)$")
+_HASHED_RX = re.compile(r"(?:^|[_./-])(?P<hex>[0-9a-f]{16,64})(?:[_./-]|$)")
+
+metrics.describe("spainroom_upload_responses_total", "counter", "Ficheros de /instance/uploads por modo de envío y estado")
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or str(default)).strip())
+    except Exception:
+        return default
+
+def _public(rel: str) -> bool:
+    prefixes = [p.strip().strip("/") for p in (os.getenv("UPLOADS_PUBLIC_PREFIXES") or "blobs,contracts").split(",")]
+    parts = rel.split("/")
+    if parts[0] == "private" or any(part.startswith(".") for part in parts):
+        return False   # documentos privados, .incoming (temporales de blob_store) y ocultos
+    return any(p and (rel == p or rel.startswith(p + "/")) for p in prefixes)
+
+def content_etag(rel: str) -> Optional[str]:
+    """ETag fuerte si la ruta identifica su contenido (blob o nombre con hash); si no, None."""
+    m = _BLOB_RX.match(rel)
+    if m:
+        name = m.group("name")
+        return m.group("sha") if name.startswith("original.") else f"{m.group('sha')}:{name}"
+    m = _HASHED_RX.search(os.path.basename(rel))
+    if m:
+        return f"{m.group('hex')}:{os.path.basename(rel)}"
+    return None
+
+def _offloaded(rel: str, path: str, etag: Optional[str]) -> Response:
+    mode = (os.getenv("UPLOADS_OFFLOAD") or "").strip().lower()
+    resp = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+    if mode == "x-accel":
+        prefix = os.getenv("UPLOADS_ACCEL_PREFIX") or "/_uploads/"
+        resp.headers["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + rel
+    else:
+        resp.headers["X-Sendfile"] = path
+    if etag:
+        resp.set_etag(etag)
+    return resp
+
+def _send(rel: str, path: str, etag: Optional[str]) -> Response:
+    """Proxy (X-Accel/X-Sendfile) si está configurado; si no, send_file con Range y 304."""
+    if (os.getenv("UPLOADS_OFFLOAD") or "").strip().lower() in ("x-accel", "x-sendfile"):
+        resp = _offloaded(rel, path, etag)
+        mode = "offload"
+    else:
+        resp = send_file(path, etag=etag if etag else True, conditional=True, max_age=None)
+        mode = "sendfile"
+    metrics.inc("spainroom_upload_responses_total", {"mode": mode, "status": str(resp.status_code)})
+    return resp
+
+def _not_modified(etag: str) -> Response:
+    metrics.inc("spainroom_upload_responses_total", {"mode": "etag", "status": "304"})
+    resp = Response(status=304)
+    resp.set_etag(etag)
+    return _cache(resp, True)
+
+def _cache(resp: Response, immutable: bool) -> Response:
+    if immutable:
+        resp.cache_control.no_cache = None
+        resp.cache_control.public = True
+        resp.cache_control.max_age = _int("UPLOADS_MAX_AGE", 31536000)
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True   # revalida con ETag/Last-Modified
+    return resp
+
+@bp_instance_files.route("/instance/uploads/<path:rel>", methods=["GET", "HEAD"])
+def serve_upload(rel):
+    rel = rel.strip("/")
+    if not _public(rel):
+        abort(404)
+    path = safe_join(os.path.join(current_app.instance_path, "uploads"), rel)
+    if not path or not os.path.isfile(path):
+        abort(404)
+
+    etag = content_etag(rel)
+    if etag and request.if_none_match.contains(etag):
+        # nombre direccionado: el contenido no cambia, no hace falta abrir el fichero
+        return _not_modified(etag)
+    return _cache(_send(rel, path, etag), etag is not None)
+
+@bp_instance_files.route("/img/<sha>", methods=["GET", "HEAD"])
+def serve_variant(sha):
+    """Variante w/r/fmt del original `sha` (generada y cacheada en la primera petición)."""
+    try:
+        w = image_variants.snap_width(int(request.args.get("w") or 0))
+    except ValueError:
+        return jsonify(ok=False, error="bad_width"), 400
+    r = (request.args.get("r") or "").strip() or None
+    if r and r not in image_variants.ratios():
+        return jsonify(ok=False, error="bad_ratio", allowed=sorted(image_variants.ratios())), 400
+    fmt, by_accept = image_variants.negotiate(request.args.get("fmt"), request.headers.get("Accept", ""))
+    if fmt is None:
+        return jsonify(ok=False, error="bad_format"), 400
+
+    etag = image_variants.etag(sha, w, r, fmt)
+    if request.if_none_match.contains(etag):
+        resp = _not_modified(etag)
+    else:
+        try:
+            path = image_variants.get(sha, w, r, fmt)
+        except (ValueError, OSError) as e:   # el blob no es una imagen (PDF, corrupto, demasiado grande)
+            return jsonify(ok=False, error="not_an_image", message=str(e)[:200]), 415
+        if path is None:
+            abort(404)
+        resp = _cache(_send(image_variants.cache_rel(sha, w, r, fmt)[len("uploads/"):], path, etag), True)
+    if by_accept:
+        resp.vary.add("Accept")
+    return resp
@@ -1,9 +1,11 @@
 # routes_owner_cedula.py — Owner endpoints (check + upload, S3 integrado)
 # Nora · 2025-10-13
-import os, uuid, boto3
-from pathlib import Path
-from flask import Blueprint, request, jsonify, current_app
-from botocore.exceptions import ClientError
+# Almacén (S3/MinIO o disco local, cliente compartido, subida por partes): storage.py
+import os, uuid
+from flask import Blueprint, request, jsonify, current_app, send_file, abort
+from werkzeug.utils import secure_filename
+
+import storage
 
 bp_owner = Blueprint("owner", __name__)
 
@@ -16,28 +18,8 @@ def _authorized() -> bool:
         return True  # modo dev si no hay clave
     return request.headers.get("X-Admin-Key") == ADMIN_KEY
 
-# === Cliente S3 ===
-def _s3_client():
-    return boto3.client(
-        "s3",
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=os.getenv("AWS_REGION", "us-east-1"),
-    )
-
-def _upload_to_s3(fileobj, bucket, key, content_type):
-    """Sube el archivo a S3 y devuelve dict con info o error."""
-    s3 = _s3_client()
-    try:
-        s3.upload_fileobj(
-            Fileobj=fileobj,
-            Bucket=bucket,
-            Key=key,
-            ExtraArgs={"ContentType": content_type, "ACL": "private"},
-        )
-        return {"ok": True, "s3_key": key}
-    except ClientError as e:
-        return {"ok": False, "error": str(e)}
+def _presign_exp() -> int:
+    return int(os.getenv("S3_PRESIGN_EXP", "3600"))
 
 # === Endpoints ===
 
@@ -60,36 +42,48 @@ def upload():
     if not f:
         return jsonify(ok=False, error="no_file"), 400
 
-    # si hay variables AWS → sube a S3
-    bucket = os.getenv("S3_BUCKET")
-    region = os.getenv("AWS_REGION", "us-east-1")
+    # S3 (o compatible) si está configurado, si no disco local. Si S3 falla, error: una copia en
+    # disco no la encontrarían presign/delete, que resuelven la clave en storage.backend()
     prefix = os.getenv("S3_PREFIX", "cedulas/")
+    filename = secure_filename(f.filename or "") or "documento"
+    key = f"{prefix}{uuid.uuid4().hex[:8]}-{filename}"
+    content_type = f.mimetype or "application/octet-stream"
 
-    if bucket and os.getenv("AWS_ACCESS_KEY_ID") and os.getenv("AWS_SECRET_ACCESS_KEY"):
-        key = f"{prefix}{uuid.uuid4().hex[:8]}-{f.filename}"
-        res = _upload_to_s3(f.stream, bucket, key, f.mimetype or "application/octet-stream")
-        if res.get("ok"):
-            # generar URL presignada
-            s3 = _s3_client()
-            url = s3.generate_presigned_url(
-                "get_object",
-                Params={"Bucket": bucket, "Key": key},
-                ExpiresIn=int(os.getenv("S3_PRESIGN_EXP", "3600")),
-            )
-            return jsonify(
-                ok=True,
-                storage="s3",
-                bucket=bucket,
-                region=region,
-                s3_key=key,
-                presigned_url=url,
-            )
-        else:
-            current_app.logger.warning("S3 upload failed: %s", res.get("error"))
-            # fallback local
-    # === Fallback local ===
-    up = Path(current_app.instance_path) / "uploads"
-    up.mkdir(parents=True, exist_ok=True)
-    tgt = up / f.filename
-    f.save(tgt)
-    return jsonify(ok=True, storage="local", filename=f.filename)
+    be = storage.backend()
+    if be.name == "s3":
+        try:
+            be.put(f.stream, key, content_type)   # por partes en paralelo si es grande
+        except Exception as e:
+            current_app.logger.warning("S3 upload failed: %s", e)
+            return jsonify(ok=False, error="storage_unavailable"), 502
+        return jsonify(
+            ok=True,
+            storage="s3",
+            bucket=be.bucket,
+            region=os.getenv("AWS_REGION", "us-east-1"),
+            s3_key=key,
+            presigned_url=be.presign(key, _presign_exp()),
+        )
+    try:
+        url = be.presign(key, _presign_exp())   # antes de guardar: sin clave no se firma nada
+    except storage.NoUrlSecret:
+        return jsonify(ok=False, error="url_secret_not_configured"), 503
+    be.put(f.stream, key, content_type)
+    return jsonify(ok=True, storage="local", filename=filename, s3_key=key,
+                   presigned_url=url)
+
+@bp_owner.get("/files/<path:key>")
+def local_file(key):
+    """Descarga de una URL firmada por storage.LocalBackend.presign (?exp=&sig=)."""
+    try:
+        exp = int(request.args.get("exp") or 0)
+    except ValueError:
+        abort(404)
+    if not storage.verify(key, exp, request.args.get("sig", "")):
+        abort(403)
+    path = storage.local_backend().path(key)
+    if not path or not os.path.isfile(path):
+        abort(404)
+    resp = send_file(path, conditional=True, max_age=None)
+    resp.cache_control.private = True
+    return resp
@@ -1,35 +1,73 @@
 # routes_owner_delete.py — Delete S3 objects (solo admin)
-import os, boto3
+# Una clave, o en lote (lista o prefijo) con DeleteObjects de 1000 en 1000: storage.delete_many
+# Exige ADMIN_API_KEY configurada: sin ella responde 403 (no hay "modo dev" para borrar documentos).
+import os
 from flask import Blueprint, request, jsonify
-from botocore.exceptions import ClientError
+
+import storage
 
 bp_owner_delete = Blueprint("owner_delete", __name__)
 
 ADMIN_KEY = (os.getenv("ADMIN_API_KEY") or os.getenv("ADMIN_KEY") or "").strip()
 
 def _authorized() -> bool:
-    if not ADMIN_KEY:
-        return True
-    return request.headers.get("X-Admin-Key") == ADMIN_KEY
-
-def _s3():
-    return boto3.client(
-        "s3",
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=os.getenv("AWS_REGION", "us-east-1"),
-    )
+    return bool(ADMIN_KEY) and request.headers.get("X-Admin-Key") == ADMIN_KEY
+
+BULK_DELETE_MAX = 10000   # claves por petición; con prefijo, truncated=true si quedan más
+
+def _backend():
+    be = storage.backend()
+    return None if be.name == "s3" and not be.bucket else be
 
 @bp_owner_delete.route("/api/owner/cedula/delete", methods=["DELETE","OPTIONS"])
 def delete():
     if request.method == "OPTIONS": return ("",204)
+    if not ADMIN_KEY: return jsonify(ok=False, error="admin_key_not_configured"), 403
     if not _authorized(): return jsonify(ok=False, error="unauthorized"), 401
     data = request.get_json(silent=True) or {}
     s3_key = (data.get("s3_key") or "").strip()
-    bucket = (os.getenv("S3_BUCKET") or "").strip()
     if not s3_key: return jsonify(ok=False, error="missing_s3_key"), 400
-    try:
-        _s3().delete_object(Bucket=bucket, Key=s3_key)
+    be = _backend()
+    if be is None: return jsonify(ok=False, error="s3_not_configured"), 400
+    res = storage.delete_many([s3_key], be)[s3_key]
+    if res["ok"]:
         return jsonify(ok=True, deleted=s3_key)
-    except ClientError as e:
-        return jsonify(ok=False, error="delete_failed", detail=str(e)), 500
+    return jsonify(ok=False, error="delete_failed", detail=res.get("detail") or res.get("error")), 500
+
+@bp_owner_delete.route("/api/owner/cedula/delete/bulk", methods=["DELETE","POST","OPTIONS"])
+def delete_bulk():
+    """
+    Borrado en lote (carpeta de cédulas de un propietario, solicitud de franquicia retirada).
+    Body (JSON), uno de:
+      { "keys": ["cedulas/a.pdf", ...] }
+      { "prefix": "cedulas/SRV-CHK-xxx/" }     # se lista paginado y se borra todo lo que cuelga
+    Devuelve:
+      { ok, deleted, failed, truncated, results:[{key, ok, error?}] }
+    Lotes de hasta 1000 claves por DeleteObjects, varios a la vez; truncated=true si el prefijo
+    tiene más de BULK_DELETE_MAX claves (repetir la llamada).
+    """
+    if request.method == "OPTIONS": return ("",204)
+    if not ADMIN_KEY: return jsonify(ok=False, error="admin_key_not_configured"), 403
+    if not _authorized(): return jsonify(ok=False, error="unauthorized"), 401
+    data = request.get_json(silent=True) or {}
+    keys, prefix = data.get("keys"), (data.get("prefix") or "").strip()
+    be = _backend()
+    if be is None: return jsonify(ok=False, error="s3_not_configured"), 400
+
+    truncated = False
+    if isinstance(keys, list) and keys:
+        keys = [str(k).strip() for k in keys if str(k or "").strip()]
+        if len(keys) > BULK_DELETE_MAX:
+            return jsonify(ok=False, error="too_many_keys", max=BULK_DELETE_MAX), 400
+    elif prefix:
+        if not prefix.strip("/"):
+            return jsonify(ok=False, error="bad_prefix"), 400   # nunca el bucket entero
+        keys, truncated = storage.keys_under(prefix, BULK_DELETE_MAX, be)
+    else:
+        return jsonify(ok=False, error="missing_keys_or_prefix"), 400
+
+    res = storage.delete_many(keys, be)
+    results = [dict(key=k, **res[k]) for k in dict.fromkeys(keys)]
+    failed = sum(1 for r in results if not r["ok"])
+    return jsonify(ok=failed == 0, deleted=len(results) - failed, failed=failed,
+                   truncated=truncated, results=results)
@@ -1,13 +1,15 @@
 # routes_owner_presign.py — Presign S3 (descarga segura con URL temporal)
 # Nora · 2025-10-13
+# Cliente compartido y caché de URLs firmadas: storage.py (presign_many)
 import os
-import boto3
-from botocore.exceptions import ClientError
 from flask import Blueprint, request, jsonify
 
+import storage
+
 bp_owner_presign = Blueprint("owner_presign", __name__)
 
-# Seguridad (usa la misma clave que el resto de endpoints owner)
+# Seguridad (usa la misma clave que el resto de endpoints owner). El lote exige la clave
+# configurada: sin ella responde 403 (no hay "modo dev" para sacar URLs de cédulas en masa)
 ADMIN_KEY = (os.getenv("ADMIN_API_KEY") or os.getenv("ADMIN_KEY") or "").strip()
 
 def _authorized() -> bool:
@@ -15,13 +17,21 @@ def _authorized() -> bool:
         return True  # modo dev si no hay clave
     return request.headers.get("X-Admin-Key") == ADMIN_KEY
 
-def _s3_client():
-    return boto3.client(
-        "s3",
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=os.getenv("AWS_REGION", "us-east-1"),
-    )
+PRESIGN_BATCH_MAX = 500
+
+def _expires(data) -> int:
+    try:
+        expires = int(data.get("expires") or os.getenv("S3_PRESIGN_EXP", "3600"))
+    except (TypeError, ValueError):
+        expires = 3600
+    if expires <= 0 or expires > 604800:  # máx 7 días
+        expires = 3600
+    return expires
+
+def _backend():
+    """Almacén configurado, o None si es S3 sin bucket."""
+    be = storage.backend()
+    return None if be.name == "s3" and not be.bucket else be
 
 @bp_owner_presign.route("/api/owner/cedula/presign", methods=["POST", "OPTIONS"])
 def presign():
@@ -42,34 +52,55 @@ def presign():
 
     data = request.get_json(silent=True) or {}
     s3_key = (data.get("s3_key") or "").strip()
-    expires = int(data.get("expires") or os.getenv("S3_PRESIGN_EXP", "3600"))
+    expires = _expires(data)
 
-    bucket = (os.getenv("S3_BUCKET") or "").strip()
-    if not bucket:
+    be = _backend()
+    if be is None:
         return jsonify(ok=False, error="s3_not_configured"), 400
     if not s3_key:
         return jsonify(ok=False, error="missing_s3_key"), 400
-    if expires <= 0 or expires > 604800:  # máx 7 días
-        expires = 3600
 
-    s3 = _s3_client()
+    # head_object + firma (o la URL en caché si aún le queda vida)
+    res = storage.presign_many([s3_key], expires, be)[s3_key]
+    if res["ok"]:
+        return jsonify(ok=True, presigned_url=res["presigned_url"], expires=expires, expires_at=res["expires_at"])
+    if res["error"] == "not_found":
+        return jsonify(ok=False, error="not_found", key=s3_key), 404
+    err = "s3_head_error" if res["error"] == "head_error" else res["error"]
+    return jsonify(ok=False, error=err, detail=res.get("detail")), 500
 
-    # Comprobar que existe el objeto (head_object)
-    try:
-        s3.head_object(Bucket=bucket, Key=s3_key)
-    except ClientError as e:
-        code = e.response.get("Error", {}).get("Code")
-        if code in ("404", "NoSuchKey", "NotFound"):
-            return jsonify(ok=False, error="not_found", key=s3_key), 404
-        # otro error
-        return jsonify(ok=False, error="s3_head_error", detail=str(e)), 500
+@bp_owner_presign.route("/api/owner/cedula/presign/batch", methods=["POST", "OPTIONS"])
+def presign_batch():
+    """
+    Muchas URLs en una petición (listados de documentos del panel).
+    Body (JSON):
+      { "keys": ["cedulas/a.pdf", "cedulas/b.pdf", ...], "expires": 900 }
+    Devuelve, en el orden pedido (sin duplicados):
+      { ok:true, expires:900, count:2, results:[
+          {key, ok:true, presigned_url, expires_at}, {key, ok:false, error:"not_found"} ] }
+    Existencia comprobada en paralelo; las URLs en caché se devuelven sin ir a S3.
+    """
+    if request.method == "OPTIONS":
+        return ("", 204)
 
-    try:
-        url = s3.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": bucket, "Key": s3_key},
-            ExpiresIn=expires
-        )
-        return jsonify(ok=True, presigned_url=url, expires=expires)
-    except ClientError as e:
-        return jsonify(ok=False, error="presign_failed", detail=str(e)), 500
+    if not ADMIN_KEY:
+        return jsonify(ok=False, error="admin_key_not_configured"), 403
+    if not _authorized():
+        return jsonify(ok=False, error="unauthorized"), 401
+
+    data = request.get_json(silent=True) or {}
+    keys = data.get("keys")
+    if not isinstance(keys, list) or not keys:
+        return jsonify(ok=False, error="missing_keys"), 400
+    keys = [str(k).strip() for k in keys if str(k or "").strip()]
+    if len(keys) > PRESIGN_BATCH_MAX:
+        return jsonify(ok=False, error="too_many_keys", max=PRESIGN_BATCH_MAX), 400
+    expires = _expires(data)
+
+    be = _backend()
+    if be is None:
+        return jsonify(ok=False, error="s3_not_configured"), 400
+
+    res = storage.presign_many(keys, expires, be)
+    results = [dict(key=k, **res[k]) for k in dict.fromkeys(keys)]
+    return jsonify(ok=True, expires=expires, count=len(results), results=results)
@@ -1,23 +1,33 @@
 # routes_push.py — SpainRoom Push (Firebase FCM HTTP v1) — definitivo
-import os, time, secrets
+import os, time, secrets, threading
 from flask import Blueprint, request, jsonify, current_app
-from google.oauth2 import service_account
-from google.auth.transport.requests import AuthorizedSession
 
 bp_push = Blueprint("push", __name__, url_prefix="/api/push")
 
 PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID", "spainroom-9cb27").strip()
 SCOPES     = ["https://www.googleapis.com/auth/firebase.messaging"]
 CREDS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "serviceAccountKey.json").strip()
+FCM_BASE_URL = os.getenv("FCM_BASE_URL", "https://fcm.googleapis.com").strip().rstrip("/")   # stub de bench.py
 
-CREDS   = service_account.Credentials.from_service_account_file(CREDS_PATH, scopes=SCOPES)
-SESSION = AuthorizedSession(CREDS)
+_session = None
+_session_lock = threading.Lock()
+
+def fcm_session():
+    """Sesión autorizada de FCM, creada en el primer envío (google.auth no se importa al arrancar)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            from google.oauth2 import service_account
+            from google.auth.transport.requests import AuthorizedSession
+            creds = service_account.Credentials.from_service_account_file(CREDS_PATH, scopes=SCOPES)
+            _session = AuthorizedSession(creds)
+        return _session
 
 USER_TOKENS = {}   # { user_id: set(tokens) }
 PENDING_OTP = {}   # { otp_id: {user_id, code, exp} }
 
 def fcm_send_v1(token: str, title: str, body: str, data=None):
-    url = f"https://fcm.googleapis.com/v1/projects/{PROJECT_ID}/messages:send"
+    url = f"{FCM_BASE_URL}/v1/projects/{PROJECT_ID}/messages:send"
     payload = {
         "message": {
             "token": token,
@@ -25,7 +35,7 @@ def fcm_send_v1(token: str, title: str, body: str, data=None):
             "data": data or {}
         }
     }
-    r = SESSION.post(url, json=payload, timeout=10)
+    r = fcm_session().post(url, json=payload, timeout=10)
     current_app.logger.info("[PUSH V1] code=%s resp=%s", r.status_code, r.text[:400])
     return {"ok": (200 <= r.status_code < 300), "status": r.status_code, "resp": r.text}
 
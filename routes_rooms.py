@@ -1,18 +1,176 @@
-
 from flask import Blueprint, request, jsonify
+from response_cache import cached
 
 bp_rooms = Blueprint("rooms", __name__)
 
+# Campos que admite ?fields= en el catálogo ("cover" = portada compacta, "photos" = nº de fotos,
+# "images" = galería/zonas comunes/fichas de room_images). Sin "images"/"notas" se lee de room_cards.
+CATALOG_FIELDS = ("id", "code", "direccion", "ciudad", "provincia", "m2", "precio", "estado",
+                  "notas", "published", "cover", "photos", "images")
+CATALOG_DEFAULT = ("id", "code", "direccion", "ciudad", "provincia", "m2", "precio", "estado", "cover", "photos")
+CATALOG_MAX_LIMIT = 200
+_ROOMS_ONLY = ("notas", "images")
+
 @bp_rooms.get("/api/rooms/published")
+@cached("rooms")
 def list_published():
-    # Devuelve lista vacía si no hay modelo cargado (demo segura)
+    # ?view=cards → tarjetas compactas (room_cards) en vez de la habitación con todas sus imágenes.
+    # Un error de BD sale como 500: un [] con 200 quedaría en la caché (con su ETag) y todos
+    # los que sondean verían el catálogo vacío hasta la siguiente escritura.
+    from models_rooms import Room, RoomCard
+    if request.args.get("view") == "cards":
+        q = (RoomCard.query.filter(RoomCard.published.is_(True))
+             .order_by(RoomCard.room_id.desc()).limit(200).all())
+        return jsonify([c.to_dict() for c in q])
+    import room_images
+    q = Room.query.filter_by(published=True).order_by(Room.id.desc()).limit(200).all()
+    images = room_images.images_for((r.id, r.images_json) for r in q)   # una consulta para las 200
+    return jsonify([ r.to_dict(images=images[r.id]) for r in q ])
+
+def _int_arg(name):
+    v = (request.args.get(name) or "").strip()
+    if not v:
+        return None
+    return int(v)   # ValueError → 400
+
+@bp_rooms.get("/api/rooms/catalog")
+@cached("rooms")
+def catalog():
+    # Catálogo paginado por keyset: ?ciudad=&provincia=&precio_min=&precio_max=&m2_min=&m2_max=
+    #   &fields=id,code,precio,cover&limit=50&cursor=<next_cursor de la página anterior>
+    # Orden: más nuevas primero (id desc). El coste por página no depende de la profundidad.
+    from extensions import db
+    from models_rooms import Room, RoomCard
+    import room_cards, room_images
+    try:
+        limit = min(max(_int_arg("limit") or 50, 1), CATALOG_MAX_LIMIT)
+        cursor = _int_arg("cursor")
+        precio_min, precio_max = _int_arg("precio_min"), _int_arg("precio_max")
+        m2_min, m2_max = _int_arg("m2_min"), _int_arg("m2_max")
+    except ValueError:
+        return jsonify(ok=False, error="bad_param"), 400
+
+    raw = (request.args.get("fields") or "").strip()
+    fields = [f.strip() for f in raw.split(",") if f.strip()] if raw else list(CATALOG_DEFAULT)
+    bad = [f for f in fields if f not in CATALOG_FIELDS]
+    if bad:
+        return jsonify(ok=False, error="bad_fields", fields=bad, allowed=list(CATALOG_FIELDS)), 400
+
+    # solo se leen las columnas pedidas: de room_cards si basta, si no de rooms
+    use_cards = not any(f in _ROOMS_ONLY for f in fields)
+    if use_cards:
+        M, pk = RoomCard, RoomCard.room_id
+        extra = {"cover": [RoomCard.cover_url, RoomCard.cover_thumb, RoomCard.cover_w, RoomCard.cover_h],
+                 "photos": [RoomCard.photo_count]}
+    else:
+        M, pk = Room, Room.id
+        extra = {"cover": [Room.images_json], "photos": [Room.images_json], "images": [Room.images_json]}
+    names = [f for f in fields if f not in extra and f != "id"]
+    cols = [pk.label("id")] + [getattr(M, n) for n in names]
+    for f in fields:
+        for c in extra.get(f, []):
+            if not any(c is x for x in cols):
+                cols.append(c)
+
+    q = db.session.query(*cols).filter(M.published.is_(True))
+    ciudad = (request.args.get("ciudad") or "").strip()
+    provincia = (request.args.get("provincia") or "").strip()
+    if ciudad:
+        q = q.filter(M.ciudad == ciudad)
+    if provincia:
+        q = q.filter(M.provincia == provincia)
+    if precio_min is not None:
+        q = q.filter(M.precio >= precio_min)
+    if precio_max is not None:
+        q = q.filter(M.precio <= precio_max)
+    if m2_min is not None:
+        q = q.filter(M.m2 >= m2_min)
+    if m2_max is not None:
+        q = q.filter(M.m2 <= m2_max)
+    if cursor is not None:
+        q = q.filter(pk < cursor)
+    rows = q.order_by(pk.desc()).limit(limit + 1).all()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    # sin room_cards: imágenes de room_images para toda la página de una vez
+    images_by_id = {}
+    if not use_cards and any(f in extra for f in fields):
+        images_by_id = room_images.images_for((r._mapping["id"], r._mapping["images_json"]) for r in rows)
+    results = []
+    for r in rows:
+        m = r._mapping
+        d = {n: m[n] for n in names}
+        if "id" in fields:
+            d["id"] = m["id"]
+        if use_cards:
+            if "cover" in fields:
+                d["cover"] = (dict(url=m["cover_url"], thumb=m["cover_thumb"], w=m["cover_w"], h=m["cover_h"])
+                              if m["cover_url"] else None)
+            if "photos" in fields:
+                d["photos"] = int(m["photo_count"] or 0)
+        else:
+            images = images_by_id.get(m["id"]) or {}
+            if "images" in fields:
+                d["images"] = images
+            if "cover" in fields:
+                d["cover"] = room_cards.cover_of(images)
+            if "photos" in fields:
+                d["photos"] = len(images.get("gallery") or [])
+        results.append(d)
+    next_cursor = rows[-1]._mapping["id"] if (more and rows) else None
+    return jsonify(ok=True, count=len(results), results=results, next_cursor=next_cursor)
+
+@bp_rooms.get("/api/rooms/search")
+@cached("rooms")
+def search_rooms():
+    # Texto libre sin tildes y con stemming: ?q=habitación baño privado metro Nervión&limit=20
+    # Devuelve tarjetas (room_cards) ordenadas por relevancia, con su score.
+    from models_rooms import RoomCard
+    import room_search
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify(ok=False, error="missing_q"), 400
+    try:
+        limit = min(max(_int_arg("limit") or 20, 1), CATALOG_MAX_LIMIT)
+    except ValueError:
+        return jsonify(ok=False, error="bad_param"), 400
+    hits = room_search.search(q, limit=limit)
+    cards = {c.room_id: c for c in RoomCard.query.filter(RoomCard.room_id.in_([rid for rid, _ in hits])).all()} if hits else {}
+    results = []
+    for rid, score in hits:
+        c = cards.get(rid)
+        if c is not None:
+            d = c.to_dict(); d["score"] = round(score, 4)
+            results.append(d)
+    return jsonify(ok=True, q=q, count=len(results), results=results)
+
+@bp_rooms.get("/api/rooms/near")
+@cached("rooms")
+def rooms_near():
+    # Habitaciones publicadas a ≤ radius_km de un punto, de más cerca a más lejos (vista mapa):
+    # ?lat=37.3891&lon=-5.9845&radius_km=3&limit=100
+    from models_rooms import RoomCard
+    import room_geo
     try:
-        from extensions import db
-        from models_rooms import Room
-        q = Room.query.filter_by(published=True).order_by(Room.id.desc()).limit(200).all()
-        return jsonify([ r.to_dict() for r in q ])
-    except Exception:
-        return jsonify([])
+        lat = float(request.args.get("lat", ""))
+        lon = float(request.args.get("lon", ""))
+        radius = float(request.args.get("radius_km") or 5)
+        limit = min(max(_int_arg("limit") or 100, 1), 1000)
+    except ValueError:
+        return jsonify(ok=False, error="bad_param"), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not (0 < radius <= room_geo.MAX_RADIUS_KM):
+        return jsonify(ok=False, error="bad_param"), 400
+    hits = room_geo.near(lat, lon, radius, limit=limit)
+    ids = [rid for rid, _ in hits]
+    cards = {c.room_id: c for c in RoomCard.query.filter(RoomCard.room_id.in_(ids)).all()} if ids else {}
+    results = []
+    for rid, dist in hits:
+        c = cards.get(rid)
+        if c is not None:
+            d = c.to_dict(); d["distance_km"] = round(dist, 3)
+            results.append(d)
+    return jsonify(ok=True, count=len(results), results=results)
 
 @bp_rooms.post("/api/rooms/reservations/create")
 def create_reservation():
@@ -1,11 +1,16 @@
 # routes_rooms_sheet_json.py
 from datetime import datetime
 import os, json, hashlib
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
+from sqlalchemy.orm.attributes import flag_modified
 from extensions import db
 from models_rooms import Room
 from models_contracts import Contract, ContractItem
 from models_uploads import Upload
+import room_cards
+import room_images
+import blob_store
+from response_cache import cached
 
 bp_rooms_sheet_json = Blueprint("rooms_sheet_json", __name__)
 
@@ -78,6 +83,13 @@ def submit_sheet_json():
         except Exception:
             return v
 
+    def _coord(v, lim):
+        try:
+            f = float(v)
+        except Exception:
+            return None
+        return round(f, 6) if -lim <= f <= lim else None
+
     norm = {
         "cama": str(sheet.get("cama") or ""),
         "ventana": bool(sheet.get("ventana")),
@@ -97,6 +109,8 @@ def submit_sheet_json():
         "normas": (sheet.get("normas") or "").strip(),
         "otros": (sheet.get("otros") or "").strip(),
         "descripcion": (sheet.get("descripcion") or "").strip(),
+        "lat": _coord(sheet.get("lat"), 90),    # opcional: ubicación exacta para búsqueda por radio
+        "lon": _coord(sheet.get("lon"), 180),
     }
 
     images = room.images_json or {}
@@ -107,31 +121,27 @@ def submit_sheet_json():
     # Generar form_id vinculado a la línea de contrato (sub_ref)
     base_id = (item.sub_ref or "FORM").replace(" ", "")
     if not form_id:
-        existing = [f for f in (images.get("forms", []) or []) if str(f.get("form_id","")).startswith(base_id+"-F")]
+        existing = [f for f in room_images.entries(room.id, "form") if str(f.get("form_id","")).startswith(base_id+"-F")]
         idx = (len(existing) or 0) + 1
         form_id = f"{base_id}-F{idx:03d}"
 
-    # Persistir JSON y registrar Upload
-    yyyymm = _yyyymm()
-    base_dir = os.path.join(current_app.instance_path, "uploads", "contracts", contract.ref, item.sub_ref, "sheets", "json", yyyymm)
-    _ensure_dir(base_dir)
+    # Persistir JSON (blob_store) y registrar Upload
     payload = {
         "form_id": form_id, "sub_ref": item.sub_ref, "ref": contract.ref, "room_code": room.code,
         "ts": datetime.utcnow().isoformat(), "sheet": norm
     }
     raw = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
-    sha = _sha(raw)[:16]
-    fname = f"sheet_{form_id}_{sha}.json"
-    with open(os.path.join(base_dir, fname), "wb") as f: f.write(raw)
-    rel = f"/instance/uploads/contracts/{contract.ref}/{item.sub_ref}/sheets/json/{yyyymm}/{fname}"
+    blob = blob_store.put(raw, ".json", "application/json")
+    sha, rel = blob["sha"], blob["url"]
 
     up = Upload(role="room", subject_id=item.sub_ref, category="room_sheet_json",
-                path=f"uploads/contracts/{contract.ref}/{item.sub_ref}/sheets/json/{yyyymm}/{fname}",
-                mime="application/json", size_bytes=len(raw), sha256=sha)
+                path=blob["rel"],
+                mime="application/json", size_bytes=len(raw), sha256=sha, blob_sha256=blob["blob"])
     db.session.add(up)
+    blob_store.link(blob["blob"])
 
-    forms = images.get("forms", []); forms.append({"form_id": form_id, "ts": payload["ts"], "url": rel, "sha": sha, "type":"json"})
-    images["forms"] = forms; images["sheet"] = {"url": rel, "sha": sha, "ts": payload["ts"], "form_id": form_id, "type":"json"}
+    # histórico de formularios en room_images; images.sheet (el más reciente) sale de ahí
+    room_images.add(room, [room_images.row("form", {"form_id": form_id, "ts": payload["ts"], "url": rel, "sha": sha, "type":"json"})])
 
     if update_core:
         if isinstance(norm.get("superficie_m2"), int) and norm["superficie_m2"]:
@@ -144,11 +154,14 @@ def submit_sheet_json():
         room.notas = (desc[:240] + ("…" if len(desc) > 240 else "")) or room.notas
 
     room.images_json = images
+    flag_modified(room, "images_json")   # meta editado en sitio (mismo objeto): sin esto no llega a la BD
+    room_cards.sync(room)
     db.session.commit()
 
     return jsonify(ok=True, form_id=form_id, room={"id": room.id, "code": room.code}, sheet=norm, url=rel)
 
 @bp_rooms_sheet_json.get("/api/rooms/<room_id_or_code>/sheet")
+@cached("rooms")
 def get_sheet(room_id_or_code):
     room = None
     if str(room_id_or_code).isdigit():
@@ -157,6 +170,6 @@ def get_sheet(room_id_or_code):
         room = Room.query.filter_by(code=str(room_id_or_code)).first()
     if not room:
         return jsonify(ok=False, error="not_found"), 404
-    images = room.images_json or {}
+    images = room_images.images_of(room)
     meta = images.get("meta", {}); latest = images.get("sheet"); forms = images.get("forms", [])
     return jsonify(ok=True, room={"id": room.id, "code": room.code}, meta=meta, latest=latest, count=len(forms))
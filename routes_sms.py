@@ -19,8 +19,8 @@ def notify_lead_webhook(payload: dict) -> bool:
     if not url:
         return False
     try:
-        import requests  # ya está instalado
-        resp = requests.post(url, json=payload, timeout=5)
+        import services_http
+        resp = services_http.post("lead_webhook", url, json=payload)
         return resp.status_code < 400
     except Exception as e:
         try:
@@ -1,8 +1,9 @@
 # routes_upload_generic.py
 import os, hashlib
-from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 from extensions import db
+from models_uploads import Upload
+import blob_store
 
 bp_upload_generic = Blueprint("upload_generic", __name__)
 
@@ -25,24 +26,19 @@ def upload_generic():
     if not subject_id or not fs:
         return jsonify(ok=False, error="missing_fields"), 400
 
-    b = fs.read()
-    if not b:
-        return jsonify(ok=False, error="empty_file"), 400
-    hexname = _sha256_bytes(b)[:16]
-
-    yyyymm = datetime.utcnow().strftime("%Y%m")
-    base_dir = os.path.join(current_app.instance_path, "uploads", role, subject_id, yyyymm)
-    _ensure_dir(base_dir)
-
     ext = ".bin"
     if fs.filename and "." in fs.filename:
         ext = "." + fs.filename.rsplit(".",1)[-1].lower()
         if len(ext) > 8: ext = ".bin"
-    fname = f"{category}_{hexname}{ext}"
-    fpath = os.path.join(base_dir, fname)
-    with open(fpath, "wb") as f:
-        f.write(b)
 
-    rel = f"uploads/{role}/{subject_id}/{yyyymm}/{fname}"
-    # Si quieres, registra en una tabla Upload genérica (opcional).
-    return jsonify(ok=True, file={"role":role,"subject":subject_id,"category":category,"path": f"/instance/{rel}"})
+    # por bloques (memoria acotada); contenido ya subido (mismo DNI dos veces) → mismo blob.
+    # DNI, facturas, selfies...: fuera de la zona pública de uploads
+    blob = blob_store.put_stream(fs.stream, ext, fs.mimetype, private=True)
+    if blob is None:
+        return jsonify(ok=False, error="empty_file"), 400
+    up = Upload(role=role[:16], subject_id=subject_id, category=category[:64], path=blob["rel"],
+                mime=fs.mimetype, size_bytes=blob["size"], sha256=blob["sha"], blob_sha256=blob["blob"])
+    db.session.add(up)
+    blob_store.link(blob["blob"])
+    db.session.commit()
+    return jsonify(ok=True, file={"role":role,"subject":subject_id,"category":category,"path": blob["url"]})
@@ -1,46 +1,85 @@
 # routes_uploads_rooms.py
-import os, hashlib
+import os, mimetypes
 from datetime import datetime
-from io import BytesIO
-from PIL import Image
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 
 from extensions import db
 from models_contracts import Contract, ContractItem
 from models_rooms import Room
 from models_uploads import Upload
+import room_cards
+import room_images
+import photo_jobs
+import blob_store
+import image_variants
+from image_engine import probe
 
 bp_upload_rooms = Blueprint("upload_rooms", __name__)
 
 # ---------- Helpers ----------
-def ensure_dir(p): os.makedirs(p, exist_ok=True)
-def sha256_bytes(b: bytes) -> str: h = hashlib.sha256(); h.update(b); return h.hexdigest()
+def probe_photo(file_storage, max_w=1600):
+    """
+    Valida la foto (una decodificación reducida) y devuelve {w,h} de la variante full.
+    No codifica nada: full y thumb se generan al pedirlas (image_variants, /img/<sha>).
+    """
+    return probe(file_storage, width=max_w)
+
+# Perfil de las fotos de galería: v1 = variantes 1600/480 generadas al subir;
+# v2 = solo original + medidas, variantes bajo demanda. Si cambia, subir la versión.
+PHOTO_PROFILE = "plain-v2"
+FULL_W, THUMB_W = 1600, 480
+
+def _photo_outputs(meta):
+    return {}, {"w": meta["w"], "h": meta["h"]}
 
-def _yyyymm():
-    return datetime.utcnow().strftime("%Y%m")
+def _original(rel: str) -> bytes:
+    try:
+        with open(blob_store.abs_path(rel), "rb") as fh:
+            return fh.read()
+    except OSError:
+        return b""   # probe_photo fallará con esa foto → ERR:invalid_image
 
-def process_image(file_storage, max_w=1600, thumb_w=480):
+def prepare_photos(sources):
     """
-    Devuelve {w,h, full(bytes JPEG), thumb(bytes JPEG)}
+    (sha, foto | excepción) por original, en orden (ver blob_store.prepare_photos).
+    Solo se decodifican los originales que no están ya en el almacén con PHOTO_PROFILE.
     """
-    im = Image.open(file_storage.stream).convert("RGB")
-    w, h = im.size
-    # full
-    if w > max_w:
-        ratio = max_w / float(w)
-        im_full = im.resize((max_w, int(h*ratio)), Image.LANCZOS)
-    else:
-        im_full = im.copy()
-    # thumb
-    if w > thumb_w:
-        ratio = thumb_w / float(w)
-        im_thumb = im.resize((thumb_w, int(h*ratio)), Image.LANCZOS)
-    else:
-        im_thumb = im.copy()
-    bf = BytesIO(); im_full.save(bf, "JPEG", quality=88, optimize=True); full = bf.getvalue()
-    bt = BytesIO(); im_thumb.save(bt, "JPEG", quality=82, optimize=True); thumb = bt.getvalue()
-    return {"w": im_full.size[0], "h": im_full.size[1], "full": full, "thumb": thumb}
+    return blob_store.prepare_photos(sources, PHOTO_PROFILE, probe_photo, _photo_outputs,
+                                     keep_original=True, max_w=FULL_W)
+
+def apply_photo(contract, item, room, photo, rows):
+    """
+    Registra el Upload (una referencia más al blob) y añade a `rows` la fila de galería
+    (room_images.add las inserta juntas). Común al modo síncrono y a photo_jobs.
+    Devuelve el nombre del fichero.
+    """
+    sha, orig = photo["blob"], photo["original"]
+    hexname = sha[:16]
+
+    # Registrar upload (el original; las variantes viven en la caché de image_variants)
+    up = Upload(
+        role="room", subject_id=item.sub_ref, category="room_photo",
+        path=orig["rel"],
+        mime=mimetypes.guess_type(orig["name"])[0] or "application/octet-stream", size_bytes=orig["size"],
+        width=photo["w"], height=photo["h"], sha256=hexname, blob_sha256=sha
+    )
+    db.session.add(up)
+    blob_store.link(sha)
+
+    # Fila de galería (portada = la primera; ficha/meta/zonas comunes no se tocan)
+    rows.append(room_images.row("gallery", {
+        "url": image_variants.url(sha, FULL_W),
+        "thumb": image_variants.url(sha, THUMB_W),
+        "w": photo["w"], "h": photo["h"], "sha": hexname, "sub_ref": item.sub_ref
+    }))
+    room.published = True
+    return f"{hexname}.jpg"
+
+def publish(room, item, any_ok):
+    """estado línea -> published si se subió al menos 1 foto válida"""
+    if any_ok and item.status in ("draft", "ready"):
+        item.status = "published"
 
 def _find_room(room_code):
     return Room.query.filter_by(code=(room_code or "").strip()).first() if room_code else None
@@ -102,6 +141,7 @@ def upload_room_photos():
     form-data:
       sub_ref?   | ref? + room_code?
       file       | files[] múltiples
+      async?     = 1 → 202 + job_id; variantes en segundo plano (photo_jobs.py)
     headers:
       X-Franquiciado (obligatorio si el contrato/línea tiene franchisee_id)
     """
@@ -134,58 +174,52 @@ def upload_room_photos():
         msg = "Falta franquiciado en cabecera." if auth_err == "missing_franquiciado" else "No autorizado para esta habitación."
         return jsonify(ok=False, error=auth_err, message=msg), 403
 
-    yyyymm = _yyyymm()
-    base_dir = os.path.join(current_app.instance_path, "uploads", "contracts", contract.ref, item.sub_ref, yyyymm)
-    ensure_dir(base_dir)
-
-    added = []
-    any_ok = False
+    # async=1 / Prefer: respond-async → solo originales a blob_store y 202; variantes en photo_jobs
+    if photo_jobs.wants_async(request):
+        job = photo_jobs.enqueue("plain", contract, item, room, files)
+        status_url = f"/api/rooms/photo_jobs/{job.id}"
+        resp = jsonify(ok=True, job_id=job.id, status=job.status, status_url=status_url,
+                       files=len(job.files or []))
+        resp.headers["Location"] = status_url
+        return resp, 202
+
+    # Validar extensión; los originales válidos van a blob_store por bloques (sin fs.read(), como
+    # en photo_jobs). Solo se leen del disco y se procesan en paralelo (image_pool) los que no
+    # tengan ya el perfil; se aplican en orden
+    blobs = []
     for fs in files:
+        ext = os.path.splitext(secure_filename(fs.filename or ""))[1].lower()
+        if ext not in (".jpg", ".jpeg", ".png"):
+            blobs.append("ERR:bad_image_type")
+            continue
+        blob = blob_store.put_stream(fs.stream, ext, fs.mimetype)
+        blobs.append(blob if blob is not None else "ERR:invalid_image")
+    prepared = prepare_photos((b["blob"], lambda rel=b["rel"]: _original(rel))
+                              for b in blobs if isinstance(b, dict))
+
+    added, rows = [], []
+    any_ok = False
+    for b in blobs:
+        if not isinstance(b, dict):
+            added.append(b)
+            continue
         try:
-            # Validar extensión
-            ext = os.path.splitext(secure_filename(fs.filename or ""))[1].lower()
-            if ext not in (".jpg", ".jpeg", ".png"):
-                added.append("ERR:bad_image_type")
-                continue
-
-            im = process_image(fs)
-            hexname = sha256_bytes(im["full"])[:16]
-            full_name, thumb_name = f"{hexname}.jpg", f"{hexname}_t.jpg"
-
-            with open(os.path.join(base_dir, full_name), "wb") as f: f.write(im["full"])
-            with open(os.path.join(base_dir, thumb_name), "wb") as f: f.write(im["thumb"])
-
-            # Registrar upload
-            up = Upload(
-                role="room", subject_id=item.sub_ref, category="room_photo",
-                path=f"uploads/contracts/{contract.ref}/{item.sub_ref}/{yyyymm}/{full_name}",
-                mime="image/jpeg", size_bytes=len(im["full"]),
-                width=im["w"], height=im["h"], sha256=hexname
-            )
-            db.session.add(up)
-
-            # Actualizar galería de la room
-            gallery = (room.images_json or {}).get("gallery", [])
-            gallery.append({
-                "url": f"/instance/uploads/contracts/{contract.ref}/{item.sub_ref}/{yyyymm}/{full_name}",
-                "thumb": f"/instance/uploads/contracts/{contract.ref}/{item.sub_ref}/{yyyymm}/{thumb_name}",
-                "w": im["w"], "h": im["h"], "sha": hexname, "sub_ref": item.sub_ref
-            })
-            room.images_json = {"gallery": gallery, "cover": gallery[0] if gallery else None}
-            room.published = True
-            added.append(full_name); any_ok = True
+            _, photo = next(prepared)
+            if isinstance(photo, Exception):
+                raise photo
+            added.append(apply_photo(contract, item, room, photo, rows)); any_ok = True
         except Exception:
             added.append("ERR:invalid_image")
 
-    # estado línea -> published si subimos al menos 1 foto válida
-    if any_ok and item.status in ("draft", "ready"):
-        item.status = "published"
+    room_images.add(room, rows)   # toda la subida en un INSERT
+    publish(room, item, any_ok)
 
+    room_cards.sync(room)
     db.session.commit()
     return jsonify(ok=True,
                    contract={"ref": contract.ref},
                    item={"sub_ref": item.sub_ref, "status": item.status},
-                   room={"code": room.code, "published": room.published, "images": room.images_json},
+                   room={"code": room.code, "published": room.published, "images": room_images.images_of(room)},
                    uploaded=added)
 
 # ---------- FICHA ----------
@@ -196,7 +230,7 @@ def upload_room_sheet():
       - Requiere contrato firmado
       - Localiza ContractItem por sub_ref o ref+room_code
       - Acepta 1 o varias fichas ('file' o 'files[]')
-      - Guarda ruta en images_json.sheet (última) y en images_json.sheets (histórico)
+      - Guarda la ficha en room_images (images.sheets = histórico, images.sheet = última)
       - NO publica por sí sola (publica la foto)
     form-data:
       sub_ref?   | ref? + room_code?
@@ -232,50 +266,68 @@ def upload_room_sheet():
         msg = "Falta franquiciado en cabecera." if auth_err == "missing_franquiciado" else "No autorizado para esta habitación."
         return jsonify(ok=False, error=auth_err, message=msg), 403
 
-    yyyymm = _yyyymm()
-    base_dir = os.path.join(current_app.instance_path, "uploads", "contracts", contract.ref, item.sub_ref, "sheets", yyyymm)
-    ensure_dir(base_dir)
-
-    saved = []
+    saved, rows = [], []
     for fs in files:
         try:
-            raw = fs.read()
-            if not raw:
-                saved.append("ERR:empty"); 
-                continue
-            hexname = sha256_bytes(raw)[:16]
             ext = os.path.splitext(secure_filename(fs.filename or ""))[1].lower()
             if not ext or len(ext) > 8:
                 ext = ".bin"
+            # por bloques (sin fs.read()); misma ficha ya subida (otra línea, otro mes) → mismo fichero
+            blob = blob_store.put_stream(fs.stream, ext, fs.mimetype)
+            if blob is None:
+                saved.append("ERR:empty")
+                continue
+            hexname = blob["sha"]
             fname = f"sheet_{hexname}{ext}"
-            fpath = os.path.join(base_dir, fname)
-            with open(fpath, "wb") as f: f.write(raw)
-
-            rel = f"/instance/uploads/contracts/{contract.ref}/{item.sub_ref}/sheets/{yyyymm}/{fname}"
 
             # Registrar upload
             up = Upload(
                 role="room", subject_id=item.sub_ref, category="room_sheet",
-                path=f"uploads/contracts/{contract.ref}/{item.sub_ref}/sheets/{yyyymm}/{fname}",
-                mime=fs.mimetype, size_bytes=len(raw), sha256=hexname
+                path=blob["rel"],
+                mime=fs.mimetype, size_bytes=blob["size"], sha256=hexname, blob_sha256=blob["blob"]
             )
             db.session.add(up)
+            blob_store.link(blob["blob"])
 
-            # Guardar en images_json.sheet / images_json.sheets
-            images = room.images_json or {}
-            sheets = images.get("sheets", [])
-            sheets.append({"url": rel, "sha": hexname, "ts": datetime.utcnow().isoformat()})
-            images["sheets"] = sheets
-            images["sheet"]  = sheets[-1]   # última como principal
-            room.images_json = images
+            # Histórico de fichas (la última es la principal: images.sheet)
+            rows.append(room_images.row("sheet", {"url": blob["url"], "sha": hexname,
+                                                  "ts": datetime.utcnow().isoformat()}))
 
             saved.append(fname)
         except Exception:
             saved.append("ERR:save_fail")
 
+    room_images.add(room, rows)
+    room_cards.sync(room)
     db.session.commit()
     return jsonify(ok=True,
                    contract={"ref": contract.ref},
                    item={"sub_ref": item.sub_ref, "status": item.status},
-                   room={"code": room.code, "published": room.published, "images": room.images_json},
+                   room={"code": room.code, "published": room.published, "images": room_images.images_of(room)},
                    sheets=saved)
+
+# ---------- ESTADO DE SUBIDAS ASÍNCRONAS ----------
+@bp_upload_rooms.get("/api/rooms/photo_jobs/<job_id>")
+def photo_job_status(job_id):
+    """
+    Estado de una subida con async=1 (ver photo_jobs.py):
+      status = queued|running|done|error, total, done, uploaded (como en el modo síncrono)
+    Al terminar incluye item y room igual que la respuesta síncrona.
+    """
+    job = photo_jobs.get(job_id)
+    if not job:
+        return jsonify(ok=False, error="not_found"), 404
+    photo_jobs.resume_if_stale(job)
+    out = job.to_dict()
+    if job.status == "done":
+        room = db.session.get(Room, job.room_id)
+        item = db.session.get(ContractItem, job.item_id)
+        if room is not None:
+            out["room"] = {"code": room.code, "published": room.published, "images": room_images.images_of(room)}
+        if item is not None:
+            out["item"] = {"sub_ref": item.sub_ref, "status": item.status}
+    resp = jsonify(ok=True, **out)
+    resp.headers["Cache-Control"] = "no-store"
+    if job.status in ("queued", "running"):
+        resp.headers["Retry-After"] = "1"
+    return resp
@@ -3,7 +3,8 @@
 Upload de fotos con AUTO-ADAPTACIÓN para la galería:
 - Corrige orientación EXIF.
 - Recorta centrado a relación 4:3 (ideal para hero/galería).
-- Redimensiona a ancho objetivo (1600 px) y genera thumb (480 px), ambos 4:3.
+- Redimensiona a ancho objetivo (1600 px) y genera thumb (480 px), ambos 4:3,
+  al pedirlos (/img/<sha>?r=4:3, image_variants.py); la subida solo valida y guarda el original.
 - Opcional: clasifica como 'habitacion' (scope=room) o 'zonas comunes' (scope=common + common_type).
 - Publica la habitación si hay al menos 1 foto de habitación.
 
@@ -16,10 +17,7 @@ Regístralo así en tu app Flask:
 Asegúrate de NO registrar otro blueprint con el mismo path para evitar conflictos.
 """
 
-import os, hashlib
-from datetime import datetime
-from io import BytesIO
-from PIL import Image, ImageOps
+import os, mimetypes
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 
@@ -27,76 +25,76 @@ from extensions import db
 from models_contracts import Contract, ContractItem
 from models_rooms import Room
 from models_uploads import Upload
+import room_cards
+import room_images
+import photo_jobs
+import blob_store
+import image_variants
+from image_engine import probe
 
 bp_upload_rooms_autofit = Blueprint("upload_rooms_autofit", __name__)
 
-def ensure_dir(p: str): os.makedirs(p, exist_ok=True)
-def sha256_bytes(b: bytes) -> str: h = hashlib.sha256(); h.update(b); return h.hexdigest()
-def _yyyymm(): return datetime.utcnow().strftime("%Y%m")
-
-def _open_image_rgb(fs):
-    """Abre la imagen, corrige orientación EXIF y convierte a RGB."""
-    im = Image.open(fs.stream)
-    im = ImageOps.exif_transpose(im)
-    if im.mode not in ("RGB", "RGBA"):
-        im = im.convert("RGB")
-    elif im.mode == "RGBA":
-        # fondo blanco para RGBA
-        bg = Image.new("RGB", im.size, (255,255,255))
-        bg.paste(im, mask=im.split()[-1])
-        im = bg
-    return im
-
-def _center_crop_to_ratio(im: Image.Image, target_ratio: float) -> Image.Image:
-    """Recorta centrado a la relación target_ratio (e.g., 4/3)."""
-    w, h = im.size
-    r = w / float(h)
-    if abs(r - target_ratio) < 1e-3:
-        return im.copy()
-    if r > target_ratio:
-        # demasiado ancha → recorta anchura
-        new_w = int(h * target_ratio)
-        x0 = (w - new_w) // 2
-        return im.crop((x0, 0, x0 + new_w, h))
-    else:
-        # demasiado alta → recorta altura
-        new_h = int(w / target_ratio)
-        y0 = (h - new_h) // 2
-        return im.crop((0, y0, w, y0 + new_h))
+PHOTO_EXTS = (".jpg",".jpeg",".png",".webp")
+
+def probe_photo_autofit(fs, target_w=1600, ratio=4/3.0):
+    """Valida la foto (una decodificación reducida) y devuelve {w,h} de la variante full 4:3."""
+    return probe(fs, width=target_w, ratio=ratio)
+
+# v1 = full/thumb 4:3 generadas al subir; v2 = original + medidas,
+# variantes 4:3 bajo demanda (/img/<sha>?r=4:3). Cambiar la receta = subir la versión.
+PHOTO_PROFILE = "autofit-v2"
+FULL_W, THUMB_W, RATIO = 1600, 480, "4:3"
+
+def _photo_outputs(meta):
+    return {}, {"w": meta["w"], "h": meta["h"]}
+
+def _original(rel: str) -> bytes:
+    try:
+        with open(blob_store.abs_path(rel), "rb") as fh:
+            return fh.read()
+    except OSError:
+        return b""   # probe_photo_autofit fallará con esa foto → ERR:invalid_image
 
-def process_image_autofit(fs, target_w=1600, thumb_w=480, ratio=4/3.0):
+def prepare_photos(sources):
+    """(sha, foto | excepción) por original; solo se procesan los que no están ya en blob_store."""
+    return blob_store.prepare_photos(sources, PHOTO_PROFILE, probe_photo_autofit, _photo_outputs,
+                                     keep_original=True, target_w=FULL_W, ratio=4/3.0)
+
+def apply_photo(contract, item, room, photo, rows, scope="room", common_type=""):
     """
-    Devuelve dict con:
-      { 'w':W, 'h':H, 'full_jpg':bytes, 'thumb_jpg':bytes }
-    Imágenes a 4:3, full ~1600px ancho, thumb ~480px ancho.
+    Registra el Upload (referencia al blob) y añade a `rows` la fila de galería (scope=room)
+    o de zonas comunes; room_images.add las inserta juntas. Común al modo síncrono y a photo_jobs.
     """
-    im = _open_image_rgb(fs)
-    # Recorte 4:3 centrado
-    im43 = _center_crop_to_ratio(im, ratio)
-    w, h = im43.size
-
-    # Resize full
-    if w > target_w:
-        scale = target_w / float(w)
-        im_full = im43.resize((target_w, int(h*scale)), Image.LANCZOS)
-    else:
-        im_full = im43.copy()
+    sha, orig = photo["blob"], photo["original"]
+    hexname = sha[:16]
+
+    # Registrar upload principal (el original; variantes bajo demanda)
+    up = Upload(
+        role="room", subject_id=item.sub_ref, category="room_photo" if scope=="room" else f"common_{common_type}",
+        path=orig["rel"],
+        mime=mimetypes.guess_type(orig["name"])[0] or "application/octet-stream", size_bytes=orig["size"],
+        width=photo["w"], height=photo["h"], sha256=hexname, blob_sha256=sha
+    )
+    db.session.add(up)
+    blob_store.link(sha)
 
-    # Resize thumb
-    if w > thumb_w:
-        scale_t = thumb_w / float(w)
-        im_thumb = im43.resize((thumb_w, int(h*scale_t)), Image.LANCZOS)
-    else:
-        im_thumb = im43.copy()
+    entry = {
+        "url": image_variants.url(sha, FULL_W, RATIO),
+        "thumb": image_variants.url(sha, THUMB_W, RATIO),
+        "w": photo["w"], "h": photo["h"], "sha": hexname, "sub_ref": item.sub_ref, "ratio": "4:3"
+    }
 
-    # Encode JPG
-    bf = BytesIO(); im_full.save(bf, "JPEG", quality=88, optimize=True, progressive=True); full_jpg = bf.getvalue()
-    bt = BytesIO(); im_thumb.save(bt, "JPEG", quality=82, optimize=True); thumb_jpg = bt.getvalue()
+    if scope == "room":
+        rows.append(room_images.row("gallery", entry))   # portada = la primera de la galería
+    else:
+        rows.append(room_images.row("common", entry, common_type))
+    return f"{hexname}.jpg"
 
-    return {
-        "w": im_full.size[0], "h": im_full.size[1],
-        "full_jpg": full_jpg, "thumb_jpg": thumb_jpg
-    }
+def publish(room, item, any_ok=True):
+    """Publicación: solo si existe al menos 1 foto de HABITACIÓN."""
+    if room_images.count(room.id, "gallery"):
+        room.published = True
+        if item.status in ("draft","ready"): item.status = "published"
 
 def _contract_item_by_ref(sub_ref: str, ref: str, room_code: str):
     sub_ref = (sub_ref or "").strip().upper()
@@ -137,6 +135,7 @@ def upload_room_photos_autofit():
       scope? = room|common (default room)
       common_type? = kitchen|bathroom|living|laundry|other (obligatorio si scope=common)
       file | files[] (1..N)
+      async? = 1 → 202 + job_id; estado en GET /api/rooms/photo_jobs/<job_id>
     headers:
       X-Franquiciado (si aplica)
     """
@@ -173,65 +172,52 @@ def upload_room_photos_autofit():
     if scope == "common" and ctype not in ("kitchen","bathroom","living","laundry","other"):
         return jsonify(ok=False, error="bad_common_type", message="common_type debe ser kitchen|bathroom|living|laundry|other"), 400
 
-    yyyymm = _yyyymm()
-    base_dir = os.path.join(current_app.instance_path, "uploads", "contracts", contract.ref, item.sub_ref, yyyymm)
-    ensure_dir(base_dir)
-
-    added = []
+    # async=1 / Prefer: respond-async → 202 + job_id; estado en GET /api/rooms/photo_jobs/<job_id>
+    if photo_jobs.wants_async(request):
+        job = photo_jobs.enqueue("autofit", contract, item, room, files,
+                                 options={"scope": scope, "common_type": ctype},
+                                 allowed_ext=PHOTO_EXTS)
+        status_url = f"/api/rooms/photo_jobs/{job.id}"
+        resp = jsonify(ok=True, job_id=job.id, status=job.status, status_url=status_url,
+                       files=len(job.files or []), scope=scope)
+        resp.headers["Location"] = status_url
+        return resp, 202
+
+    # Originales a blob_store por bloques (sin fs.read(), como en routes_uploads_rooms); solo se
+    # leen del disco y se procesan en paralelo (image_pool) los que no tengan ya el perfil.
+    # Resultados en el orden de subida
+    blobs = []
     for fs in files:
+        ext = os.path.splitext(secure_filename(fs.filename or ""))[1].lower()
+        if ext not in PHOTO_EXTS:
+            blobs.append("ERR:bad_image_type"); continue
+        blob = blob_store.put_stream(fs.stream, ext, fs.mimetype)
+        blobs.append(blob if blob is not None else "ERR:invalid_image")
+    prepared = prepare_photos((b["blob"], lambda rel=b["rel"]: _original(rel))
+                              for b in blobs if isinstance(b, dict))
+
+    added, rows = [], []
+    for b in blobs:
+        if not isinstance(b, dict):
+            added.append(b); continue
         try:
-            ext = os.path.splitext(secure_filename(fs.filename or ""))[1].lower()
-            if ext not in (".jpg",".jpeg",".png",".webp"):
-                added.append("ERR:bad_image_type"); continue
-
-            im = process_image_autofit(fs, target_w=1600, thumb_w=480, ratio=4/3.0)
-            hexname = sha256_bytes(im["full_jpg"])[:16]
-            full_name, thumb_name = f"{hexname}.jpg", f"{hexname}_t.jpg"
-
-            with open(os.path.join(base_dir, full_name), "wb") as f: f.write(im["full_jpg"])
-            with open(os.path.join(base_dir, thumb_name), "wb") as f: f.write(im["thumb_jpg"])
-
-            # Registrar upload principal
-            up = Upload(
-                role="room", subject_id=item.sub_ref, category="room_photo" if scope=="room" else f"common_{ctype}",
-                path=f"uploads/contracts/{contract.ref}/{item.sub_ref}/{yyyymm}/{full_name}",
-                mime="image/jpeg", size_bytes=len(im["full_jpg"]),
-                width=im["w"], height=im["h"], sha256=hexname
-            )
-            db.session.add(up)
-
-            images = room.images_json or {}
-
-            entry = {
-                "url": f"/instance/uploads/contracts/{contract.ref}/{item.sub_ref}/{yyyymm}/{full_name}",
-                "thumb": f"/instance/uploads/contracts/{contract.ref}/{item.sub_ref}/{yyyymm}/{thumb_name}",
-                "w": im["w"], "h": im["h"], "sha": hexname, "sub_ref": item.sub_ref, "ratio": "4:3"
-            }
-
-            if scope == "room":
-                gallery = images.get("gallery", []); gallery.append(entry); images["gallery"] = gallery
-                if not images.get("cover") and gallery: images["cover"] = gallery[0]
-            else:
-                common = images.get("common", {})
-                bucket = list(common.get(ctype, [])); bucket.append(entry)
-                common[ctype] = bucket; images["common"] = common
-
-            room.images_json = images
-            added.append(full_name)
+            _, photo = next(prepared)
+            if isinstance(photo, Exception):
+                raise photo
+            added.append(apply_photo(contract, item, room, photo, rows, scope=scope, common_type=ctype))
         except Exception as e:
             current_app.logger.exception("upload_room_photos_autofit error")
             added.append("ERR:invalid_image")
 
-    # Publicación: solo si existe al menos 1 foto de HABITACIÓN
-    if (room.images_json or {}).get("gallery"):
-        room.published = True
-        if item.status in ("draft","ready"): item.status = "published"
+    room_images.add(room, rows)   # toda la subida en un INSERT
+    publish(room, item)
 
+    room_cards.sync(room)
     db.session.commit()
     return jsonify(ok=True,
       contract={"ref": contract.ref},
       item={"sub_ref": item.sub_ref, "status": item.status},
-      room={"code": room.code, "published": room.published, "images": room.images_json},
+      room={"code": room.code, "published": room.published, "images": room_images.images_of(room)},
       uploaded=added,
       scope=scope
     )
@@ -2,7 +2,7 @@
 # Nora · 2025-10-12
 import os, hmac, hashlib, secrets
 from flask import Blueprint, request, jsonify, make_response, current_app
-import requests
+import services_http
 
 bp_veriff = Blueprint("veriff", __name__)
 
@@ -38,7 +38,7 @@ def veriff_session():
             "vendorData": data.get("vendorData") or "spainroom"
         }}
         headers = {"Content-Type":"application/json","X-AUTH-CLIENT": VERIFF_API_KEY}
-        r = requests.post(f"{VERIFF_BASE}/verifications", headers=headers, json=payload, timeout=12)
+        r = services_http.post("veriff", f"{VERIFF_BASE}/verifications", headers=headers, json=payload)
         r.raise_for_status()
         j = r.json().get("verification", {})
         return _corsify(jsonify(ok=True, demo=False, session_id=j.get("id"), url=j.get("url"), vendorData=j.get("vendorData")))
@@ -1,7 +1,8 @@
 # routes_wa.py — SpainRoom WhatsApp (MessageBird Conversations API) — definitivo
 # Nora · 2025-10-17
-import os, json, requests, hmac, hashlib
+import os, json, hmac, hashlib
 from flask import Blueprint, request, jsonify, current_app
+import services_http
 
 bp_wa = Blueprint("wa", __name__, url_prefix="/api/wa")
 bp_wa_webhook = Blueprint("wa_webhook", __name__)  # <— webhook separado, path absoluto /webhooks/wa
@@ -47,7 +48,7 @@ def send_template():
             }
         }
     }
-    r = requests.post(WA_ENDPOINT, headers=headers, json=payload, timeout=20)
+    r = services_http.post("messagebird", WA_ENDPOINT, headers=headers, json=payload)
     _log("[WA SEND] to=%s template=%s code=%s resp=%s", to, template, r.status_code, r.text[:500])
     return jsonify(ok=(200 <= r.status_code < 300), status=r.status_code, response=r.text)
 
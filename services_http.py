@@ -0,0 +1,310 @@
+# services_http.py — Cliente HTTP saliente compartido (pool + keep-alive + métricas por proveedor)
+#
+# Todas las integraciones (pagos backend-1, MessageBird, Catastro SOAP, webhooks de leads,
+# Generalitat, Veriff...) pasan por aquí en vez de hacer requests.post() sueltos:
+#   - una requests.Session por proveedor, reutilizada entre peticiones y threads
+#     → keep-alive: no se paga TCP+TLS en cada llamada
+#   - límite de conexiones por host (pool_maxsize) y timeouts por proveedor
+#   - reintentos acotados: solo métodos idempotentes (o errores de conexión, cuando la
+#     petición no ha salido) y con presupuesto de reintentos por proveedor
+#   - contadores por proveedor: llamadas, errores, 4xx/5xx, reintentos, latencia
+#
+# Uso:
+#   import services_http as http
+#   r = http.post("messagebird", url, json=payload, headers=headers)
+#   http.stats()   # {"messagebird": {"count":..,"errors":..,"lat_avg_ms":..}, ...}
+#
+# Variables de entorno (por proveedor, en mayúsculas):
+#   HTTP_<PROV>_TIMEOUT   segundos (float) o "connect,read"  p.ej. HTTP_CATASTRO_TIMEOUT=3,8
+#   HTTP_<PROV>_RETRIES   reintentos máximos por llamada
+#   HTTP_POOL_MAXSIZE     conexiones por host y proveedor (por defecto 10)
+#   HTTP_POOL_BLOCK       1 = esperar conexión libre en vez de abrir extra (por defecto 0)
+#   HTTP_RETRY_BUDGET     fracción de llamadas que pueden reintentarse (por defecto 0.2)
+
+import os, time, threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ---------- Config por proveedor ----------
+# timeout = (connect, read); retries = reintentos máximos por llamada
+PROVIDERS: Dict[str, dict] = {
+    "payments":      {"timeout": (3.05, 12), "retries": 1},
+    "messagebird":   {"timeout": (3.05, 20), "retries": 1},
+    "catastro":      {"timeout": (3.05, 8),  "retries": 1},
+    "cedula_cat":    {"timeout": (3.05, 12), "retries": 1},
+    "veriff":        {"timeout": (3.05, 12), "retries": 1},
+    "lead_webhook":  {"timeout": (2, 5),     "retries": 0},
+    "opportunities": {"timeout": (2, 5),     "retries": 0},
+    "auto_check":    {"timeout": (2, 8),     "retries": 0},
+    "default":       {"timeout": (3.05, 10), "retries": 0},
+}
+
+RETRY_STATUS = (502, 503, 504)
+LAT_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def _env(name: str, default: str = "") -> str:
+    return (os.getenv(name) or default).strip()
+
+def _timeout_for(provider: str, cfg: dict):
+    raw = _env(f"HTTP_{provider.upper()}_TIMEOUT")
+    if not raw:
+        return cfg["timeout"]
+    try:
+        parts = [float(x) for x in raw.split(",")]
+        return (parts[0], parts[1]) if len(parts) > 1 else parts[0]
+    except Exception:
+        return cfg["timeout"]
+
+def _retries_for(provider: str, cfg: dict) -> int:
+    try:
+        return int(_env(f"HTTP_{provider.upper()}_RETRIES", str(cfg["retries"])))
+    except Exception:
+        return cfg["retries"]
+
+# ---------- Métricas ----------
+class ProviderStats:
+    """Contadores de un proveedor (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0        # excepciones (timeout, conexión...)
+        self.http_4xx = 0
+        self.http_5xx = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self.lat_sum_ms = 0.0
+        self.lat_max_ms = 0.0
+        self.buckets = [0] * (len(LAT_BUCKETS_MS) + 1)
+        self.last_error: Optional[str] = None
+
+    def observe(self, ms: float, status: Optional[int] = None, error: Optional[str] = None):
+        with self._lock:
+            self.count += 1
+            self.lat_sum_ms += ms
+            if ms > self.lat_max_ms:
+                self.lat_max_ms = ms
+            i = 0
+            while i < len(LAT_BUCKETS_MS) and ms > LAT_BUCKETS_MS[i]:
+                i += 1
+            self.buckets[i] += 1
+            if error:
+                self.errors += 1
+                self.last_error = error[:200]
+            elif status is not None:
+                if 400 <= status < 500: self.http_4xx += 1
+                elif status >= 500:     self.http_5xx += 1
+
+    def add_retry(self, denied: bool = False):
+        with self._lock:
+            if denied: self.retries_denied += 1
+            else:      self.retries += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count, "errors": self.errors,
+                "http_4xx": self.http_4xx, "http_5xx": self.http_5xx,
+                "retries": self.retries, "retries_denied": self.retries_denied,
+                "lat_avg_ms": round(self.lat_sum_ms / self.count, 1) if self.count else 0.0,
+                "lat_max_ms": round(self.lat_max_ms, 1),
+                "lat_sum_ms": round(self.lat_sum_ms, 1),
+                "buckets_ms": dict(zip([str(b) for b in LAT_BUCKETS_MS] + ["+Inf"], self.buckets)),
+                "last_error": self.last_error,
+            }
+
+# ---------- Presupuesto de reintentos ----------
+class RetryBudget:
+    """
+    Cubo de fichas: cada llamada deposita `ratio` fichas (hasta `cap`) y cada reintento
+    gasta una. Con el proveedor caído, los reintentos se cortan solos en vez de
+    multiplicar la carga (y el tiempo que cada worker pasa esperando).
+    """
+
+    def __init__(self, ratio: float, cap: float = 10.0):
+        self.ratio, self.cap = ratio, cap
+        self.tokens = cap
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+class _BudgetRetry(Retry):
+    """Retry de urllib3 que consulta el presupuesto del proveedor antes de reintentar."""
+
+    def __init__(self, *args, budget: Optional[RetryBudget] = None, stats: Optional[ProviderStats] = None, **kw):
+        super().__init__(*args, **kw)
+        self.budget, self.stats = budget, stats
+
+    def new(self, **kw):
+        r = super().new(**kw)
+        r.budget, r.stats = self.budget, self.stats
+        return r
+
+    def increment(self, *args, **kw):
+        if not self.total:
+            return super().increment(*args, **kw)   # sin reintentos configurados/pendientes
+        if self.budget is not None and not self.budget.withdraw():
+            if self.stats: self.stats.add_retry(denied=True)
+            # sin fichas: agota el Retry para que urllib3 devuelva/lance lo que tenga
+            spent = self.new(total=0, connect=0, read=0, status=0, other=0)
+            spent.budget = None
+            return spent.increment(*args, **kw)
+        if self.stats: self.stats.add_retry()
+        return super().increment(*args, **kw)
+
+# ---------- Circuit breaker ----------
+class CircuitBreaker:
+    """
+    closed → (N fallos seguidos) → open → (tras open_secs) → half_open → 1 prueba:
+    si va bien vuelve a closed, si falla vuelve a open. Mientras está open, allow()
+    devuelve False y el llamante responde al momento sin ocupar un worker esperando.
+    """
+
+    def __init__(self, name: str, fails: int = 5, open_secs: float = 30.0):
+        self.name, self.fails, self.open_secs = name, fails, open_secs
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.short_circuits = 0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_secs:
+                self.state = "half_open"
+                self._probe = False
+            if self.state == "half_open" and not self._probe:
+                self._probe = True      # deja pasar una sola petición de prueba
+                return True
+            self.short_circuits += 1
+            return False
+
+    def retry_after(self) -> int:
+        left = self.open_secs - (time.monotonic() - self.opened_at)
+        return max(1, int(left + 0.999))
+
+    def success(self):
+        with self._lock:
+            self.state, self.failures, self._probe = "closed", 0, False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.fails:
+                if self.state != "open":
+                    self.trips += 1
+                self.state, self.opened_at, self._probe = "open", time.monotonic(), False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "trips": self.trips,
+                    "short_circuits": self.short_circuits}
+
+# ---------- Sesiones ----------
+_sessions: Dict[str, requests.Session] = {}
+_stats: Dict[str, ProviderStats] = {}
+_budgets: Dict[str, RetryBudget] = {}
+_lock = threading.Lock()
+
+def _cfg(provider: str) -> dict:
+    return PROVIDERS.get(provider) or PROVIDERS["default"]
+
+def stats_for(provider: str) -> ProviderStats:
+    st = _stats.get(provider)
+    if st is None:
+        with _lock:
+            st = _stats.setdefault(provider, ProviderStats())
+    return st
+
+def session(provider: str) -> requests.Session:
+    """Session del proveedor (creada una vez por proceso; thread-safe para uso normal)."""
+    s = _sessions.get(provider)
+    if s is not None:
+        return s
+    with _lock:
+        s = _sessions.get(provider)
+        if s is not None:
+            return s
+        cfg = _cfg(provider)
+        st = _stats.setdefault(provider, ProviderStats())
+        try:
+            ratio = float(_env("HTTP_RETRY_BUDGET", "0.2"))
+        except Exception:
+            ratio = 0.2
+        budget = _budgets.setdefault(provider, RetryBudget(ratio))
+        n = _retries_for(provider, cfg)
+        retry = _BudgetRetry(
+            total=n, connect=n, read=n, status=n,
+            backoff_factor=0.2,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # POST solo se reintenta si no llegó a salir
+            raise_on_status=False,
+            respect_retry_after_header=False,
+            budget=budget, stats=st,
+        )
+        maxsize = int(_env("HTTP_POOL_MAXSIZE", "10") or 10)
+        adapter = HTTPAdapter(
+            pool_connections=4,           # hosts distintos por proveedor
+            pool_maxsize=maxsize,         # conexiones por host
+            pool_block=_env("HTTP_POOL_BLOCK", "0").lower() in ("1", "true", "yes"),
+            max_retries=retry,
+        )
+        s = requests.Session()
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        s.headers.update({"User-Agent": "spainroom-backend/1.0"})
+        _sessions[provider] = s
+        return s
+
+# ---------- API ----------
+def request(provider: str, method: str, url: str, **kw) -> requests.Response:
+    """Como requests.request(), pero con la Session, timeout y métricas del proveedor."""
+    cfg = _cfg(provider)
+    kw.setdefault("timeout", _timeout_for(provider, cfg))
+    s = session(provider)
+    st = stats_for(provider)
+    budget = _budgets.get(provider)
+    if budget:
+        budget.deposit()
+    t0 = time.perf_counter()
+    try:
+        r = s.request(method, url, **kw)
+    except Exception as e:
+        st.observe((time.perf_counter() - t0) * 1000, error=f"{type(e).__name__}: {e}")
+        raise
+    st.observe((time.perf_counter() - t0) * 1000, status=r.status_code)
+    return r
+
+def get(provider: str, url: str, **kw) -> requests.Response:
+    return request(provider, "GET", url, **kw)
+
+def post(provider: str, url: str, **kw) -> requests.Response:
+    return request(provider, "POST", url, **kw)
+
+def stats() -> Dict[str, dict]:
+    """Snapshot de métricas por proveedor (solo los que se han usado)."""
+    return {name: st.snapshot() for name, st in sorted(_stats.items())}
+
+def reset():
+    """Cierra sesiones y borra contadores (tests / tras fork)."""
+    with _lock:
+        for s in _sessions.values():
+            try: s.close()
+            except Exception: pass
+        _sessions.clear(); _stats.clear(); _budgets.clear()
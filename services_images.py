@@ -1,6 +1,6 @@
 # services_images.py
-import io, os, hashlib
-from PIL import Image
+import os, hashlib
+from image_engine import Variant, render
 
 def _sha256_bytes(b: bytes) -> str:
     import hashlib
@@ -9,18 +9,13 @@ def _sha256_bytes(b: bytes) -> str:
 def ensure_dir(path: str):
     os.makedirs(os.path.dirname(path), exist_ok=True)
 
+def _webp(in_fp, max_w, quality):
+    # una sola decodificación con draft JPEG (image_engine)
+    v = render(in_fp, [Variant("out", max_w, formats=("webp",), quality=quality)])["variants"]["out"]
+    return v["webp"], v["w"], v["h"]
+
 def process_to_webp(in_fp, max_w=1600, quality=86):
-    im = Image.open(in_fp).convert("RGB")
-    w, h = im.size
-    if w > max_w:
-        nh = int(h * (max_w / float(w)))
-        im = im.resize((max_w, nh), Image.LANCZOS)
-        w, h = im.size
-    buf = io.BytesIO()
-    im.save(buf, format="WEBP", quality=quality, method=6)
-    data = buf.getvalue()
-    return data, w, h
+    return _webp(in_fp, max_w, quality)
 
 def process_thumb_webp(in_fp, thumb_w=400, quality=80):
-    im = Image.open(in_fp).convert("RGB")
-    w, h = im.size
+    return _webp(in_fp, thumb_w, quality)
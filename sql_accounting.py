@@ -0,0 +1,139 @@
+# sql_accounting.py — Contabilidad de SQL por petición y detector de N+1
+#
+# Engancha before/after_cursor_execute de SQLAlchemy (todas las engines) y, dentro
+# de una petición Flask, cuenta sentencias y tiempo de BD. Agrupa las sentencias por
+# "forma" (SQL normalizado, sin literales ni listas IN); si la misma forma se repite
+# SQL_NPLUS1_THRESHOLD veces o más en una petición, se marca como probable N+1
+# (típico: un SELECT/COUNT dentro de un bucle por fila).
+#
+# Salida:
+#   - cabeceras X-SQL-Queries / X-SQL-NPlus1 en modo debug (app.debug o SQL_DEBUG_HEADERS=1)
+#   - métricas en /metrics: spainroom_sql_queries_total, spainroom_sql_seconds_total,
+#     spainroom_sql_nplus1_total (por regla de URL)
+#   - log WARNING "[SQL] N+1 ..." con la regla y la forma repetida
+#
+# Variables de entorno:
+#   SQL_ACCOUNTING        0 = desactivado (por defecto 1)
+#   SQL_NPLUS1_THRESHOLD  repeticiones de la misma forma para avisar (por defecto 5)
+#   SQL_DEBUG_HEADERS     1 = cabeceras también fuera de debug
+
+import os, re, time
+from typing import Optional
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import metrics
+
+_installed = False
+
+_RE_STR = re.compile(r"'(?:[^']|'')*'")
+_RE_NUM = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_IN = re.compile(r"\bIN\s*\((?:[^()]*)\)", re.I)
+_RE_WS = re.compile(r"\s+")
+
+def _env(name: str, default: str = "") -> str:
+    return (os.getenv(name) or default).strip()
+
+def _threshold() -> int:
+    try:
+        return max(2, int(_env("SQL_NPLUS1_THRESHOLD", "5")))
+    except Exception:
+        return 5
+
+def shape(statement: str) -> str:
+    """SQL normalizado: sin literales, números ni listas IN, espacios colapsados."""
+    s = _RE_STR.sub("?", statement)
+    s = _RE_IN.sub("IN (?)", s)
+    s = _RE_NUM.sub("?", s)
+    return _RE_WS.sub(" ", s).strip()
+
+class RequestSQL:
+    """Acumulado de una petición."""
+    __slots__ = ("count", "seconds", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        k = shape(statement)
+        self.shapes[k] = self.shapes.get(k, 0) + 1
+
+    def repeated(self, threshold: int):
+        """[(forma, veces)] de las formas que superan el umbral, de más a menos."""
+        return sorted(((k, n) for k, n in self.shapes.items() if n >= threshold), key=lambda x: -x[1])
+
+def current() -> Optional[RequestSQL]:
+    if not has_request_context():
+        return None
+    return g.get("_sql_acct")
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get("_sql_acct") is not None:
+        conn.info.setdefault("_sql_t0", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("_sql_t0")
+    if not stack:
+        return
+    t0 = stack.pop()
+    acct = current()
+    if acct is not None:
+        acct.add(statement, time.perf_counter() - t0)
+
+def _handle_error(ctx):
+    # la sentencia falló: no habrá after_cursor_execute, descarta su t0
+    conn = ctx.connection
+    if conn is not None and conn.info.get("_sql_t0"):
+        conn.info["_sql_t0"].pop()
+
+def _install_engine_hooks():
+    global _installed
+    if _installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    _installed = True
+
+def init_sql_accounting(app):
+    if _env("SQL_ACCOUNTING", "1").lower() in ("0", "false", "no", "off"):
+        return
+    if app.extensions.get("sql_accounting"):
+        return
+    app.extensions["sql_accounting"] = True
+    _install_engine_hooks()
+    metrics.describe("spainroom_sql_queries_total", "counter", "Sentencias SQL ejecutadas por regla de URL")
+    metrics.describe("spainroom_sql_seconds_total", "counter", "Tiempo en BD por regla de URL")
+    metrics.describe("spainroom_sql_nplus1_total", "counter", "Peticiones con sentencias repetidas (probable N+1)")
+    headers_always = _env("SQL_DEBUG_HEADERS", "0").lower() in ("1", "true", "yes", "on")
+
+    @app.before_request
+    def _sql_start():
+        g._sql_acct = RequestSQL()
+
+    @app.after_request
+    def _sql_report(resp):
+        acct = g.pop("_sql_acct", None)
+        if acct is None or not acct.count:
+            return resp
+        rep = acct.repeated(_threshold())
+        rule = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        labels = {"rule": rule}
+        metrics.inc("spainroom_sql_queries_total", labels, acct.count)
+        metrics.inc("spainroom_sql_seconds_total", labels, acct.seconds)
+        if rep:
+            metrics.inc("spainroom_sql_nplus1_total", labels)
+            k, n = rep[0]
+            app.logger.warning("[SQL] N+1 %s %s: %dx %s (total %d sentencias, %.1f ms)",
+                               request.method, rule, n, k[:300], acct.count, acct.seconds * 1000)
+        if app.debug or headers_always:
+            resp.headers["X-SQL-Queries"] = f"{acct.count}; ms={acct.seconds * 1000:.1f}; shapes={len(acct.shapes)}"
+            if rep:
+                resp.headers["X-SQL-NPlus1"] = "; ".join(f"{n}x {k[:120]}" for k, n in rep[:3])
+        return resp
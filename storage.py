@@ -0,0 +1,420 @@
+# storage.py — Documentos en disco local o en S3 (o compatible: MinIO) con el mismo código
+#
+# routes_owner_* creaban un cliente boto3 nuevo en cada petición (y otro más para firmar la
+# URL), y cada PDF subía como un único stream. Ahora:
+#
+# - backend() devuelve el almacén del proceso, S3Backend o LocalBackend, con los mismos métodos:
+#     put(fileobj, key, content_type)   → {"key", "size"}
+#     presign(key, expires)             → URL temporal de descarga
+#     exists(key)
+#     list(prefix)                      → claves bajo el prefijo (S3: paginado de 1000 en 1000)
+#     delete_batch(keys)                → {key: {ok, error?}} (S3: un DeleteObjects, ≤ 1000 claves)
+#   S3Backend usa un único cliente boto3 por proceso (thread-safe, con pool de conexiones);
+#   construirlo cuesta decenas de ms y ya no se paga por petición.
+# - Subidas a S3 con upload_fileobj + TransferConfig: a partir de S3_MULTIPART_THRESHOLD_MB el
+#   fichero va en partes de S3_MULTIPART_CHUNK_MB, S3_MAX_CONCURRENCY a la vez.
+# - S3_ENDPOINT_URL apunta a cualquier S3 compatible (MinIO, moto_server) con direccionamiento
+#   por ruta: en local se prueba el mismo camino que en producción.
+# - LocalBackend guarda bajo STORAGE_LOCAL_DIR y firma sus URLs con HMAC y caducidad; las sirve
+#   GET /api/owner/files/<key> (routes_owner_cedula.py).
+# - presign_many(keys, expires) firma muchas claves de una vez: las que tienen URL en caché (en
+#   memoria, hasta STORAGE_PRESIGN_MARGIN_S antes de caducar) no tocan S3; del resto se comprueba
+#   la existencia (head_object) con STORAGE_HEAD_CONCURRENCY a la vez y se firman en local.
+# - delete_many(keys) borra en lotes de DELETE_BATCH claves por DeleteObjects, varios lotes a la
+#   vez; con keys_under(prefix) se vacía una carpeta (cédulas de un propietario, una solicitud).
+#
+# Variables de entorno:
+#   STORAGE_BACKEND             s3|local (por defecto s3 si hay S3_BUCKET, si no local)
+#   S3_BUCKET                   bucket de documentos
+#   S3_ENDPOINT_URL             S3 compatible, p.ej. http://127.0.0.1:9000 (por defecto AWS)
+#   AWS_REGION                  región (por defecto us-east-1)
+#   AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY
+#                               opcionales: sin ellas boto3 usa su cadena por defecto (perfil,
+#                               AWS_PROFILE, rol de la instancia/tarea...)
+#   S3_MULTIPART_THRESHOLD_MB   tamaño a partir del que se sube por partes (por defecto 5, el mínimo de S3)
+#   S3_MULTIPART_CHUNK_MB       tamaño de parte (por defecto 5)
+#   S3_MAX_CONCURRENCY          partes subiendo a la vez (por defecto 8)
+#   STORAGE_LOCAL_DIR           carpeta del backend local (por defecto <instance>/storage)
+#   STORAGE_URL_SECRET          clave HMAC de las URLs locales (por defecto SECRET_KEY de la app o JWT_SECRET).
+#                               Las claves por defecto del repo (sr-dev-secret...) no valen: sin una
+#                               clave real no se firman ni se sirven URLs locales (error en log)
+#   STORAGE_PRESIGN_MARGIN_S    una URL en caché deja de servirse cuando le quedan menos de estos
+#                               segundos (por defecto 300, como mucho la mitad de su validez)
+#   STORAGE_PRESIGN_CACHE_MAX   URLs firmadas en caché por worker (por defecto 10000)
+#   STORAGE_HEAD_CONCURRENCY    comprobaciones de existencia a la vez en presign_many (por defecto 16)
+
+import os, time, hmac, shutil, hashlib, logging, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterable, Optional
+from urllib.parse import quote
+
+from flask import current_app
+
+import metrics
+
+log = logging.getLogger("storage")
+
+MB = 1024 * 1024
+DELETE_BATCH = 1000   # máximo de claves por DeleteObjects
+
+_lock = threading.Lock()
+_client = None
+_client_key = None
+_backend = None
+_backend_key = None
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_pid = None
+_urls: "OrderedDict[tuple, tuple]" = OrderedDict()   # (backend, raíz, key, expires) → (url, caduca)
+_urls_lock = threading.Lock()
+
+metrics.describe("spainroom_presign_total", "counter", "URLs firmadas de documentos por backend y resultado de caché")
+metrics.describe("spainroom_storage_deleted_total", "counter", "Claves borradas del almacén por backend y resultado")
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or str(default)).strip())
+    except Exception:
+        return default
+
+def _env(name: str, default: str = "") -> str:
+    return (os.getenv(name) or default).strip()
+
+def mode() -> str:
+    """s3 | local según STORAGE_BACKEND (o lo que haya configurado)."""
+    m = _env("STORAGE_BACKEND").lower()
+    if m in ("s3", "local"):
+        return m
+    if _env("S3_BUCKET"):   # credenciales: las de entorno o la cadena por defecto de boto3
+        return "s3"
+    return "local"
+
+# ---------- S3 ----------
+def _s3_settings() -> tuple:
+    return (_env("S3_ENDPOINT_URL") or None, _env("AWS_REGION", "us-east-1"),
+            _env("AWS_ACCESS_KEY_ID") or None, _env("AWS_SECRET_ACCESS_KEY") or None,
+            max(1, _int("S3_MAX_CONCURRENCY", 8)))
+
+def client():
+    """Cliente boto3 del proceso (se rehace si cambia la configuración o tras un fork)."""
+    global _client, _client_key
+    key = (os.getpid(),) + _s3_settings()
+    with _lock:
+        if _client is None or _client_key != key:
+            import boto3
+            from botocore.config import Config
+            endpoint, region, access, secret, concurrency = key[1:]
+            _client = boto3.session.Session().client(
+                "s3", endpoint_url=endpoint, region_name=region,
+                aws_access_key_id=access, aws_secret_access_key=secret,
+                config=Config(
+                    signature_version="s3v4",
+                    max_pool_connections=max(10, concurrency * 2),   # partes + peticiones a la vez
+                    retries={"max_attempts": 5, "mode": "standard"},
+                    s3={"addressing_style": "path" if endpoint else "auto"},
+                ))
+            _client_key = key
+        return _client
+
+def transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    threshold = max(5, _int("S3_MULTIPART_THRESHOLD_MB", 5)) * MB   # S3 no admite partes de < 5 MB
+    return TransferConfig(multipart_threshold=threshold,
+                          multipart_chunksize=max(5, _int("S3_MULTIPART_CHUNK_MB", 5)) * MB,
+                          max_concurrency=max(1, _int("S3_MAX_CONCURRENCY", 8)),
+                          use_threads=True)
+
+def _size(fileobj: BinaryIO) -> Optional[int]:
+    try:
+        pos = fileobj.tell()
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell() - pos
+        fileobj.seek(pos)
+        return size
+    except Exception:
+        return None
+
+class S3Backend:
+    name = "s3"
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+
+    def put(self, fileobj: BinaryIO, key: str, content_type: str) -> dict:
+        """Sube fileobj (por partes en paralelo si es grande). ClientError/BotoCoreError si falla."""
+        size = _size(fileobj)
+        t0 = time.perf_counter()
+        client().upload_fileobj(Fileobj=fileobj, Bucket=self.bucket, Key=key,
+                                ExtraArgs={"ContentType": content_type, "ACL": "private"},
+                                Config=transfer_config())
+        log.info("[storage] s3 %s: %s bytes en %.0f ms", key, size, (time.perf_counter() - t0) * 1000)
+        return {"key": key, "size": size}
+
+    def presign(self, key: str, expires: int) -> str:
+        return client().generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key},
+                                               ExpiresIn=expires)
+
+    def exists(self, key: str) -> bool:
+        """head_object; False si no existe, ClientError con cualquier otro error."""
+        from botocore.exceptions import ClientError
+        try:
+            client().head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def list(self, prefix: str):
+        for page in client().get_paginator("list_objects_v2").paginate(
+                Bucket=self.bucket, Prefix=prefix, PaginationConfig={"PageSize": DELETE_BATCH}):
+            for obj in page.get("Contents") or []:
+                yield obj["Key"]
+
+    def delete_batch(self, keys) -> Dict[str, dict]:
+        """Un DeleteObjects (≤ DELETE_BATCH claves) con resultado por clave."""
+        resp = client().delete_objects(Bucket=self.bucket, Delete={
+            "Objects": [{"Key": k} for k in keys], "Quiet": False})
+        out = {d["Key"]: {"ok": True} for d in resp.get("Deleted") or []}
+        for e in resp.get("Errors") or []:
+            out[e["Key"]] = {"ok": False, "error": e.get("Code") or "delete_failed",
+                             "detail": (e.get("Message") or "")[:200]}
+        for k in keys:
+            out.setdefault(k, {"ok": False, "error": "no_result"})
+        return out
+
+# ---------- disco local ----------
+# por defecto en el código o en render.yaml: públicas, cualquiera podría firmar con ellas
+_PUBLIC_SECRETS = (b"sr-dev-secret", b"sr-prod-secret")
+
+class NoUrlSecret(RuntimeError):
+    """No hay clave real configurada para firmar URLs del backend local."""
+
+def _secret() -> Optional[bytes]:
+    """Primera clave configurada que no sea una de las públicas, o None."""
+    for s in (_env("STORAGE_URL_SECRET"), current_app.secret_key, _env("JWT_SECRET")):
+        if isinstance(s, str):
+            s = s.strip().encode()
+        if s and s not in _PUBLIC_SECRETS:
+            return s
+    log.error("[storage] sin STORAGE_URL_SECRET/SECRET_KEY/JWT_SECRET propia: URLs locales desactivadas")
+    return None
+
+def sign(key: str, exp: int) -> str:
+    secret = _secret()
+    if secret is None:
+        raise NoUrlSecret("STORAGE_URL_SECRET no configurada")
+    return hmac.new(secret, f"{key}\n{exp}".encode(), hashlib.sha256).hexdigest()
+
+def verify(key: str, exp: int, sig: str) -> bool:
+    if exp < time.time() or _secret() is None:
+        return False
+    return hmac.compare_digest(sign(key, exp), sig or "")
+
+class LocalBackend:
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> Optional[str]:
+        """Ruta absoluta de `key`, o None si se sale de la carpeta (.., absolutas)."""
+        parts = [p for p in key.split("/") if p]
+        if not parts or any(p in (".", "..") for p in parts):
+            return None
+        return os.path.join(self.root, *parts)
+
+    def put(self, fileobj: BinaryIO, key: str, content_type: str) -> dict:
+        """Copia por bloques a un temporal y lo renombra (atómico)."""
+        path = self.path(key)
+        if path is None:
+            raise ValueError(f"clave no válida: {key!r}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            fileobj.seek(0)
+        except Exception:
+            pass
+        with open(tmp, "wb") as out:
+            shutil.copyfileobj(fileobj, out, MB)
+        os.replace(tmp, path)
+        return {"key": key, "size": os.path.getsize(path)}
+
+    def presign(self, key: str, expires: int) -> str:
+        exp = int(time.time()) + int(expires)
+        return f"/api/owner/files/{quote(key)}?exp={exp}&sig={sign(key, exp)}"
+
+    def exists(self, key: str) -> bool:
+        path = self.path(key)
+        return bool(path) and os.path.isfile(path)
+
+    def list(self, prefix: str):
+        """Claves que empiezan por `prefix` (como en S3: "cedulas/ab" incluye "cedulas/abc.pdf")."""
+        start = self.path(prefix.rsplit("/", 1)[0]) if "/" in prefix.strip("/") else self.root
+        if not start or not os.path.isdir(start):
+            return
+        for dirpath, dirs, names in os.walk(start):
+            dirs.sort()
+            rel = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            for n in sorted(names):
+                key = n if rel == "." else f"{rel}/{n}"
+                if key.startswith(prefix) and not n.endswith(".part"):
+                    yield key
+
+    def delete_batch(self, keys) -> Dict[str, dict]:
+        """Como S3: borrar una clave que no existe cuenta como borrada."""
+        out = {}
+        for key in keys:
+            path = self.path(key)
+            if path is None:
+                out[key] = {"ok": False, "error": "bad_key"}
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                out[key] = {"ok": False, "error": "delete_failed", "detail": str(e)[:200]}
+                continue
+            self._prune(os.path.dirname(path))
+            out[key] = {"ok": True}
+        return out
+
+    def _prune(self, d: str):
+        """Quita las carpetas vacías que deja el borrado, sin salir de root."""
+        root = os.path.abspath(self.root)
+        d = os.path.abspath(d)
+        while d != root and d.startswith(root + os.sep):
+            try:
+                os.rmdir(d)
+            except OSError:
+                return
+            d = os.path.dirname(d)
+
+def local_backend() -> LocalBackend:
+    return LocalBackend(_env("STORAGE_LOCAL_DIR") or os.path.join(current_app.instance_path, "storage"))
+
+def backend():
+    """Almacén configurado (uno por proceso y configuración)."""
+    global _backend, _backend_key
+    m = mode()
+    key = (m, _env("S3_BUCKET")) if m == "s3" else (m, local_backend().root)
+    with _lock:
+        if _backend is None or _backend_key != key:
+            _backend = S3Backend(key[1]) if m == "s3" else LocalBackend(key[1])
+            _backend_key = key
+        return _backend
+
+# ---------- URLs firmadas en lote (con caché) ----------
+def _executor() -> ThreadPoolExecutor:
+    global _pool, _pool_pid
+    with _lock:
+        # gunicorn hace fork después de importar: cada worker necesita sus propios hilos
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=max(1, _int("STORAGE_HEAD_CONCURRENCY", 16)),
+                                       thread_name_prefix="storage-head")
+            _pool_pid = os.getpid()
+        return _pool
+
+def _root(be) -> str:
+    return be.bucket if be.name == "s3" else be.root
+
+def _cached_url(be, key: str, expires: int, now: float) -> Optional[tuple]:
+    margin = min(_int("STORAGE_PRESIGN_MARGIN_S", 300), expires // 2)
+    ck = (be.name, _root(be), key, expires)
+    with _urls_lock:
+        hit = _urls.get(ck)
+        if hit is None:
+            return None
+        if hit[1] - now <= margin:
+            del _urls[ck]
+            return None
+        _urls.move_to_end(ck)
+        return hit
+
+def _remember_url(be, key: str, expires: int, url: str, until: float):
+    with _urls_lock:
+        _urls[(be.name, _root(be), key, expires)] = (url, until)
+        while len(_urls) > max(1, _int("STORAGE_PRESIGN_CACHE_MAX", 10000)):
+            _urls.popitem(last=False)
+
+def forget(keys: Iterable[str]):
+    """Quita de la caché las URLs de estas claves (al borrarlas)."""
+    gone = set(keys)
+    with _urls_lock:
+        for ck in [ck for ck in _urls if ck[2] in gone]:
+            del _urls[ck]
+
+def presign_many(keys: Iterable[str], expires: int, be=None) -> Dict[str, dict]:
+    """
+    {key: {ok, presigned_url, expires_at} | {ok: False, error: not_found|head_error|presign_failed}}
+    Las URLs en caché no tocan el almacén; del resto, existencia y firma en paralelo.
+    """
+    be = be or backend()
+    now = time.time()
+    out: Dict[str, dict] = {}
+    todo = []
+    for key in dict.fromkeys(keys):   # sin duplicados, en orden
+        hit = _cached_url(be, key, expires, now)
+        if hit:
+            out[key] = {"ok": True, "presigned_url": hit[0], "expires_at": int(hit[1])}
+        else:
+            todo.append(key)
+    if out:
+        metrics.inc("spainroom_presign_total", {"backend": be.name, "cache": "hit"}, len(out))
+
+    def one(key):
+        try:
+            if not be.exists(key):
+                return key, {"ok": False, "error": "not_found"}
+        except Exception as e:
+            return key, {"ok": False, "error": "head_error", "detail": str(e)[:200]}
+        try:
+            until = time.time() + expires
+            url = be.presign(key, expires)
+        except Exception as e:
+            return key, {"ok": False, "error": "presign_failed", "detail": str(e)[:200]}
+        _remember_url(be, key, expires, url, until)
+        return key, {"ok": True, "presigned_url": url, "expires_at": int(until)}
+
+    if todo:
+        # local: stat() + HMAC (y necesita el contexto de la app); S3: un head_object por clave
+        results = _executor().map(one, todo) if be.name == "s3" and len(todo) > 1 else map(one, todo)
+        for key, res in results:
+            out[key] = res
+        metrics.inc("spainroom_presign_total", {"backend": be.name, "cache": "miss"}, len(todo))
+    return out
+
+# ---------- borrado en lote ----------
+def keys_under(prefix: str, limit: int, be=None) -> tuple:
+    """([claves bajo prefix], truncado) con como mucho `limit` claves."""
+    be = be or backend()
+    keys = []
+    for key in be.list(prefix):
+        if len(keys) >= limit:
+            return keys, True
+        keys.append(key)
+    return keys, False
+
+def delete_many(keys: Iterable[str], be=None) -> Dict[str, dict]:
+    """{key: {ok, error?}}: lotes de DELETE_BATCH claves, varios a la vez en S3."""
+    be = be or backend()
+    keys = list(dict.fromkeys(keys))
+    batches = [keys[i:i + DELETE_BATCH] for i in range(0, len(keys), DELETE_BATCH)]
+
+    def one(batch):
+        try:
+            return be.delete_batch(batch)
+        except Exception as e:   # el lote entero (credenciales, red): error en cada clave
+            return {k: {"ok": False, "error": "delete_failed", "detail": str(e)[:200]} for k in batch}
+
+    out: Dict[str, dict] = {}
+    results = _executor().map(one, batches) if be.name == "s3" and len(batches) > 1 else map(one, batches)
+    for res in results:
+        out.update(res)
+    forget(k for k, r in out.items() if r["ok"])
+    ok = sum(1 for r in out.values() if r["ok"])
+    metrics.inc("spainroom_storage_deleted_total", {"backend": be.name, "result": "ok"}, ok)
+    if len(out) > ok:
+        metrics.inc("spainroom_storage_deleted_total", {"backend": be.name, "result": "error"}, len(out) - ok)
+    return out
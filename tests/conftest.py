@@ -0,0 +1,33 @@
+# conftest.py — App de pruebas: SQLite, instance/ y generaciones de caché en un tmp por test
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_DIR", str(tmp_path / "cache"))
+    import response_cache
+    from app import create_app
+    from extensions import db
+    import models_rooms, models_contracts, models_uploads, models_franchise  # noqa: F401  (tablas)
+
+    monkeypatch.setattr(response_cache, "_dir", None)
+    response_cache.clear()
+    application = create_app({"TESTING": True,
+                              "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}"})
+    application.instance_path = str(tmp_path / "instance")
+    os.makedirs(os.path.join(application.instance_path, "uploads"))
+    with application.app_context():
+        db.create_all()
+    yield application
+    with application.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
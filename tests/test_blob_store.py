@@ -0,0 +1,63 @@
+# blob_store: un blob por contenido, refcount = filas que lo usan, borrado solo tras el commit
+import os
+from datetime import datetime, timedelta
+
+import blob_store
+from extensions import db
+from models_uploads import Blob, Upload
+
+
+def _put(app, raw=b"%PDF-1.4 ficha", **kw):
+    blob = blob_store.put(raw, ".pdf", "application/pdf", **kw)
+    db.session.commit()
+    return blob
+
+
+def _dir(blob):
+    return os.path.dirname(blob_store.abs_path(blob["rel"]))
+
+
+def test_same_content_is_stored_once(app):
+    with app.test_request_context():
+        a, b = _put(app), _put(app)
+        assert a["blob"] == b["blob"] and a["rel"] == b["rel"]
+        assert db.session.query(Blob).count() == 1
+        assert os.listdir(_dir(a)) == ["original.pdf"]
+
+
+def test_release_to_zero_unlinks_after_commit_only(app):
+    with app.test_request_context():
+        blob = _put(app)
+        blob_store.link(blob["blob"], 2)
+        db.session.commit()
+
+        blob_store.release(blob["blob"])
+        db.session.commit()
+        assert db.session.get(Blob, blob["blob"]).refcount == 1
+
+        blob_store.release(blob["blob"])
+        assert os.path.isdir(_dir(blob))    # aún sin commit: nada borrado
+        db.session.rollback()
+        assert os.path.isdir(_dir(blob))
+        assert db.session.get(Blob, blob["blob"]).refcount == 1
+
+        blob_store.release(blob["blob"])
+        db.session.commit()
+        assert db.session.get(Blob, blob["blob"]) is None
+        assert not os.path.exists(_dir(blob))
+
+
+def test_gc_recounts_references_and_drops_unused_blobs(app):
+    with app.test_request_context():
+        used, unused = _put(app, b"usado"), _put(app, b"sin uso", private=True)
+        db.session.add_all([Upload(role="room", category="room_sheet", path=used["url"], blob_sha256=used["blob"])
+                            for _ in range(2)])
+        old = datetime.utcnow() - timedelta(seconds=blob_store.GC_GRACE_S + 60)
+        db.session.query(Blob).update({"refcount": 7, "created_at": old})
+        db.session.commit()
+
+        out = blob_store.gc()
+        assert (out["refcount_fixed"], out["removed"]) == (1, 1)
+        assert db.session.get(Blob, used["blob"]).refcount == 2
+        assert db.session.get(Blob, unused["blob"]) is None
+        assert not os.path.exists(_dir(unused)) and os.path.isdir(_dir(used))
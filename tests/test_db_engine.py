@@ -0,0 +1,19 @@
+# db_engine: statement_timeout solo si se pide y URLs postgres:// normalizadas
+from db_engine import engine_options, normalize_url
+
+PG = "postgresql+psycopg2://u:p@db.example.com/spainroom"
+
+
+def test_statement_timeout_is_opt_in(monkeypatch):
+    monkeypatch.delenv("DB_STATEMENT_TIMEOUT_MS", raising=False)
+    opts = engine_options(PG)["connect_args"]["options"]
+    assert "statement_timeout" not in opts
+    assert "idle_in_transaction_session_timeout" in opts
+
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "15000")
+    assert "-c statement_timeout=15000" in engine_options(PG)["connect_args"]["options"]
+
+
+def test_heroku_style_url_is_normalized():
+    assert normalize_url("postgres://u:p@h/db", "sqlite://") == "postgresql+psycopg2://u:p@h/db"
+    assert normalize_url("", "sqlite:///./spainroom.db") == "sqlite:///./spainroom.db"
@@ -0,0 +1,61 @@
+# Ficheros de /instance/uploads y /img: lo público se sirve con caché inmutable, lo privado nunca
+import io
+
+from PIL import Image
+
+import blob_store
+from extensions import db
+
+
+def _jpeg() -> bytes:
+    b = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 40, 40)).save(b, "JPEG")
+    return b.getvalue()
+
+
+def _upload_dni(client, raw: bytes) -> dict:
+    rv = client.post("/api/upload", data={"role": "tenant", "subject_id": "600111222", "category": "dni",
+                                          "file": (io.BytesIO(raw), "dni.jpg")},
+                     content_type="multipart/form-data")
+    assert rv.status_code == 200
+    return rv.get_json()["file"]
+
+
+def test_private_documents_are_not_served(app, client, monkeypatch):
+    raw = _jpeg()
+    f = _upload_dni(client, raw)
+    sha = blob_store.digest(raw)
+    assert f["path"].startswith("/instance/uploads/private/")
+
+    assert client.get(f["path"]).status_code == 404
+    # ni por la ruta pública del mismo sha, ni como variante de imagen
+    assert client.get(f"/instance/uploads/blobs/{sha[:2]}/{sha}/original.jpg").status_code == 404
+    assert client.get(f"/img/{sha}?w=320").status_code == 404
+    # aunque alguien añada private a los prefijos públicos
+    monkeypatch.setenv("UPLOADS_PUBLIC_PREFIXES", "blobs,contracts,private")
+    assert client.get(f["path"]).status_code == 404
+
+
+def test_photo_blob_is_public_and_immutable(app, client):
+    raw = _jpeg()
+    with app.test_request_context():
+        blob = blob_store.put(raw, ".jpg", "image/jpeg")
+        blob_store.link(blob["blob"])
+        db.session.commit()
+
+    rv = client.get(blob["url"])
+    assert rv.status_code == 200 and rv.data == raw
+    assert "immutable" in rv.headers["Cache-Control"]
+    again = client.get(blob["url"], headers={"If-None-Match": rv.headers["ETag"]})
+    assert again.status_code == 304
+    assert client.get(f"/img/{blob['blob']}?w=320").status_code == 200
+
+
+def test_same_content_private_then_public_keeps_both_apart(app, client):
+    raw = _jpeg()
+    f = _upload_dni(client, raw)
+    with app.test_request_context():
+        blob = blob_store.put(raw, ".jpg", "image/jpeg")
+        db.session.commit()
+    assert client.get(blob["url"]).status_code == 200
+    assert client.get(f["path"]).status_code == 404
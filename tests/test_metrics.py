@@ -0,0 +1,52 @@
+# /metrics cerrado sin METRICS_TOKEN; los ficheros de workers muertos se fusionan una vez y se borran
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def mdir(tmp_path, monkeypatch):
+    d = tmp_path / "metrics"
+    monkeypatch.setenv("METRICS_DIR", str(d))
+    monkeypatch.setattr(metrics, "_dir", None)
+    return d
+
+
+def _dead_pid() -> int:
+    p = subprocess.Popen([sys.executable, "-c", "pass"])
+    p.wait()
+    return p.pid
+
+
+def test_metrics_endpoint_is_closed_without_token(client, mdir, monkeypatch):
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    assert client.get("/metrics").status_code == 403
+    monkeypatch.setenv("METRICS_TOKEN", "s3cr3t")
+    assert client.get("/metrics?token=otro").status_code == 403
+    rv = client.get("/metrics", headers={"X-Metrics-Token": "s3cr3t"})
+    assert rv.status_code == 200 and b"spainroom_http_requests_total" in rv.data
+
+
+def test_dead_worker_files_are_folded_once_and_removed(mdir):
+    metrics.metrics_dir()
+    pid = _dead_pid()
+    worker = mdir / f"worker_{pid}.json"
+    worker.write_text(json.dumps({"pid": pid, "ts": 1.0, "gauges": [["g", [], 3]],
+                                  "counters": [["spainroom_test_total", [["k", "v"]], 5]], "hists": []}))
+    key = ("spainroom_test_total", (("k", "v"),))
+
+    first = metrics.collect()
+    assert first["counters"][key] == 5 and ("g", ()) not in first["gauges"]
+    assert not worker.exists() and (mdir / metrics.DEAD_FILE).exists()
+    assert metrics.collect()["counters"][key] == 5   # sin doble suma
+
+    # el mismo fichero reaparece (fallo entre escribir dead.json y borrarlo): no se vuelve a sumar
+    worker.write_text(json.dumps({"pid": pid, "ts": 1.0, "counters": [["spainroom_test_total", [["k", "v"]], 5]]}))
+    metrics.mark_process_dead(pid, str(mdir))
+    assert metrics.collect()["counters"][key] == 5
+    assert sorted(os.listdir(mdir)) == [".lock", metrics.DEAD_FILE, f"worker_{os.getpid()}.json"]
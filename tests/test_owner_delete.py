@@ -0,0 +1,59 @@
+# Borrado de documentos: cerrado sin ADMIN_API_KEY (una clave o en lote), lotes de 1000 y truncated con prefijos grandes
+import os
+
+import pytest
+
+import routes_owner_delete
+import storage
+
+
+@pytest.fixture
+def docs(monkeypatch, tmp_path):
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("STORAGE_LOCAL_DIR", str(tmp_path / "storage"))
+    folder = tmp_path / "storage" / "cedulas" / "SRV-CHK-1"
+    folder.mkdir(parents=True)
+    for i in range(2500):
+        (folder / f"{i:04d}.pdf").write_bytes(b"%PDF")
+    return folder
+
+
+def _bulk(client, body, key=None):
+    return client.post("/api/owner/cedula/delete/bulk", json=body,
+                       headers={"X-Admin-Key": key} if key else {})
+
+
+def test_bulk_delete_fails_closed_without_admin_key(client, docs, monkeypatch):
+    monkeypatch.setattr(routes_owner_delete, "ADMIN_KEY", "")
+    for body in ({"prefix": "cedulas/"}, {"keys": ["cedulas/SRV-CHK-1/0000.pdf"]}):
+        rv = _bulk(client, body)
+        assert rv.status_code == 403 and rv.get_json()["error"] == "admin_key_not_configured"
+    assert len(os.listdir(docs)) == 2500
+
+
+def test_single_delete_fails_closed_without_admin_key(client, docs, monkeypatch):
+    monkeypatch.setattr(routes_owner_delete, "ADMIN_KEY", "")
+    rv = client.delete("/api/owner/cedula/delete", json={"s3_key": "cedulas/SRV-CHK-1/0000.pdf"})
+    assert rv.status_code == 403 and rv.get_json()["error"] == "admin_key_not_configured"
+    assert (docs / "0000.pdf").exists()
+    monkeypatch.setattr(routes_owner_delete, "ADMIN_KEY", "k")
+    rv = client.delete("/api/owner/cedula/delete", json={"s3_key": "cedulas/SRV-CHK-1/0000.pdf"},
+                       headers={"X-Admin-Key": "k"})
+    assert rv.get_json()["ok"] is True and not (docs / "0000.pdf").exists()
+
+
+def test_prefix_delete_runs_in_batches_and_reports_truncated(client, docs, monkeypatch):
+    monkeypatch.setattr(routes_owner_delete, "ADMIN_KEY", "k")
+    monkeypatch.setattr(routes_owner_delete, "BULK_DELETE_MAX", 2000)
+    sizes = []
+    real = storage.LocalBackend.delete_batch
+    monkeypatch.setattr(storage.LocalBackend, "delete_batch",
+                        lambda self, keys: sizes.append(len(keys)) or real(self, keys))
+
+    assert _bulk(client, {"prefix": "cedulas/SRV-CHK-1/"}, key="mala").status_code == 401
+    first = _bulk(client, {"prefix": "cedulas/SRV-CHK-1/"}, key="k").get_json()
+    assert (first["ok"], first["deleted"], first["truncated"]) == (True, 2000, True)
+    assert sizes == [1000, 1000]
+    second = _bulk(client, {"prefix": "cedulas/SRV-CHK-1/"}, key="k").get_json()
+    assert (second["deleted"], second["truncated"]) == (500, False)
+    assert not docs.exists()   # carpetas vacías podadas
@@ -0,0 +1,20 @@
+# URLs firmadas en lote: cerrado sin ADMIN_API_KEY, como el borrado en lote
+import routes_owner_presign
+
+
+def test_presign_batch_fails_closed_without_admin_key(client, monkeypatch, tmp_path):
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("STORAGE_LOCAL_DIR", str(tmp_path / "storage"))
+    monkeypatch.setenv("STORAGE_URL_SECRET", "test-secret")
+    (tmp_path / "storage" / "cedulas").mkdir(parents=True)
+    (tmp_path / "storage" / "cedulas" / "a.pdf").write_bytes(b"%PDF")
+    body = {"keys": ["cedulas/a.pdf", "cedulas/b.pdf"]}
+
+    monkeypatch.setattr(routes_owner_presign, "ADMIN_KEY", "")
+    rv = client.post("/api/owner/cedula/presign/batch", json=body)
+    assert rv.status_code == 403 and rv.get_json()["error"] == "admin_key_not_configured"
+
+    monkeypatch.setattr(routes_owner_presign, "ADMIN_KEY", "k")
+    assert client.post("/api/owner/cedula/presign/batch", json=body).status_code == 401
+    res = client.post("/api/owner/cedula/presign/batch", json=body, headers={"X-Admin-Key": "k"}).get_json()
+    assert [(r["key"], r["ok"]) for r in res["results"]] == [("cedulas/a.pdf", True), ("cedulas/b.pdf", False)]
@@ -0,0 +1,42 @@
+# photo_jobs: un trabajo abandonado (worker caído) lo retoma un solo worker; uno vivo no se toca
+from datetime import datetime, timedelta
+
+import pytest
+
+import photo_jobs
+from extensions import db
+from models_uploads import PhotoJob
+
+
+@pytest.fixture
+def job(app):
+    def _make(status, idle_s):
+        with app.app_context():
+            j = PhotoJob(id=f"PJ-{status}-{idle_s}", status=status, mode="plain", room_id=1, item_id=1,
+                         files=[{"name": "a.jpg"}, {"name": "b.jpg"}], results=["ok"],
+                         updated_at=datetime.utcnow() - timedelta(seconds=idle_s))
+            db.session.add(j)
+            db.session.commit()
+            return j.id
+    return _make
+
+
+def test_stale_job_is_resumed_and_claimed_once(app, job, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(photo_jobs, "submit", submitted.append)
+    stale, live = job("running", 600), job("running", 5)
+    with app.app_context():
+        assert photo_jobs.resume_if_stale(photo_jobs.get(stale)) is True
+        assert photo_jobs.resume_if_stale(photo_jobs.get(live)) is False
+        assert submitted == [stale]
+        # dos workers a la vez: solo uno pasa a running y sigue desde la 1ª foto pendiente
+        assert [photo_jobs._claim(stale), photo_jobs._claim(stale)] == [True, False]
+        assert photo_jobs._claim(live) is False
+
+
+def test_finished_jobs_are_not_resumed(app, job, monkeypatch):
+    monkeypatch.setattr(photo_jobs, "submit", lambda job_id: pytest.fail("no debe reenviarse"))
+    done = job("done", 600)
+    with app.app_context():
+        assert photo_jobs.resume_if_stale(photo_jobs.get(done)) is False
+        assert photo_jobs._claim(done) is False
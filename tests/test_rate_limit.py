@@ -0,0 +1,59 @@
+# Token bucket: una petición denegada no gasta fichas y la clave no la elige el cliente
+import pytest
+from flask import Flask
+
+import rate_limit
+from rate_limit import MemoryBackend, SQLiteBackend, parse_rate
+
+HOUR = parse_rate("10/hour")
+MINUTE = parse_rate("1/minute")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / "rl.db"))
+
+
+def _left(b, key, rate, now):
+    return b.take_all([(key, rate)], cost=0, now=now).remaining
+
+
+def test_denied_request_does_not_consume_earlier_buckets(backend):
+    items = [("h", HOUR), ("m", MINUTE)]
+    assert backend.take_all(items, now=1000.0).allowed
+    for _ in range(5):
+        d = backend.take_all(items, now=1000.0)
+        assert not d.allowed
+        assert d.retry_after == pytest.approx(60.0)
+    # el cupo horario solo ha pagado la petición permitida
+    assert _left(backend, "h", HOUR, 1000.0) == pytest.approx(9.0)
+
+
+def test_retry_after_is_the_longest_wait(backend):
+    items = [("h", parse_rate("1/hour")), ("m", MINUTE)]
+    assert backend.take_all(items, now=0.0).allowed
+    d = backend.take_all(items, now=0.0)
+    assert not d.allowed and d.retry_after == pytest.approx(3600.0)
+
+
+def test_allowed_debits_every_bucket(backend):
+    items = [("a", parse_rate("5/minute")), ("b", parse_rate("3/minute"))]
+    d = backend.take_all(items, now=0.0)
+    assert d.allowed and d.remaining == pytest.approx(2.0)
+    assert _left(backend, "a", items[0][1], 0.0) == pytest.approx(4.0)
+
+
+def test_gate_ignores_forwarded_for(monkeypatch):
+    monkeypatch.setitem(rate_limit.POLICIES, "global", [parse_rate("2/minute")])
+    monkeypatch.setattr(rate_limit, "_backend", MemoryBackend())
+    app = Flask(__name__)
+    rate_limit.init_rate_limits(app, route_policies=[])
+    app.add_url_rule("/ping", "ping", lambda: "pong")
+    c = app.test_client()
+    codes = [c.get("/ping", headers={"X-Forwarded-For": f"10.0.0.{i}", "Authorization": f"x{i}"}).status_code
+             for i in range(3)]
+    assert codes == [200, 200, 429]
+    # otra IP real sí tiene su propio cupo
+    assert c.get("/ping", environ_base={"REMOTE_ADDR": "192.0.2.7"}).status_code == 200
@@ -0,0 +1,43 @@
+# Caché de /api/rooms/published: ETag/304, invalidación al escribir y errores que no se cachean
+import pytest
+
+import room_images
+from extensions import db
+from models_rooms import Room
+
+
+@pytest.fixture
+def room(app):
+    with app.app_context():
+        r = Room(code="ROOM-1", direccion="C/ Betis 1", ciudad="Sevilla", provincia="Sevilla",
+                 precio=400, published=True)
+        db.session.add(r)
+        db.session.commit()
+        return r.id
+
+
+def test_etag_and_invalidation_on_write(app, client, room):
+    first = client.get("/api/rooms/published")
+    assert first.status_code == 200 and [r["code"] for r in first.get_json()] == ["ROOM-1"]
+    etag = first.headers["ETag"]
+    assert client.get("/api/rooms/published", headers={"If-None-Match": etag}).status_code == 304
+
+    with app.app_context():
+        db.session.get(Room, room).precio = 450
+        db.session.commit()
+    after = client.get("/api/rooms/published", headers={"If-None-Match": etag})
+    assert after.status_code == 200 and after.get_json()[0]["precio"] == 450
+
+
+def test_db_error_is_a_500_and_is_not_cached(app, client, room, monkeypatch):
+    app.config["PROPAGATE_EXCEPTIONS"] = False
+
+    def broken(*a, **kw):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(room_images, "images_for", broken)
+    assert client.get("/api/rooms/published").status_code == 500
+    monkeypatch.undo()
+
+    rv = client.get("/api/rooms/published")
+    assert rv.status_code == 200 and len(rv.get_json()) == 1
@@ -0,0 +1,127 @@
+# Proyecciones de rooms (room_cards, room_search, room_geo): se llenan en migración/CLI y al escribir; las lecturas no hacen DDL
+import contextlib
+
+import pytest
+from sqlalchemy import event
+
+import room_cards, room_geo, room_images, room_search
+from extensions import db
+from models_rooms import Room, RoomCard, RoomGeo
+
+
+@pytest.fixture
+def rooms(app):
+    with app.app_context():
+        a = Room(code="ROOM-1", ciudad="Sevilla", provincia="Sevilla", precio=400, m2=12, published=True)
+        b = Room(code="ROOM-2", ciudad="Cádiz", provincia="Cádiz", precio=350, m2=10, published=True)
+        db.session.add_all([a, b])
+        db.session.flush()
+        room_images.add(a, [room_images.row("gallery", {"url": f"/u/{i}.jpg", "thumb": f"/u/{i}_t.jpg", "w": 800})
+                            for i in range(3)])
+        db.session.commit()
+        return a.id, b.id
+
+
+@contextlib.contextmanager
+def statements(app):
+    seen = []
+
+    def _log(conn, cursor, statement, *a):
+        seen.append(statement.lstrip().split(None, 1)[0].upper())
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _log)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, "before_cursor_execute", _log)
+
+
+def test_fill_builds_one_card_per_room(app, rooms):
+    a, b = rooms
+    with app.app_context():
+        assert room_cards.fill(db.session.connection()) == 2
+        db.session.commit()
+        card = db.session.get(RoomCard, a)
+        assert (card.photo_count, card.cover_url, card.cover_thumb) == (3, "/u/0.jpg", "/u/0_t.jpg")
+        assert db.session.get(RoomCard, b).photo_count == 0
+
+
+def test_sync_updates_the_card_in_the_same_transaction(app, rooms):
+    a, _ = rooms
+    with app.app_context():
+        room = db.session.get(Room, a)
+        room.precio = 420
+        room_images.add(room, [room_images.row("gallery", {"url": "/u/3.jpg"})])
+        room_cards.sync(room)
+        db.session.commit()
+        card = db.session.get(RoomCard, a)
+        assert (card.precio, card.photo_count, card.cover_url) == (420, 4, "/u/0.jpg")
+
+
+def test_sync_does_not_rewrite_the_room(app, rooms):
+    # una subida de fotos no toca rooms: sin UPDATE no se disparan los hooks de búsqueda y geo
+    a, _ = rooms
+    with app.app_context():
+        room = db.session.get(Room, a)
+        room.images_json = {"meta": {"barrio": "Triana"}}
+        db.session.commit()
+        seen = []
+        listener = lambda conn, cursor, statement, *args: seen.append(statement)   # noqa: E731
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            room_images.add(room, [room_images.row("gallery", {"url": "/u/3.jpg"})])
+            room_cards.sync(room)
+            db.session.commit()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+    assert not [s for s in seen if s.lstrip().upper().startswith("UPDATE ROOMS")]
+    assert any(s.lstrip().upper().startswith("INSERT INTO ROOM_CARDS") for s in seen)
+
+
+def test_reads_do_not_create_or_rebuild(app, client, rooms):
+    # sin tarjetas (BD sin migrar): las lecturas no regeneran nada ni hacen DDL
+    with statements(app) as seen:
+        assert client.get("/api/rooms/published?view=cards").get_json() == []
+        assert client.get("/api/rooms/catalog").get_json()["results"] == []
+    assert not {"CREATE", "ALTER", "DELETE", "INSERT", "DROP"} & set(seen)
+    with app.app_context():
+        assert db.session.query(RoomCard).count() == 0
+
+
+def test_search_index_is_kept_by_writes_and_read_without_ddl(app, client, rooms):
+    with app.app_context():
+        assert room_search.rebuild() == 2   # migración 0006 / --rebuild
+        db.session.add(Room(code="ROOM-3", ciudad="Sevilla", notas="Habitación con baño privado", published=True))
+        db.session.commit()                 # el hook de Room la indexa
+        room_cards.rebuild()
+    with statements(app) as seen:
+        rv = client.get("/api/rooms/search?q=baños privados")
+    assert [r["code"] for r in rv.get_json()["results"]] == ["ROOM-3"]
+    assert not {"CREATE", "ALTER", "DELETE", "INSERT", "DROP"} & set(seen)
+
+
+def test_geo_rows_come_from_fill_and_writes_and_near_reads_only(app, client, rooms):
+    a, b = rooms
+    with app.app_context():
+        assert room_geo.fill(db.session.connection()) == 2   # migración 0007 / --rebuild
+        db.session.commit()
+        db.session.get(Room, a).images_json = {"meta": {"lat": 37.3891, "lon": -5.9845}}
+        db.session.commit()                                   # el hook de Room la reescribe
+        assert db.session.get(RoomGeo, a).source == "sheet"
+        assert db.session.get(RoomGeo, b).source == "none"
+        room_cards.rebuild()
+    with statements(app) as seen:
+        rv = client.get("/api/rooms/near?lat=37.39&lon=-5.98&radius_km=2")
+    assert [r["code"] for r in rv.get_json()["results"]] == ["ROOM-1"]
+    assert not {"CREATE", "ALTER", "DELETE", "INSERT", "DROP"} & set(seen)
+
+
+def test_catalog_range_filters_read_room_cards(app, client, rooms):
+    with app.app_context():
+        room_cards.rebuild()
+    with statements(app) as seen:
+        rv = client.get("/api/rooms/catalog?precio_min=380&m2_max=12&fields=code,precio,photos")
+    assert rv.get_json()["results"] == [{"code": "ROOM-1", "precio": 400, "photos": 3}]
+    assert not {"CREATE", "ALTER", "DELETE", "INSERT", "DROP"} & set(seen)
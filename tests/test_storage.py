@@ -0,0 +1,52 @@
+# storage: S3 en cuanto hay bucket, y una subida fallida a S3 no acaba en disco local
+import io
+import os
+
+import storage
+
+
+def test_bucket_without_explicit_keys_uses_s3(monkeypatch):
+    monkeypatch.delenv("STORAGE_BACKEND", raising=False)
+    monkeypatch.delenv("AWS_ACCESS_KEY_ID", raising=False)
+    monkeypatch.delenv("AWS_SECRET_ACCESS_KEY", raising=False)
+    monkeypatch.setenv("S3_BUCKET", "spainroom-docs")   # credenciales: cadena por defecto de boto3
+    assert storage.mode() == "s3"
+    monkeypatch.delenv("S3_BUCKET")
+    assert storage.mode() == "local"
+
+
+def test_s3_failure_is_an_error_not_a_local_copy(app, client, monkeypatch, tmp_path):
+    monkeypatch.delenv("STORAGE_BACKEND", raising=False)
+    monkeypatch.setenv("S3_BUCKET", "spainroom-docs")
+    monkeypatch.setenv("STORAGE_LOCAL_DIR", str(tmp_path / "storage"))
+
+    def down(self, fileobj, key, content_type):
+        raise ConnectionError("s3 caído")
+
+    monkeypatch.setattr(storage.S3Backend, "put", down)
+    rv = client.post("/api/owner/cedula/upload", data={"file": (io.BytesIO(b"%PDF-1.4"), "dni.pdf")},
+                     content_type="multipart/form-data")
+    assert rv.status_code == 502 and rv.get_json()["error"] == "storage_unavailable"
+    assert not os.path.exists(tmp_path / "storage")
+
+
+def test_local_urls_need_a_real_secret(app, client, monkeypatch, tmp_path):
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("STORAGE_LOCAL_DIR", str(tmp_path / "storage"))
+    monkeypatch.delenv("STORAGE_URL_SECRET", raising=False)
+    monkeypatch.setenv("JWT_SECRET", "sr-dev-secret")   # la de por defecto del repo no cuenta
+    app.secret_key = None
+
+    def upload():
+        return client.post("/api/owner/cedula/upload", data={"file": (io.BytesIO(b"%PDF-1.4"), "dni.pdf")},
+                           content_type="multipart/form-data")
+
+    rv = upload()
+    assert rv.status_code == 503 and rv.get_json()["error"] == "url_secret_not_configured"
+    assert not os.path.exists(tmp_path / "storage")
+
+    monkeypatch.setenv("STORAGE_URL_SECRET", "s3cr3t")
+    url = upload().get_json()["presigned_url"]
+    assert client.get(url).data == b"%PDF-1.4"
+    monkeypatch.delenv("STORAGE_URL_SECRET")
+    assert client.get(url).status_code == 403   # ni se sirve con la clave pública
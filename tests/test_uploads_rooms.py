@@ -0,0 +1,41 @@
+# upload_photos (autofit): los originales van a blob_store por bloques, sin leer la subida entera
+import io
+
+import pytest
+from PIL import Image
+
+from extensions import db
+from models_contracts import Contract, ContractItem
+from models_rooms import Room
+import routes_uploads_rooms_autofit as autofit
+
+
+def _jpeg(color):
+    bio = io.BytesIO()
+    Image.new("RGB", (800, 500), color).save(bio, "JPEG")
+    return bio.getvalue()
+
+
+def test_autofit_sync_upload_streams_originals(app, monkeypatch):
+    with app.app_context():
+        room = Room(code="ROOM-00001", direccion="Calle 1", ciudad="Sevilla", provincia="Sevilla")
+        c = Contract(ref="SR-00001", status="signed")
+        db.session.add_all([room, c])
+        db.session.flush()
+        db.session.add(ContractItem(contract_id=c.id, sub_ref="SR-00001-01", room_id=room.id, status="ready"))
+        db.session.commit()
+
+    data = {"sub_ref": "SR-00001-01",
+            "files[]": [(io.BytesIO(_jpeg("red")), "a.jpg"), (io.BytesIO(_jpeg("blue")), "b.jpg"),
+                        (io.BytesIO(b"x"), "c.txt")]}
+    with app.test_request_context("/api/rooms/upload_photos", method="POST", data=data,
+                                  content_type="multipart/form-data") as ctx:
+        for fs in ctx.request.files.getlist("files[]"):
+            monkeypatch.setattr(fs, "read", lambda *a: pytest.fail("fs.read() de la subida entera"))
+        resp = autofit.upload_room_photos_autofit()
+    body = resp.get_json()
+    assert body["ok"] is True
+    assert body["uploaded"][2] == "ERR:bad_image_type"
+    assert all(u.endswith(".jpg") for u in body["uploaded"][:2])
+    assert body["room"]["published"] is True
+    assert [(g["w"], g["h"]) for g in body["room"]["images"]["gallery"]] == [(666, 500), (666, 500)]   # recorte 4:3
@@ -0,0 +1,71 @@
+# upload_ingest.py — Subidas en streaming con memoria acotada
+#
+# Antes cada subida hacía fs.read(): el fichero entero (hasta MAX_CONTENT_LENGTH = 20 MB)
+# en RAM para calcular el hash y escribirlo; diez subidas a la vez bastaban para tumbar
+# una instancia de 512 MB. Ahora:
+#
+# - init_upload_ingest(app) instala una Request cuyo parser multipart vuelca cada fichero
+#   a un SpooledTemporaryFile: en memoria hasta UPLOAD_SPOOL_MEMORY, en disco a partir de ahí.
+# - copy_hashed(src, dir) copia el fichero por bloques de UPLOAD_CHUNK_BYTES a un temporal
+#   en `dir`, calculando el sha256 mientras copia; quien llama lo renombra a su sitio
+#   (os.replace, atómico en el mismo sistema de ficheros). blob_store.put_stream lo usa.
+#
+# La memoria por subida queda en un bloque, sea el fichero de 100 KB o de 20 MB.
+#
+# Variables de entorno:
+#   UPLOAD_SPOOL_MEMORY   bytes por fichero que se quedan en memoria antes de pasar a disco (256 KB)
+#   UPLOAD_SPOOL_DIR      carpeta de los temporales del parser (por defecto la del sistema)
+#   UPLOAD_CHUNK_BYTES    tamaño de bloque al copiar/hashear (por defecto 1 MB)
+
+import os, hashlib, tempfile
+from typing import BinaryIO, Optional, Tuple
+
+from flask import Request
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or str(default)).strip())
+    except Exception:
+        return default
+
+def chunk_size() -> int:
+    return max(64 * 1024, _int("UPLOAD_CHUNK_BYTES", 1 << 20))
+
+class SpoolingRequest(Request):
+    """Request de Flask con los ficheros multipart a disco a partir de UPLOAD_SPOOL_MEMORY."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=max(0, _int("UPLOAD_SPOOL_MEMORY", 256 * 1024)),
+                                             mode="rb+", dir=os.getenv("UPLOAD_SPOOL_DIR") or None)
+
+def init_upload_ingest(app):
+    app.request_class = SpoolingRequest
+
+def copy_hashed(src: BinaryIO, dir_path: str, suffix: str = ".part") -> Tuple[Optional[str], str, int]:
+    """
+    Copia src (desde el principio si se puede) a un temporal en dir_path, por bloques.
+    Devuelve (ruta del temporal | None si src está vacío, sha256 hex, bytes).
+    """
+    os.makedirs(dir_path, exist_ok=True)
+    try:
+        src.seek(0)
+    except Exception:
+        pass   # stream no rebobinable: se copia desde donde esté
+    fd, tmp = tempfile.mkstemp(dir=dir_path, suffix=suffix)
+    h, size, n = hashlib.sha256(), 0, chunk_size()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(n)
+                if not chunk:
+                    break
+                h.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    if size == 0:
+        os.unlink(tmp)
+        return None, h.hexdigest(), 0
+    return tmp, h.hexdigest(), size
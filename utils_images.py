@@ -1,5 +1,7 @@
-import os, uuid
-from PIL import Image, ImageOps
+import os
+from image_engine import probe, fit_size
+import blob_store
+import image_variants
 
 SIZES = {
     "thumb":  (320, 240),   # miniatura (4:3)
@@ -11,46 +13,29 @@ SIZES = {
 def _ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
-def _save(img: Image.Image, path: str, fmt="JPEG", quality=82):
-    if fmt.upper() in ("JPG", "JPEG"):
-        img.save(path, format="JPEG", quality=quality, optimize=True, progressive=True)
-    elif fmt.upper() == "WEBP":
-        img.save(path, format="WEBP", quality=quality, method=6)
-    else:
-        img.save(path)
-
-def _center_crop(img: Image.Image, target_w: int, target_h: int) -> Image.Image:
-    src_w, src_h = img.size
-    target_ratio = target_w / target_h
-    src_ratio = src_w / src_h
-    if src_ratio > target_ratio:
-        new_w = int(src_h * target_ratio)
-        x1 = (src_w - new_w) // 2
-        box = (x1, 0, x1 + new_w, src_h)
-    else:
-        new_h = int(src_w / target_ratio)
-        y1 = (src_h - new_h) // 2
-        box = (0, y1, src_w, y1 + new_h)
-    return img.crop(box).resize((target_w, target_h), Image.LANCZOS)
+def _ratio(w: int, h: int) -> str:
+    from math import gcd
+    g = gcd(w, h)
+    return f"{w // g}:{h // g}"
 
 def process_photo(file_storage, room_id: int, upload_root="uploads"):
-    base_id = uuid.uuid4().hex
-    out_dir = os.path.join(upload_root, "rooms", str(room_id))
-    _ensure_dir(out_dir)
-
-    img = Image.open(file_storage.stream)
-    img = ImageOps.exif_transpose(img).convert("RGB")
+    """
+    Guarda el original (blob_store, por bloques) tras validarlo con una decodificación y
+    devuelve las URLs de cada tamaño de SIZES en jpg y webp: /img/<sha>, generadas al
+    pedirlas (image_variants). Quien llama registra la referencia (Upload + blob_store.link).
+    """
+    src = probe(file_storage)
+    blob = blob_store.put_stream(file_storage.stream, os.path.splitext(file_storage.filename or "")[1] or ".jpg",
+                                 file_storage.mimetype)
+    sha = blob["blob"]
 
     outputs = {}
     for key, (w, h) in SIZES.items():
-        cropped = _center_crop(img, w, h)
-        jpg_path = os.path.join(out_dir, f"{base_id}_{key}.jpg")
-        webp_path = os.path.join(out_dir, f"{base_id}_{key}.webp")
-        _save(cropped, jpg_path, "JPEG", 82)
-        _save(cropped, webp_path, "WEBP", 80)
+        r = _ratio(w, h)
+        vw, vh = fit_size(src["src_w"], src["src_h"], w, w / float(h))
         outputs[key] = {
-            "jpg": f"/{jpg_path.replace(os.sep,'/')}",
-            "webp": f"/{webp_path.replace(os.sep,'/')}",
-            "w": w, "h": h
+            "jpg": image_variants.url(sha, w, r, "jpeg"),
+            "webp": image_variants.url(sha, w, r, "webp"),
+            "w": vw, "h": vh
         }
-    return {"id": base_id, "variants": outputs}
+    return {"id": sha[:16], "blob": sha, "variants": outputs}